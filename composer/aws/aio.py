@@ -0,0 +1,178 @@
+"""S3 retrieval on an asyncio event loop, so that hundreds of e-file downloads can be in flight from a single thread
+rather than one per worker thread. The loop runs in a background thread owned by the bucket. AsyncBucket can be used
+anywhere a Bucket can; its bulk methods (fetch_many and download_many) are where the concurrency pays off.
+
+Requires aiobotocore (the "async" extra) unless a client is supplied directly, as in the tests."""
+import asyncio
+import threading
+from typing import IO, Any, Awaitable, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+try:
+    from aiobotocore.config import AioConfig
+    from aiobotocore.session import get_session
+except ImportError:
+    get_session = None
+
+from botocore.exceptions import ClientError
+
+from composer.aws.handshake import Handshake
+from composer.aws.s3 import Bucket
+from composer.scheduler import AdaptiveLimit, Deadlines, TaskScheduler
+from composer.conf import ASYNC_MAX_IN_FLIGHT
+
+class _SyncBody:
+    def __init__(self, body, loop: asyncio.AbstractEventLoop):
+        self._body = body
+        self._loop: asyncio.AbstractEventLoop = loop
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        data: bytes = asyncio.run_coroutine_threadsafe(self._body.read(amt), self._loop).result()
+        if amt is None or not data:
+            self._body.close()
+        return data
+
+    def iter_chunks(self, chunk_size: int = 1024) -> Iterator[bytes]:
+        while True:
+            chunk: bytes = self.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+class _SyncClient:
+    """Presents an asynchronous S3 client as a synchronous one, for the requests Bucket makes. Each request runs on the
+    event loop while the calling thread waits, so these must never be called from the loop's own thread."""
+    def __init__(self, client, loop: asyncio.AbstractEventLoop):
+        self._client = client
+        self._loop: asyncio.AbstractEventLoop = loop
+
+    def head_object(self, **kwargs) -> Dict:
+        return asyncio.run_coroutine_threadsafe(self._client.head_object(**kwargs), self._loop).result()
+
+    def get_object(self, **kwargs) -> Dict:
+        obj: Dict = asyncio.run_coroutine_threadsafe(self._client.get_object(**kwargs), self._loop).result()
+        return dict(obj, Body=_SyncBody(obj["Body"], self._loop))
+
+class AsyncBucket(Bucket):
+    """Bucket whose requests run on its own event loop.
+
+    :param client_context: Async context manager yielding an aiobotocore-style S3 client, such as the result of
+    AioSession.create_client. It is entered on the bucket's loop, and exited by close().
+    :param max_in_flight: Most requests that fetch_many and download_many keep in flight at once. Within that, the
+    number is adjusted by the bucket's scheduler.
+    """
+    def __init__(self, client_context, name: str, max_in_flight: int = ASYNC_MAX_IN_FLIGHT, **kwargs):
+        self.loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+        self._thread: threading.Thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+        self._client_context = client_context
+        self.client = self._run(client_context.__aenter__())
+        self.max_in_flight: int = max_in_flight
+        self.scheduler: TaskScheduler = TaskScheduler(AdaptiveLimit(maximum=max_in_flight))
+        # Destination -> future resolved once the attempt writing it has closed it. Only touched from the loop.
+        self._writing: Dict[str, asyncio.Future] = {}
+        super().__init__(_SyncClient(self.client, self.loop), name, **kwargs)
+
+    def _run(self, coroutine: Awaitable) -> Any:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def _get(self, key: str) -> Dict:
+        try:
+            return await self.client.get_object(Bucket=self.name, Key=key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                raise FileNotFoundError(key)
+            raise e
+
+    async def _read(self, key: str) -> bytes:
+        obj: Dict = await self._get(key)
+        async with obj["Body"] as stream:
+            return await stream.read()
+
+    async def _in_thread(self, fn: Callable, *args) -> Any:
+        """Runs fn(*args) on the loop's default executor. If the caller is cancelled meanwhile, fn is still waited for
+        before the cancellation is passed on, so that nothing it was using is touched once the caller has finished."""
+        future: asyncio.Future = self.loop.run_in_executor(None, fn, *args)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            await asyncio.wait([future])
+            raise
+
+    async def _download(self, key: str, destination: str, opener: Callable[[str, str], IO], chunk_size: int):
+        # An earlier attempt, abandoned at its deadline, may still be closing the file
+        earlier: Optional[asyncio.Future] = self._writing.get(destination)
+        if earlier is not None:
+            await asyncio.shield(earlier)
+        closed: asyncio.Future = self.loop.create_future()
+        self._writing[destination] = closed
+        try:
+            await self._write(key, destination, opener, chunk_size)
+        finally:
+            closed.set_result(None)
+            if self._writing.get(destination) is closed:
+                del self._writing[destination]
+
+    async def _write(self, key: str, destination: str, opener: Callable[[str, str], IO], chunk_size: int):
+        # Writing chunk by chunk keeps each body from being held in memory whole. Opening a file is quick, but writes
+        # (which may mean compressing) and closing happen off the loop, so as not to hold up other requests.
+        obj: Dict = await self._get(key)
+        async with obj["Body"] as stream:
+            fh: IO = opener(destination, "wb")
+            try:
+                while True:
+                    chunk: bytes = await stream.read(chunk_size)
+                    if not chunk:
+                        return
+                    await self._in_thread(fh.write, chunk)
+            finally:
+                await self._in_thread(fh.close)
+
+    def _map_bounded(self, fn: Callable[..., Awaitable], calls: Iterable[Tuple],
+                     deadlines: Optional[Deadlines]) -> Iterator[Tuple[Any, Any]]:
+        """Runs fn(*args) on the loop for each (tag, *args) in `calls`, as many at once as the scheduler allows. Yields
+        (tag, result) in order of completion."""
+        def submit(call: Tuple):
+            return asyncio.run_coroutine_threadsafe(fn(*call[1:]), self.loop)
+
+        for call, result in self.scheduler.run(submit, calls, deadlines):
+            yield call[0], result
+
+    def fetch_many(self, keys: Iterable[Tuple[Any, str]],
+                   deadlines: Optional[Deadlines] = None) -> Iterator[Tuple[Any, bytes]]:
+        """Downloads many objects into memory concurrently.
+
+        :param keys: Iterable of (tag, S3 key). The tag identifies the object to the caller.
+        :param deadlines: Time allowed for each object, and for all of them.
+        :return: Iterator of (tag, body), in order of completion.
+        """
+        return self._map_bounded(self._read, keys, deadlines)
+
+    def download_many(self, targets: Iterable[Tuple[str, str]], opener: Callable[[str, str], IO] = open,
+                      chunk_size: int = 1048576, deadlines: Optional[Deadlines] = None) -> int:
+        """Downloads many objects to local files concurrently. An attempt that overruns its deadline is cancelled
+        before the object is requested again, so no two attempts ever write the same file at once.
+
+        :param targets: Iterable of (S3 key, destination path).
+        :param opener: Opens a destination path for writing in the given mode, as the built-in open does.
+        :param deadlines: Time allowed for each object, and for all of them.
+        :return: The number of objects downloaded.
+        """
+        calls: Iterator[Tuple] = ((key, key, destination, opener, chunk_size) for key, destination in targets)
+        return sum(1 for _ in self._map_bounded(self._download, calls, deadlines))
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        self._run(self._client_context.__aexit__(None, None, None))
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+class AuthenticatedAsyncBucket(AsyncBucket):
+    def __init__(self, handshake: Handshake, bucket_name: str):
+        if get_session is None:
+            raise ImportError("Asynchronous S3 retrieval requires aiobotocore (the \"async\" extra)")
+        config: AioConfig = AioConfig(max_pool_connections=ASYNC_MAX_IN_FLIGHT)
+        client_context = get_session().create_client('s3', aws_access_key_id=handshake.get_aws_key(),
+                                                      aws_secret_access_key=handshake.get_aws_secret(), config=config)
+        super().__init__(client_context, bucket_name)
@@ -1,7 +1,13 @@
+from composer.aws.aio import AuthenticatedAsyncBucket
 from composer.aws.handshake import Handshake
 from composer.aws.s3 import AuthenticatedBucket
 
 class EfileBucket(AuthenticatedBucket):
     def __init__(self):
         handshake: Handshake = Handshake.build()
-        super().__init__(handshake, "irs-form-990")
\ No newline at end of file
+        super().__init__(handshake, "irs-form-990")
+
+class EfileAsyncBucket(AuthenticatedAsyncBucket):
+    def __init__(self):
+        handshake: Handshake = Handshake.build()
+        super().__init__(handshake, "irs-form-990")
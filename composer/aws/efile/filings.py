@@ -1,16 +1,25 @@
-import json
 import logging
 import os
 import random
 import shutil
 import string
-from concurrent.futures import as_completed
+import uuid
+from collections import deque
+from concurrent.futures import Future
 from concurrent.futures.thread import ThreadPoolExecutor
-from typing import Iterator
+from typing import Any, Callable, Deque, Iterator, List, Optional
 from functools import lru_cache
+from composer.aws.aio import AsyncBucket
+from composer.aws.efile.xmlcache import XmlCache
 from composer.aws.s3 import Bucket, Tuple, Dict, Iterable
+from composer.scheduler import Deadlines, TaskScheduler
+from composer.efile.structures.journal import DOWNLOADED, TRANSLATED, RunJournal
 from composer.efile.structures.metadata import FilingMetadata
+from composer.efile.translate_pool import TranslationPool
+from composer.efile.translations import TranslationCache
 from composer.efile.xmlio import JsonTranslator
+from composer.fileio.compression import compressed_path, open_path
+from composer.fileio.serialize import JsonSerializer
 from composer.conf import (CACHE_SIZE, MAX_WORKERS, DOWNLOAD_TIMEOUT,
                            PUBLIC_XML_NAME, JSON_FILENAME, UPDATE_TIMEOUT)
 
@@ -30,6 +39,9 @@ def _get_download_targets(changes: Iterable[Tuple[str, Dict[str, FilingMetadata]
             irs_efile_id: str = filing_md.irs_efile_id
             yield ein_path, irs_efile_id
 
+def _efile_id(s3_key: str) -> str:
+    return s3_key[:-len(PUBLIC_XML_NAME.format(""))]
+
 
 # TODO Add lots of timing to this once it's working
 
@@ -43,80 +55,195 @@ def _tmpdir(tmp_base) -> str:
 
 class RetrieveEfiles:
     """Download any new e-files as XML from S3 and store them in a temporary directory. Convert them to JSON files, also
-    stored in a temporary directory. Yield a map of EIN -> (map of period -> JSON file path)."""
+    stored in a temporary directory. Yield a map of EIN -> (map of period -> JSON file path).
+
+    In memory mode, nothing is written to disk: the downloaded XML goes straight to the translator, and the translated
+    content goes straight to the composite (see fetch_all, fetch_one and translate_one).
+
+    If a translation pool is supplied, XML is translated in its worker processes rather than in the calling thread.
+
+    Downloads are run by a TaskScheduler, which adapts the number in flight to how the bucket is responding and
+    retries any that fail transiently. If the bucket is an AsyncBucket, they are all issued from its event loop, using
+    the bucket's own scheduler; otherwise each is made from a thread.
 
-    def __init__(self, bucket: Bucket, tmp_base: str = "/tmp", no_cleanup: bool=False):
+    If an XmlCache is supplied, e-files found in it are read from local disk rather than S3, and those downloaded are
+    added to it. Likewise, if a TranslationCache is supplied, e-files already translated by the current translator are
+    neither downloaded nor translated again, and new translations are added to it."""
+
+    def __init__(self, bucket: Bucket, tmp_base: str = "/tmp", no_cleanup: bool=False, in_memory: bool=False,
+                 translate_pool: Optional[TranslationPool] = None, translator: str = "xmljson",
+                 serializer: Optional[JsonSerializer] = None, compression: Optional[str] = None,
+                 scheduler: Optional[TaskScheduler] = None, xml_cache: Optional[XmlCache] = None,
+                 translation_cache: Optional[TranslationCache] = None):
         self.bucket: Bucket = bucket
-        self.translate = JsonTranslator()
-        self.xml_cache_dir: str = _tmpdir(tmp_base)     # Official temp directory package makes things too hard
-        self.json_cache_dir: str = _tmpdir(tmp_base)
+        self.scheduler: TaskScheduler = bucket.scheduler if isinstance(bucket, AsyncBucket) \
+            else scheduler or TaskScheduler()
+        self.compression: Optional[str] = compression
+        self.xml_cache: Optional[XmlCache] = xml_cache
+        self.translation_cache: Optional[TranslationCache] = translation_cache
+        self.journal: Optional[RunJournal] = None
+        self.translate = JsonTranslator(translator)
+        self.serializer: JsonSerializer = serializer or JsonSerializer()
+        self.translate_pool: Optional[TranslationPool] = translate_pool
+        self.in_memory: bool = in_memory
+        self.xml_cache_dir: Optional[str] = None
+        self.json_cache_dir: Optional[str] = None
+        if not in_memory:
+            self.xml_cache_dir = _tmpdir(tmp_base)     # Official temp directory package makes things too hard
+            self.json_cache_dir = _tmpdir(tmp_base)
         self.no_cleanup: bool = no_cleanup
 
+    def _temp_path(self, directory: str, ein: str, template: str, irs_efile_id: str) -> str:
+        return compressed_path(os.path.join(_ein_path(directory, ein), template.format(irs_efile_id)), self.compression)
+
+    def _json_paths(self, ein: str, updates: Dict[str, FilingMetadata]) -> Dict[str, str]:
+        json_paths: Dict[str, str] = {}
+        for period, filing_md in updates.items():
+            irs_efile_id: str = filing_md.irs_efile_id
+            json_paths[period] = self._temp_path(self.json_cache_dir, ein, JSON_FILENAME, irs_efile_id)
+        return json_paths
+
     def _get_json_tuples(self, changes: Iterable[Tuple[str, Dict[str, FilingMetadata]]]) \
             -> Iterator[Tuple[str, Dict[str, str]]]:
         for ein, updates in changes:
-            ein_path = _ein_path(self.json_cache_dir, ein)
-            json_paths: Dict[str, str] = {}
-            for period, filing_md in updates.items():
-                irs_efile_id: str = filing_md.irs_efile_id
-                json_paths[period] = os.path.join(ein_path, JSON_FILENAME.format(irs_efile_id))
-            yield ein, json_paths
+            yield ein, self._json_paths(ein, updates)
+
+    def _mark(self, stage: int, ein: str, periods: Iterable[str]):
+        if self.journal is not None:
+            self.journal.mark(stage, ein, periods)
+
+    def _mark_all(self, stage: int, changes: Iterable[Tuple[str, Dict[str, FilingMetadata]]]):
+        for ein, updates in changes:
+            self._mark(stage, ein, updates.keys())
+
+    def _is_translated(self, irs_efile_id: str) -> bool:
+        return self.translation_cache is not None and irs_efile_id in self.translation_cache
+
+    def _untranslated(self, ein: str, updates: Dict[str, FilingMetadata]) -> Iterator[str]:
+        """IDs of an EIN's e-files that need translating. Those already translated have their JSON files written from
+        the translation cache instead."""
+        for filing_md in updates.values():
+            irs_efile_id: str = filing_md.irs_efile_id
+            serialized: Optional[bytes] = None
+            if self.translation_cache is not None:
+                serialized = self.translation_cache.get_serialized(irs_efile_id)
+            if serialized is None:
+                yield irs_efile_id
+                continue
+            with open_path(self._temp_path(self.json_cache_dir, ein, JSON_FILENAME, irs_efile_id), "wb") as fh:
+                fh.write(serialized)
+
+    def _translate_files(self, ein: str, irs_efile_ids: Iterable[str]):
+        """Translates the given e-files of an EIN in the translation pool, then adds them to the translation cache."""
+        translated: List[str] = []
+
+        def targets() -> Iterator[Tuple[str, str]]:
+            for irs_efile_id in irs_efile_ids:
+                translated.append(irs_efile_id)
+                xml_path: str = self._temp_path(self.xml_cache_dir, ein, PUBLIC_XML_NAME, irs_efile_id)
+                json_path: str = self._temp_path(self.json_cache_dir, ein, JSON_FILENAME, irs_efile_id)
+                yield xml_path, json_path
+
+        self.translate_pool.translate_files(targets())
+        if self.translation_cache is None:
+            return
+        for irs_efile_id in translated:
+            with open_path(self._temp_path(self.json_cache_dir, ein, JSON_FILENAME, irs_efile_id), "rb") as fh:
+                self.translation_cache.put_serialized(irs_efile_id, fh.read())
 
     def _convert_all(self, changes: Iterable[Tuple[str, Dict[str, FilingMetadata]]]):
         """Convert all XML files into JSON files. CPU-bound, so process pool."""
         logging.info("Converting XML to JSON.")
 
-        exceptions = list()
-        futures = list()
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        if self.translate_pool is not None:
             for ein, updates in changes:
-                for filing_md in updates.values():
-                    irs_efile_id: str = filing_md.irs_efile_id
-                    futures.append(executor.submit(self._xml_to_json, ein, irs_efile_id))
+                self._translate_files(ein, self._untranslated(ein, updates))
+            self._mark_all(TRANSLATED, changes)
+            return
 
-            for future in as_completed(futures, timeout=UPDATE_TIMEOUT):
-                if future.exception() is not None:
-                    exceptions.append(future.exception())
-        if exceptions:
-            raise exceptions.pop()
+        targets: Iterator[Tuple[str, str]] = ((ein, irs_efile_id) for ein, updates in changes
+                                              for irs_efile_id in self._untranslated(ein, updates))
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            submit: Callable[[Tuple[str, str]], Future] = lambda target: executor.submit(self._xml_to_json, *target)
+            for _ in TaskScheduler.fixed(MAX_WORKERS).run(submit, targets, Deadlines(task=UPDATE_TIMEOUT)):
+                pass
+        self._mark_all(TRANSLATED, changes)
 
 
     def _xml_to_json(self, ein: str, irs_efile_id: str) -> None:
-        xml_path: str = os.path.join(_ein_path(self.xml_cache_dir, ein), PUBLIC_XML_NAME.format(irs_efile_id))
-        json_path: str = os.path.join(_ein_path(self.json_cache_dir, ein), JSON_FILENAME.format(irs_efile_id))
-        with open(xml_path) as xml_fh, open(json_path, "w") as json_fh:
-            raw_xml: str = xml_fh.read()
+        xml_path: str = self._temp_path(self.xml_cache_dir, ein, PUBLIC_XML_NAME, irs_efile_id)
+        json_path: str = self._temp_path(self.json_cache_dir, ein, JSON_FILENAME, irs_efile_id)
+        with open_path(xml_path, "rb") as xml_fh, open_path(json_path, "wb") as json_fh:
+            raw_xml: bytes = xml_fh.read()
             as_json: Dict = self.translate(raw_xml)
-            json.dump(as_json, json_fh)
+            serialized: bytes = self.serializer.dumps(as_json)
+            json_fh.write(serialized)
+        if self.translation_cache is not None:
+            self.translation_cache.put_serialized(irs_efile_id, serialized)
+
+    @property
+    def is_async(self) -> bool:
+        return isinstance(self.bucket, AsyncBucket)
 
-    def _download_xml(self, target: Tuple[str, str]):
+    def _xml_destination(self, target: Tuple[str, str]) -> Tuple[str, str]:
+        """S3 key and local path of an e-file's XML."""
         ein_path, irs_efile_id = target  # types: str, str
         s3_key: str = PUBLIC_XML_NAME.format(irs_efile_id)
-        destination: str = os.path.join(ein_path, s3_key)
-        with open(destination, "w") as fh:
-            raw_xml: str = self.bucket.get_obj_body(s3_key)
-            fh.write(raw_xml)
+        return s3_key, compressed_path(os.path.join(ein_path, s3_key), self.compression)
+
+    def _download_xml(self, target: Tuple[str, str]) -> int:
+        s3_key, destination = self._xml_destination(target)
+
+        # Written under a unique name and moved into place, since an attempt abandoned for running too long may still
+        # be writing when its retry does. The prefix leaves the codec's suffix in place.
+        directory, filename = os.path.split(destination)
+        partial: str = os.path.join(directory, ".%s.%s" % (uuid.uuid4().hex, filename))
+        if self.xml_cache is not None and self.xml_cache.copy_to(_efile_id(s3_key), partial):
+            os.replace(partial, destination)
+            return 0
+        with open_path(partial, "wb") as fh:
+            written: int = self.bucket.download_to(s3_key, fh)
+        os.replace(partial, destination)
+        if self.xml_cache is not None:
+            self.xml_cache.put_file(_efile_id(s3_key), destination)
+        return written
+
+    def _uncached(self, targets: Iterable[Tuple[str, str]], downloads: List[Tuple[str, str]]) \
+            -> Iterator[Tuple[str, str]]:
+        """Copies into place any targets found in the XML cache, and yields (S3 key, destination) for the rest, which
+        are also noted in `downloads`."""
+        for target in targets:
+            s3_key, destination = self._xml_destination(target)
+            if self.xml_cache is not None and self.xml_cache.copy_to(_efile_id(s3_key), destination):
+                continue
+            downloads.append((s3_key, destination))
+            yield s3_key, destination
 
     def _download_all(self, changes: Iterable[Tuple[str, Dict[str, FilingMetadata]]]):
-        """Download all XML files to local storage. I/O-bound, so thread pool."""
+        """Download all XML files to local storage. I/O-bound, so thread pool (or event loop)."""
         logging.info("Downloading new XML files.")
-        
-        # NOTE: 1) consider using timeout when downloading files
-        # from docs concurrent.futures: 
-        # "If timeout is not specified or None, there is no limit to the wait time.""
-
-        exceptions  = list()
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            targets: Iterator[Tuple[str, str]] = _get_download_targets(changes, self.xml_cache_dir)
-            futures = [executor.submit(self._download_xml, target) for target in targets]
+        targets: Iterator[Tuple[str, str]] = (target for target in _get_download_targets(changes, self.xml_cache_dir)
+                                              if not self._is_translated(target[1]))
 
-            # NOTE: if timeout is exeeded, TimeoutError exception will raise
-            for future in as_completed(futures, timeout=DOWNLOAD_TIMEOUT):
-                if future.exception() is not None:
-                    exceptions.append(future.exception())
+        deadlines: Deadlines = Deadlines(task=DOWNLOAD_TIMEOUT)
+        if self.is_async:
+            downloads: List[Tuple[str, str]] = []
+            self.bucket.download_many(self._uncached(targets, downloads), open_path, deadlines=deadlines)
+            if self.xml_cache is not None:
+                for s3_key, destination in downloads:
+                    self.xml_cache.put_file(_efile_id(s3_key), destination)
+            self._mark_all(DOWNLOADED, changes)
+            return
 
-        if exceptions:
-            raise exceptions.pop()
+        # Stragglers abandoned by the scheduler are left to finish in the background, rather than holding up the stage
+        executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=self.scheduler.limit.maximum)
+        try:
+            submit: Callable[[Tuple[str, str]], Future] = lambda target: executor.submit(self._download_xml, target)
+            for _ in self.scheduler.run(submit, targets, deadlines):
+                pass
+        finally:
+            executor.shutdown(wait=False)
+        self._mark_all(DOWNLOADED, changes)
 
     def __call__(self, changes: Iterable[Tuple[str, Dict[str, FilingMetadata]]]) \
             -> Iterator[Tuple[str, Dict[str, str]]]:
@@ -129,7 +256,192 @@ class RetrieveEfiles:
         #(i.e. wait=True is important)
         yield from self._get_json_tuples(changes)
 
+    def download_one(self, change: Tuple[str, Dict[str, FilingMetadata]]) -> Tuple[str, Dict[str, FilingMetadata]]:
+        """Downloads the XML for a single EIN's new e-files. Used by the pipelined update, one EIN at a time."""
+        ein, updates = change
+        ein_path: str = _ein_path(self.xml_cache_dir, ein)
+        for filing_md in updates.values():
+            if not self._is_translated(filing_md.irs_efile_id):
+                self._download_xml((ein_path, filing_md.irs_efile_id))
+        self._mark(DOWNLOADED, ein, updates.keys())
+        return change
+
+    def convert_one(self, change: Tuple[str, Dict[str, FilingMetadata]]) -> Tuple[str, Dict[str, FilingMetadata]]:
+        """Converts a single EIN's downloaded XML files to JSON."""
+        ein, updates = change
+        if self.translate_pool is not None:
+            self._translate_files(ein, self._untranslated(ein, updates))
+        else:
+            for irs_efile_id in self._untranslated(ein, updates):
+                self._xml_to_json(ein, irs_efile_id)
+        self._mark(TRANSLATED, ein, updates.keys())
+        return change
+
+    def json_paths_for(self, change: Tuple[str, Dict[str, FilingMetadata]]) -> Tuple[str, Dict[str, str]]:
+        """Map of period -> JSON file path for a single EIN whose e-files have been converted."""
+        ein, updates = change
+        return ein, self._json_paths(ein, updates)
+
+    def discard_one(self, change: Tuple[str, Dict[str, FilingMetadata]]):
+        """Deletes a single EIN's temporary XML and JSON files once they have been composed, so that temporary storage
+        stays bounded. Keeps them if cleanup is disabled."""
+        if self.no_cleanup:
+            return
+        ein, updates = change
+        for filing_md in updates.values():
+            irs_efile_id: str = filing_md.irs_efile_id
+            for directory, template in [(self.xml_cache_dir, PUBLIC_XML_NAME), (self.json_cache_dir, JSON_FILENAME)]:
+                try:
+                    os.remove(self._temp_path(directory, ein, template, irs_efile_id))
+                except FileNotFoundError:
+                    pass
+
+    def fetch_one(self, change: Tuple[str, Dict[str, FilingMetadata]]) \
+            -> Tuple[str, Dict[str, FilingMetadata], Dict[str, bytes]]:
+        """Downloads the raw XML for a single EIN's new e-files into memory, as a map of period -> XML bytes. E-files
+        already in the translation cache are left out; translate_one takes them from there."""
+        ein, updates = change
+        raw_xml: Dict[str, bytes] = {}
+        for period, filing_md in updates.items():
+            if not self._is_translated(filing_md.irs_efile_id):
+                raw_xml[period] = self._fetch_xml(PUBLIC_XML_NAME.format(filing_md.irs_efile_id))
+        self._mark(DOWNLOADED, ein, raw_xml.keys())
+        return ein, updates, raw_xml
+
+    def _fetch_xml(self, s3_key: str) -> bytes:
+        if self.xml_cache is not None:
+            cached: Optional[bytes] = self.xml_cache.get(_efile_id(s3_key))
+            if cached is not None:
+                return cached
+        raw: bytes = self.bucket.get_obj_body(s3_key, encoding=None)
+        if self.xml_cache is not None:
+            self.xml_cache.put(_efile_id(s3_key), raw)
+        return raw
+
+    def fetch_all(self, changes: Iterable[Tuple[str, Dict[str, FilingMetadata]]]) \
+            -> Iterator[Tuple[str, Dict[str, FilingMetadata], Dict[str, bytes]]]:
+        """Downloads the raw XML for many EINs' new e-files concurrently, yielding each EIN's map of period -> XML bytes
+        once all of them have arrived, as fetch_one does."""
+        expected: Dict[str, int] = {}
+        fetched: Dict[str, Tuple[Dict[str, FilingMetadata], Dict[str, bytes]]] = {}
+
+        # EINs with nothing left to download are yielded between downloads, as for cached XML in _fetch_many
+        ready: Deque[Tuple[str, Dict[str, FilingMetadata], Dict[str, bytes]]] = deque()
+
+        def keys() -> Iterator[Tuple[Tuple[str, str], str]]:
+            for ein, updates in changes:
+                wanted: Dict[str, str] = {period: filing_md.irs_efile_id for period, filing_md in updates.items()
+                                          if not self._is_translated(filing_md.irs_efile_id)}
+                if not wanted:
+                    ready.append((ein, updates, {}))
+                    continue
+                expected[ein] = len(wanted)
+                fetched[ein] = (updates, {})
+                for period, irs_efile_id in wanted.items():
+                    yield (ein, period), PUBLIC_XML_NAME.format(irs_efile_id)
+
+        for (ein, period), raw in self._fetch_many(keys()):
+            while ready:
+                yield ready.popleft()
+            updates, raw_xml = fetched[ein]
+            raw_xml[period] = raw
+            if len(raw_xml) == expected[ein]:
+                del expected[ein], fetched[ein]
+                self._mark(DOWNLOADED, ein, raw_xml.keys())
+                yield ein, updates, raw_xml
+        while ready:
+            yield ready.popleft()
+
+    def _fetch_many(self, keys: Iterable[Tuple[Any, str]]) -> Iterator[Tuple[Any, bytes]]:
+        if self.xml_cache is None:
+            yield from self._download_many(keys)
+            return
+
+        # Cached e-files are set aside as they are drawn and read between downloads, so that they neither take up the
+        # scheduler's slots nor skew its view of S3 latency
+        hits: Deque[Tuple[Any, str]] = deque()
+
+        def misses() -> Iterator[Tuple[Any, str]]:
+            for tag, s3_key in keys:
+                if _efile_id(s3_key) in self.xml_cache:
+                    hits.append((tag, s3_key))
+                else:
+                    yield tag, s3_key
+
+        def drain_hits() -> Iterator[Tuple[Any, bytes]]:
+            while hits:
+                tag, s3_key = hits.popleft()
+                yield tag, self._fetch_xml(s3_key)
+
+        for tag, raw in self._download_many(misses()):
+            yield from drain_hits()
+            yield tag, raw
+        yield from drain_hits()
+
+    def _download_many(self, keys: Iterable[Tuple[Any, str]]) -> Iterator[Tuple[Any, bytes]]:
+        deadlines: Deadlines = Deadlines(task=DOWNLOAD_TIMEOUT)
+        if self.is_async:
+            tagged: Iterator[Tuple[Tuple[Any, str], str]] = (((tag, s3_key), s3_key) for tag, s3_key in keys)
+            for (tag, s3_key), raw in self.bucket.fetch_many(tagged, deadlines):
+                if self.xml_cache is not None:
+                    self.xml_cache.put(_efile_id(s3_key), raw)
+                yield tag, raw
+            return
+        executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=self.scheduler.limit.maximum)
+        try:
+            submit: Callable[[Tuple[Any, str]], Future] = lambda tagged: executor.submit(self._fetch_xml, tagged[1])
+            for (tag, _), raw in self.scheduler.run(submit, keys, deadlines):
+                yield tag, raw
+        finally:
+            executor.shutdown(wait=False)
+
+    def translate_one(self, fetched: Tuple[str, Dict[str, FilingMetadata], Dict[str, bytes]]) \
+            -> Tuple[str, Dict[str, Dict]]:
+        """Translates a single EIN's downloaded XML, giving a map of period -> translated content. Periods with no XML
+        are taken from the translation cache."""
+        ein, updates, raw_xml = fetched
+        contents: Dict[str, Dict] = {}
+        for period, filing_md in updates.items():
+            if period in raw_xml:
+                continue
+            cached: Optional[Dict] = None
+            if self.translation_cache is not None:
+                cached = self.translation_cache.get(filing_md.irs_efile_id)
+            if cached is None:
+                # Only if the cache was altered mid-run; the filing is translated from scratch instead
+                raw_xml[period] = self._fetch_xml(PUBLIC_XML_NAME.format(filing_md.irs_efile_id))
+                continue
+            contents[period] = cached
+
+        periods: List[str] = list(raw_xml.keys())
+        if self.translate_pool is None:
+            for period in periods:
+                contents[period] = self.translate(raw_xml[period])
+                if self.translation_cache is not None:
+                    self.translation_cache.put(updates[period].irs_efile_id, contents[period])
+            self._mark(TRANSLATED, ein, contents.keys())
+            return ein, contents
+
+        serialized: List[bytes] = self.translate_pool.translate_serialized([raw_xml[period] for period in periods])
+        for period, content in zip(periods, serialized):
+            if self.translation_cache is not None:
+                self.translation_cache.put_serialized(updates[period].irs_efile_id, content)
+            contents[period] = self.serializer.loads(content)
+        self._mark(TRANSLATED, ein, contents.keys())
+        return ein, contents
+
+    def close(self):
+        """Shuts down the translation pool, if there is one, and reports how downloading went."""
+        if self.scheduler.metrics.started is not None:
+            logging.info("Downloaded e-files: %s" % self.scheduler.metrics.summary())
+        if self.translate_pool is not None:
+            self.translate_pool.close()
+        if self.xml_cache is not None:
+            self.xml_cache.close()
+        if self.translation_cache is not None:
+            self.translation_cache.close()
+
     def __del__(self):
-        if not self.no_cleanup:
+        if not self.no_cleanup and not self.in_memory:
             shutil.rmtree(self.xml_cache_dir, ignore_errors=True)
             shutil.rmtree(self.json_cache_dir, ignore_errors=True)
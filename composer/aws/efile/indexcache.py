@@ -0,0 +1,49 @@
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from composer.aws.s3 import Bucket
+
+@dataclass
+class IndexCache:
+    """Local copies of the yearly e-file indices, each stored alongside the ETag and Last-Modified date of the S3 object
+    it was copied from. Lets a run skip downloading indices that have not changed since the previous run."""
+    basepath: str
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.basepath, key)
+
+    def _metadata_path(self, key: str) -> str:
+        return os.path.join(self.basepath, "%s.meta" % key)
+
+    def metadata_for(self, key: str) -> Optional[Dict]:
+        """Returns the ETag and Last-Modified date of the cached copy of an index, if there is a usable one."""
+        if not os.path.exists(self.path_for(key)):
+            return None
+        try:
+            with open(self._metadata_path(key)) as fh:
+                return json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def refresh(self, bucket: Bucket, key: str) -> str:
+        """Brings the local copy of an index up to date with the bucket and returns its path.
+
+        :raises FileNotFoundError: If the index does not exist in the bucket.
+        """
+        os.makedirs(self.basepath, exist_ok=True)
+        destination: str = self.path_for(key)
+        cached: Optional[Dict] = self.metadata_for(key)
+        etag: Optional[str] = cached["ETag"] if cached is not None else None
+        metadata: Optional[Dict] = bucket.download_if_changed(key, destination, etag)
+        if metadata is None:
+            logging.info("Index %s unchanged since %s; using cached copy." % (key, cached["LastModified"]))
+            return destination
+
+        # Written only after the index itself, so that a stale ETag can never vouch for a newer file
+        logging.info("Downloaded new copy of index %s." % key)
+        with open(self._metadata_path(key), "w") as fh:
+            json.dump(metadata, fh)
+        return destination
@@ -1,38 +1,83 @@
-import json
 import logging
 from collections import deque
 from collections.abc import Iterable
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Iterator, Dict, List, Deque
-from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from queue import Queue, Full
+from threading import Event
+from typing import Iterator, Dict, List, Deque, Optional, Union, Callable, Iterable as IterableType, Tuple
+from concurrent.futures import ThreadPoolExecutor, Future
 
 from composer.aws.efile.bucket import EfileBucket
+from composer.aws.efile.indexcache import IndexCache
 from composer.aws.s3 import Bucket
-from composer.efile.structures.metadata import FilingMetadata
+from composer.scheduler import Deadlines, TaskScheduler
+from composer.efile.structures.metadata import FilingMetadata, download_timestamp
+from composer.efile.structures.watermark import Watermark
+from composer.fileio.jsonstream import iter_array_items, read_chunks
+from composer.fileio.serialize import JsonSerializer
 from composer.conf import (EARLIEST_YEAR, MAX_WORKERS, INDEX_JSON_NAME,
-                           FILING_NAME, DOWNLOAD_TIMEOUT)
+                           FILING_NAME, INDEX_DOWNLOAD_TIMEOUT, INDEX_CHUNK_SIZE, INDEX_QUEUE_SIZE)
 
 
 def _json_index_key(year: int) -> str:
     return INDEX_JSON_NAME.format(year)
 
+@dataclass
+class _EndOfYear:
+    """Placed on the streaming queue once a year's index has been fully read (or has failed)."""
+    year: int
+    exception: Optional[BaseException] = None
+
+class _WatermarkMismatch(Exception):
+    pass
+
+def _put(queue: Queue, item: Union[FilingMetadata, _EndOfYear], stop: Event) -> bool:
+    """Blocks until there is room on the queue, unless the consumer has gone away in the meantime."""
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Full:
+            continue
+    return False
+
 @dataclass
 class EfileIndices(Iterable):
     bucket: Bucket
+    streaming: bool = False
+    cache: Optional[IndexCache] = None
+    watermarks: Dict[int, Watermark] = field(default_factory=dict)
+    serializer: JsonSerializer = field(default_factory=JsonSerializer)
+    scheduler: TaskScheduler = field(default_factory=TaskScheduler)
+    observed: Dict[int, Watermark] = field(default_factory=dict, init=False)
 
     @classmethod
-    def build(cls) -> "EfileIndices":
+    def build(cls, streaming: bool = False, cache_path: Optional[str] = None,
+              serializer: Optional[JsonSerializer] = None) -> "EfileIndices":
         bucket: Bucket = EfileBucket()
-        return cls(bucket)
+        cache: Optional[IndexCache] = IndexCache(cache_path) if cache_path is not None else None
+        return cls(bucket, streaming, cache, serializer=serializer or JsonSerializer())
+
+    def _get_raw(self, object_key: str) -> str:
+        if self.cache is None:
+            return self.bucket.get_obj_body(object_key)
+        with open(self.cache.refresh(self.bucket, object_key)) as fh:
+            return fh.read()
+
+    def _get_chunks(self, object_key: str) -> Iterator[str]:
+        if self.cache is None:
+            yield from self.bucket.iter_obj_body(object_key, INDEX_CHUNK_SIZE)
+        else:
+            yield from read_chunks(self.cache.refresh(self.bucket, object_key), INDEX_CHUNK_SIZE)
 
     def _get_for_year(self, year: int) -> List[Dict]:
         object_key: str = _json_index_key(year)
         try:
-            raw: str = self.bucket.get_obj_body(object_key)
+            raw: str = self._get_raw(object_key)
         except FileNotFoundError:
             return []
-        as_json: Dict = json.loads(raw)
+        as_json: Dict = self.serializer.loads(raw)
 
         # The IRS currently includes a single key in its indices. Blow up if that changes.
         assert len(as_json) == 1
@@ -40,36 +85,112 @@ class EfileIndices(Iterable):
         filing_list: List = as_json[filing_list_key]
         return filing_list
 
-    def __iter__(self) -> Iterator[FilingMetadata]:
-        years: Iterator = range(EARLIEST_YEAR, datetime.now().year + 1)
-        #years: Iterator = range(EARLIEST_YEAR, EARLIEST_YEAR + 1)
+    def _stream_for_year(self, year: int) -> Iterator[Dict]:
+        """Yields the filing specs in a year's index one at a time as the object is downloaded."""
+        object_key: str = _json_index_key(year)
+        chunks: Iterator[str] = self._get_chunks(object_key)
+        filing_list_key: str = FILING_NAME.format(year)
+        try:
+            yield from iter_array_items(chunks, filing_list_key)
+        except FileNotFoundError:
+            return
 
-        # The IRS currently provides e-files starting with those filed in 2011. Blow up if that changes.
-        assert not self.bucket.exists(_json_index_key(EARLIEST_YEAR - 1))
-        assert self.bucket.exists(_json_index_key(EARLIEST_YEAR))
+    def _scan(self, year: int, filing_specs: IterableType[Dict], watermark: Optional[Watermark]) -> Iterator[Dict]:
+        entry_count: int = 0
+        irs_efile_id: Optional[str] = None
+        for filing_spec in filing_specs:
+            entry_count += 1
+            irs_efile_id = filing_spec["ObjectId"]
+            if watermark is not None and entry_count <= watermark.entry_count:
+                if entry_count == watermark.entry_count and not watermark.matches(entry_count, irs_efile_id):
+                    raise _WatermarkMismatch
+                continue
+            yield filing_spec
+
+        if watermark is not None and entry_count < watermark.entry_count:
+            raise _WatermarkMismatch
 
+        if entry_count > 0:
+            self.observed[year] = Watermark(year, entry_count, irs_efile_id)
+
+    def _beyond_watermark(self, year: int, read: Callable[[], IterableType[Dict]]) -> Iterator[Dict]:
+        """Yields only the entries of a year's index that were appended since the last recorded watermark. If the index
+        no longer agrees with the watermark, yields the whole year instead. A mismatch is always detected before any
+        entry is yielded, so the year can simply be read again from the start."""
+        watermark: Optional[Watermark] = self.watermarks.get(year)
+        try:
+            yield from self._scan(year, read(), watermark)
+        except _WatermarkMismatch:
+            logging.warning("Index for %i no longer matches its watermark; scanning the full year." % year)
+            yield from self._scan(year, read(), None)
+
+    def _produce(self, year: int, queue: Queue, stop: Event, date_downloaded: str):
+        try:
+            for filing_spec in self._beyond_watermark(year, lambda: self._stream_for_year(year)):
+                if not _put(queue, FilingMetadata.from_json(filing_spec, date_downloaded), stop):
+                    return
+        except BaseException as e:
+            _put(queue, _EndOfYear(year, e), stop)
+            return
+        _put(queue, _EndOfYear(year), stop)
+
+    def _iter_streaming(self, years: range, date_downloaded: str) -> Iterator[FilingMetadata]:
+        """Downloads and parses the indices for several years concurrently, yielding filings as soon as they are parsed.
+        Memory use is bounded by the size of the queue rather than by the size of the indices."""
         exceptions = list()
+        queue: Queue = Queue(maxsize=INDEX_QUEUE_SIZE)
+        stop: Event = Event()
         with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            future_to_year: Dict[Future, int] = {}
-            results: Deque[List[Dict]] = deque()
             for year in years:
-                future: Future = executor.submit(self._get_for_year, year)
-                future_to_year[future] = year
-
-            for completed_future in as_completed(future_to_year, timeout=DOWNLOAD_TIMEOUT):  # type: Future
-                logging.info("Finished downloading index for %i" % future_to_year[completed_future])
-                results.append(completed_future.result())
-
-                if completed_future.exception() is not None:
-                    exceptions.append(completed_future.exception())
-            
-        # NOTE: if you want to omit exceptions raising, just
-        # comment the folliwng lines of code
+                executor.submit(self._produce, year, queue, stop, date_downloaded)
+
+            try:
+                remaining: int = len(years)
+                while remaining > 0:
+                    item: Union[FilingMetadata, _EndOfYear] = queue.get()
+                    if isinstance(item, _EndOfYear):
+                        remaining -= 1
+                        logging.info("Finished streaming index for %i" % item.year)
+                        if item.exception is not None:
+                            exceptions.append(item.exception)
+                    else:
+                        yield item
+            finally:
+                # Release any producers still blocked on a full queue if the consumer stops early
+                stop.set()
+
         if exceptions:
             raise exceptions.pop()
-        
+
+    def _iter_batch(self, years: range, date_downloaded: str) -> Iterator[FilingMetadata]:
+        results: Deque[Tuple[int, List[Dict]]] = deque()
+        executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=min(len(years), self.scheduler.limit.maximum))
+        try:
+            submit: Callable[[int], Future] = lambda year: executor.submit(self._get_for_year, year)
+            # A yearly index may take longer than the default stage allowance, so the stage gets no deadline of its own;
+            # each attempt has one, and the attempts are limited, so the stage cannot run forever either
+            deadlines: Deadlines = Deadlines(task=INDEX_DOWNLOAD_TIMEOUT, stage=None)
+            for year, result in self.scheduler.run(submit, years, deadlines):
+                logging.info("Finished downloading index for %i" % year)
+                results.append((year, result))
+        finally:
+            executor.shutdown(wait=False)
 
         # NOTE: you can consider to use this outsie with-statemnt
-        for result in results:
-            for filing_spec in result:
-                yield FilingMetadata.from_json(filing_spec)
+        for year, result in results:
+            for filing_spec in self._beyond_watermark(year, lambda: result):
+                yield FilingMetadata.from_json(filing_spec, date_downloaded)
+
+    def __iter__(self) -> Iterator[FilingMetadata]:
+        years: range = range(EARLIEST_YEAR, datetime.now().year + 1)
+        #years: Iterator = range(EARLIEST_YEAR, EARLIEST_YEAR + 1)
+
+        # The IRS currently provides e-files starting with those filed in 2011. Blow up if that changes.
+        assert not self.bucket.exists(_json_index_key(EARLIEST_YEAR - 1))
+        assert self.bucket.exists(_json_index_key(EARLIEST_YEAR))
+
+        date_downloaded: str = download_timestamp()
+        if self.streaming:
+            yield from self._iter_streaming(years, date_downloaded)
+        else:
+            yield from self._iter_batch(years, date_downloaded)
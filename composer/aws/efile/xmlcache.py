@@ -0,0 +1,152 @@
+import logging
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass, field
+from sqlite3 import Connection, connect
+from threading import Lock
+from typing import List, Optional, Tuple
+
+from composer.efile.structures.sqlite import configure_connection
+from composer.fileio.compression import compressed_path, compression_of, open_path
+from composer.conf import PUBLIC_XML_NAME, XML_CACHE_BYTES, XML_CACHE_DB_NAME
+
+def _copy(source: str, destination: str):
+    """Copies a file, recompressing it if the two paths' suffixes call for different codecs."""
+    if compression_of(source) == compression_of(destination):
+        shutil.copyfile(source, destination)
+        return
+    with open_path(source, "rb") as source_fh, open_path(destination, "wb") as fh:
+        shutil.copyfileobj(source_fh, fh)
+
+@dataclass
+class XmlCache:
+    """Local copies of e-file XML, kept across runs so that a re-run (after a failed compose, say, or to rebuild
+    composites with a new translator) reads filings from disk rather than from S3. An e-file never changes once
+    published, so a copy is keyed by nothing but its irs_efile_id.
+
+    The copies are kept within `max_bytes` of disk by evicting the least recently used. Sizes and last use are tracked
+    in a small SQLite ledger beside them. Copies are written with the given codec; those written with another remain
+    readable."""
+    basepath: str
+    max_bytes: int = XML_CACHE_BYTES
+    compression: Optional[str] = None
+    total_bytes: int = field(init=False, default=0)
+    _conn: Connection = field(init=False, default=None)
+    _lock: Lock = field(init=False, default_factory=Lock)
+
+    def __post_init__(self):
+        os.makedirs(self.basepath, exist_ok=True)
+        self._conn = configure_connection(connect(os.path.join(self.basepath, XML_CACHE_DB_NAME),
+                                                  check_same_thread=False))
+        self._conn.execute("CREATE TABLE IF NOT EXISTS entries (irs_efile_id TEXT PRIMARY KEY, path TEXT NOT NULL, "
+                           "size INTEGER NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._conn.commit()
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _path_for(self, irs_efile_id: str) -> str:
+        """Relative to basepath. Spread across directories by the last digits of the ID, which vary the most."""
+        filename: str = compressed_path(PUBLIC_XML_NAME.format(irs_efile_id), self.compression)
+        return os.path.join(irs_efile_id[-3:], filename)
+
+    def _lookup(self, irs_efile_id: str) -> Optional[str]:
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT path FROM entries WHERE irs_efile_id = ?", (irs_efile_id,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE entries SET last_used = ? WHERE irs_efile_id = ?", (time.time(), irs_efile_id))
+            return row[0]
+
+    def _forget(self, irs_efile_id: str):
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT size FROM entries WHERE irs_efile_id = ?", (irs_efile_id,)).fetchone()
+            if row is not None:
+                self._conn.execute("DELETE FROM entries WHERE irs_efile_id = ?", (irs_efile_id,))
+                self.total_bytes -= row[0]
+
+    def get(self, irs_efile_id: str) -> Optional[bytes]:
+        """The cached XML for an e-file, or None if there is no copy."""
+        relative: Optional[str] = self._lookup(irs_efile_id)
+        if relative is None:
+            return None
+        try:
+            with open_path(os.path.join(self.basepath, relative), "rb") as fh:
+                return fh.read()
+        except FileNotFoundError:
+            # Evicted in the meantime, or removed by hand
+            self._forget(irs_efile_id)
+            return None
+
+    def copy_to(self, irs_efile_id: str, destination: str) -> bool:
+        """Writes the cached XML for an e-file to a local path, compressed according to the path's suffix. Returns False
+        if there is no copy."""
+        relative: Optional[str] = self._lookup(irs_efile_id)
+        if relative is None:
+            return False
+        try:
+            _copy(os.path.join(self.basepath, relative), destination)
+            return True
+        except FileNotFoundError:
+            self._forget(irs_efile_id)
+            return False
+
+    def __contains__(self, irs_efile_id: str) -> bool:
+        with self._lock:
+            query: str = "SELECT 1 FROM entries WHERE irs_efile_id = ?"
+            return self._conn.execute(query, (irs_efile_id,)).fetchone() is not None
+
+    def _install(self, irs_efile_id: str, partial: str, relative: str):
+        os.replace(partial, os.path.join(self.basepath, relative))
+        size: int = os.path.getsize(os.path.join(self.basepath, relative))
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT size FROM entries WHERE irs_efile_id = ?", (irs_efile_id,)).fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                               (irs_efile_id, relative, size, time.time()))
+            self.total_bytes += size - (row[0] if row is not None else 0)
+        self.evict()
+
+    def _partial_path(self, relative: str) -> str:
+        # The prefix leaves the codec's suffix in place
+        directory, filename = os.path.split(os.path.join(self.basepath, relative))
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, ".%s.%s" % (uuid.uuid4().hex, filename))
+
+    def put(self, irs_efile_id: str, content: bytes):
+        relative: str = self._path_for(irs_efile_id)
+        partial: str = self._partial_path(relative)
+        with open_path(partial, "wb") as fh:
+            fh.write(content)
+        self._install(irs_efile_id, partial, relative)
+
+    def put_file(self, irs_efile_id: str, source: str):
+        """Copies a local XML file (compressed or not, according to its suffix) into the cache."""
+        relative: str = self._path_for(irs_efile_id)
+        partial: str = self._partial_path(relative)
+        _copy(source, partial)
+        self._install(irs_efile_id, partial, relative)
+
+    def evict(self):
+        """Removes the least recently used copies until the cache is back within its budget."""
+        removed: List[Tuple[str, str, int]] = []
+        with self._lock, self._conn:
+            cursor = self._conn.execute("SELECT irs_efile_id, path, size FROM entries ORDER BY last_used")
+            while self.total_bytes > self.max_bytes:
+                row: Optional[Tuple[str, str, int]] = cursor.fetchone()
+                if row is None:
+                    break
+                removed.append(row)
+                self.total_bytes -= row[2]
+            cursor.close()
+            self._conn.executemany("DELETE FROM entries WHERE irs_efile_id = ?", ((row[0],) for row in removed))
+        for _, relative, _ in removed:
+            try:
+                os.remove(os.path.join(self.basepath, relative))
+            except FileNotFoundError:
+                pass
+        if removed:
+            logging.debug("Evicted %i e-files from the XML cache." % len(removed))
+
+    def close(self):
+        self._conn.close()
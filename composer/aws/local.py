@@ -0,0 +1,167 @@
+"""Stand-ins for boto3 and aiobotocore S3 clients that serve objects from a local directory. Unlike file_backed_bucket,
+they sit underneath a real Bucket, so Bucket's own request logic (ranges, conditions) is exercised. Used in tests and
+benchmarks."""
+import asyncio
+import hashlib
+import io
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+class _Body:
+    """Mimics botocore's StreamingBody. If `bandwidth` is set, reading is throttled to that many bytes per second, as
+    a single S3 stream would be."""
+    def __init__(self, content: bytes, bandwidth: Optional[int]):
+        self._stream = io.BytesIO(content)
+        self._bandwidth: Optional[int] = bandwidth
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        data: bytes = self._stream.read(amt)
+        if self._bandwidth:
+            time.sleep(len(data) / self._bandwidth)
+        return data
+
+    def iter_chunks(self, chunk_size: int = 1024) -> Iterator[bytes]:
+        while True:
+            chunk: bytes = self.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+class _AsyncBody:
+    """Mimics aiobotocore's StreamingBody, throttled in the same way as _Body."""
+    def __init__(self, content: bytes, bandwidth: Optional[int]):
+        self._stream = io.BytesIO(content)
+        self._bandwidth: Optional[int] = bandwidth
+
+    async def read(self, amt: Optional[int] = None) -> bytes:
+        data: bytes = self._stream.read(amt)
+        if self._bandwidth:
+            await asyncio.sleep(len(data) / self._bandwidth)
+        return data
+
+    def close(self):
+        self._stream.close()
+
+    async def __aenter__(self) -> "_AsyncBody":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+def _error(code: str, operation: str) -> ClientError:
+    return ClientError({"Error": {"Code": code}}, operation)
+
+class LocalS3:
+    """If `latency` is set, each request waits that many seconds before responding, as it would for a round trip to
+    S3. If `capacity` is set, requests arriving while that many are already waiting are refused with SlowDown, as S3
+    does when pushed too hard."""
+    def __init__(self, root_dir: str, bandwidth: Optional[int] = None, latency: float = 0,
+                 capacity: Optional[int] = None):
+        self.root_dir: str = root_dir
+        self.bandwidth: Optional[int] = bandwidth
+        self.latency: float = latency
+        self.capacity: Optional[int] = capacity
+        self.in_flight: int = 0
+        self._lock: threading.Lock = threading.Lock()
+        self.requests: List[Dict] = []
+        self._cache: Dict[str, Tuple[float, bytes, Dict]] = {}
+
+    def _load(self, key: str, operation: str) -> Tuple[bytes, Dict]:
+        """Returns the object's content and metadata. Both are cached until the file's modification time changes, so
+        that hashing a large object doesn't dominate the cost of each request."""
+        path: str = os.path.join(self.root_dir, key)
+        try:
+            modified: float = os.path.getmtime(path)
+        except FileNotFoundError:
+            raise _error("NoSuchKey", operation)
+        cached: Optional[Tuple[float, bytes, Dict]] = self._cache.get(key)
+        if cached is not None and cached[0] == modified:
+            return cached[1], cached[2]
+        with open(path, "rb") as fh:
+            content: bytes = fh.read()
+        metadata: Dict = {"ETag": '"%s"' % hashlib.md5(content).hexdigest(),
+                          "LastModified": datetime.fromtimestamp(modified, tz=timezone.utc)}
+        self._cache[key] = (modified, content, metadata)
+        return content, metadata
+
+    def _admit(self, operation: str):
+        with self._lock:
+            if self.capacity is not None and self.in_flight >= self.capacity:
+                raise _error("SlowDown", operation)
+            self.in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _head(self, Key: str) -> Dict:
+        self.requests.append({"operation": "HeadObject", "Key": Key})
+        content, metadata = self._load(Key, "HeadObject")
+        return dict(metadata, ContentLength=len(content))
+
+    def _get(self, Key: str, Range: Optional[str] = None, IfMatch: Optional[str] = None,
+             IfNoneMatch: Optional[str] = None) -> Tuple[Dict, bytes]:
+        """Returns the response metadata and the content of its body."""
+        self.requests.append({"operation": "GetObject", "Key": Key, "Range": Range})
+        content, metadata = self._load(Key, "GetObject")
+        if IfMatch is not None and IfMatch != metadata["ETag"]:
+            raise _error("PreconditionFailed", "GetObject")
+        if IfNoneMatch is not None and IfNoneMatch == metadata["ETag"]:
+            raise _error("304", "GetObject")
+        if Range is None:
+            return dict(metadata, ContentLength=len(content)), content
+
+        start, end = (int(bound) for bound in Range[len("bytes="):].split("-"))
+        if start >= len(content):
+            raise _error("InvalidRange", "GetObject")
+        end = min(end, len(content) - 1)
+        part: bytes = content[start:end + 1]
+        return dict(metadata, ContentLength=len(part), ContentRange="bytes %i-%i/%i" % (start, end, len(content))), part
+
+    def head_object(self, Bucket: str, Key: str) -> Dict:
+        self._admit("HeadObject")
+        try:
+            time.sleep(self.latency)
+        finally:
+            self._release()
+        return self._head(Key)
+
+    def get_object(self, Bucket: str, Key: str, **kwargs) -> Dict:
+        self._admit("GetObject")
+        try:
+            time.sleep(self.latency)
+        finally:
+            self._release()
+        response, content = self._get(Key, **kwargs)
+        return dict(response, Body=_Body(content, self.bandwidth))
+
+class AsyncLocalS3(LocalS3):
+    """Asynchronous counterpart of LocalS3, for AsyncBucket. Like an aiobotocore client creator, it is also an async
+    context manager that yields the client."""
+    async def head_object(self, Bucket: str, Key: str) -> Dict:
+        self._admit("HeadObject")
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self._release()
+        return self._head(Key)
+
+    async def get_object(self, Bucket: str, Key: str, **kwargs) -> Dict:
+        self._admit("GetObject")
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self._release()
+        response, content = self._get(Key, **kwargs)
+        return dict(response, Body=_AsyncBody(content, self.bandwidth))
+
+    async def __aenter__(self) -> "AsyncLocalS3":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
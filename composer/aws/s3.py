@@ -1,8 +1,17 @@
+import codecs
+import hashlib
 import logging
 import os
+import re
+import shutil
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
 
 import boto3
 from typing import *
+from typing import BinaryIO
 from multiprocessing import cpu_count
 from mock import MagicMock
 
@@ -10,21 +19,143 @@ from composer.aws.handshake import Handshake
 from botocore.errorfactory import ClientError
 from botocore.client import Config
 
+from composer.fileio.jsonstream import read_chunks
+from composer.conf import RANGED_GET_THRESHOLD, RANGED_GET_PART_SIZE, RANGED_GET_WORKERS
+
 logging.getLogger("botocore.vendored.requests.packages.urllib3").setLevel(logging.WARNING)
 
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+def _copy_parts(parts: Iterable[bytes], fileobj: BinaryIO) -> int:
+    written: int = 0
+    for encoded in parts:
+        fileobj.write(encoded)
+        written += len(encoded)
+    return written
+
 class Bucket:
-    def __init__(self, s3, name: str):
+    """Objects larger than `ranged_threshold` bytes are downloaded as several byte ranges at once, `range_workers` at
+    a time, since a single stream cannot saturate the connection. The first request asks for the first
+    `ranged_threshold` bytes, so smaller objects still take a single request."""
+    def __init__(self, s3, name: str, ranged_threshold: int = RANGED_GET_THRESHOLD,
+                 part_size: int = RANGED_GET_PART_SIZE, range_workers: int = RANGED_GET_WORKERS):
         self.s3 = s3
         self.name = name
+        self.ranged_threshold: int = ranged_threshold
+        self.part_size: int = part_size
+        self.range_workers: int = range_workers
+
+    def _get_first(self, key: str, **conditions) -> Tuple[Dict, int]:
+        """Requests the first `ranged_threshold` bytes of the object. Returns the response and the object's full
+        size.
+
+        :raises FileNotFoundError: If the object does not exist.
+        """
+        try:
+            obj: Dict = self.s3.get_object(Bucket=self.name, Key=key, Range="bytes=0-%i" % (self.ranged_threshold - 1),
+                                           **conditions)
+        except ClientError as e:
+            code: str = e.response["Error"]["Code"]
+            if code in ("404", "NoSuchKey"):
+                raise FileNotFoundError(key)
+            # Empty objects cannot satisfy any range
+            if code != "InvalidRange":
+                raise e
+            obj = self.s3.get_object(Bucket=self.name, Key=key, **conditions)
+            return obj, obj["ContentLength"]
+        match = _CONTENT_RANGE.match(obj.get("ContentRange") or "")
+        return obj, int(match.group(3)) if match else obj["ContentLength"]
+
+    def _get_range(self, key: str, start: int, end: int, etag: str) -> bytes:
+        # Pinned to the ETag of the first response, so that a replaced object fails rather than being spliced
+        obj: Dict = self.s3.get_object(Bucket=self.name, Key=key, Range="bytes=%i-%i" % (start, end), IfMatch=etag)
+        return obj['Body'].read()
+
+    def _iter_body(self, key: str, chunk_size: int, **conditions) -> Tuple[Dict, Iterator[bytes]]:
+        """Returns the response to the first request, along with an iterator over the whole body, in order. Beyond the
+        first response, the body is downloaded as concurrent ranged requests, which are started as soon as iteration
+        begins. No more than two parts per worker are held at once."""
+        obj, total = self._get_first(key, **conditions)
+        received: int = obj["ContentLength"]
+        ranges: List[Tuple[int, int]] = [(offset, min(offset + self.part_size, total) - 1)
+                                         for offset in range(received, total, self.part_size)]
+
+        def parts() -> Iterator[bytes]:
+            if not ranges:
+                yield from obj['Body'].iter_chunks(chunk_size)
+                return
+            pending: Iterator[Tuple[int, int]] = iter(ranges)
+            window: Deque[Future] = deque()
+            with ThreadPoolExecutor(max_workers=self.range_workers) as executor:
+                for part_start, part_end in pending:
+                    window.append(executor.submit(self._get_range, key, part_start, part_end, obj["ETag"]))
+                    if len(window) >= self.range_workers * 2:
+                        break
+                yield from obj['Body'].iter_chunks(chunk_size)
+                while window:
+                    yield window.popleft().result()
+                    next_range: Optional[Tuple[int, int]] = next(pending, None)
+                    if next_range is not None:
+                        window.append(executor.submit(self._get_range, key, *next_range, obj["ETag"]))
+
+        return obj, parts()
 
     def get_obj_body(self, key: str, encoding: Optional[str]= "utf-8"):
-        obj = self.s3.get_object(Bucket=self.name, Key=key)
-        encoded = obj['Body'].read()
+        _, parts = self._iter_body(key, RANGED_GET_PART_SIZE)
+        encoded: bytes = b"".join(parts)
         if encoding:
             decoded = encoded.decode(encoding)
             return decoded
         return encoded
 
+    def iter_obj_body(self, key: str, chunk_size: int, encoding: str = "utf-8") -> Iterator[str]:
+        """Yields the decoded body of an object in chunks of roughly `chunk_size` bytes (or, past the ranged threshold,
+        of the part size), without ever holding the whole body in memory."""
+        _, parts = self._iter_body(key, chunk_size)
+        decoder = codecs.getincrementaldecoder(encoding)()
+        for encoded in parts:
+            yield decoder.decode(encoded)
+        yield decoder.decode(b"", final=True)
+
+    def download_to(self, key: str, fileobj: BinaryIO, chunk_size: int = 1048576) -> int:
+        """Copies an object's body to a binary file object as it arrives, without decoding it or holding it all in
+        memory.
+
+        :return: The number of bytes written.
+        """
+        _, parts = self._iter_body(key, chunk_size)
+        return _copy_parts(parts, fileobj)
+
+    def download_if_changed(self, key: str, destination: str, etag: Optional[str] = None,
+                            chunk_size: int = 1048576) -> Optional[Dict]:
+        """Copies an object to a local file, unless its ETag still matches the one supplied. The request is
+        conditional, so an unchanged object costs no more than a HEAD request.
+
+        :return: The new object's ETag and Last-Modified date, or None if the object has not changed.
+        :raises FileNotFoundError: If the object does not exist.
+        """
+        conditions: Dict = {}
+        if etag is not None:
+            conditions["IfNoneMatch"] = etag
+        try:
+            obj, parts = self._iter_body(key, chunk_size, **conditions)
+        except ClientError as e:
+            code: str = e.response["Error"]["Code"]
+            if code in ("304", "NotModified"):
+                return None
+            raise e
+
+        # Unique, in case an abandoned attempt is still writing
+        partial: str = "%s.%s.part" % (destination, uuid.uuid4().hex)
+        with open(partial, "wb") as fh:
+            _copy_parts(parts, fh)
+        os.replace(partial, destination)
+        return {"ETag": obj["ETag"], "LastModified": obj["LastModified"].isoformat()}
+
+    def close(self):
+        """Releases anything held open by the bucket. Nothing, for a boto3 client."""
+        pass
+
     # SO 33842944
     def exists(self, key: str) -> bool:
         try:
@@ -46,13 +177,45 @@ def file_backed_bucket(root_dir: str) -> Bucket:
     """Mock bucket used in tests and fixture creation"""
     bucket: Bucket = MagicMock(spec=Bucket)
 
-    def get_file_content(filename: str, encoding: Optional[str] = "utf-8") -> str:
+    def get_file_content(filename: str, encoding: Optional[str] = "utf-8") -> Union[str, bytes]:
         filepath: str = os.path.join(root_dir, filename)
-        with open(filepath) as fh:
+        if not encoding:
+            with open(filepath, "rb") as fh:
+                return fh.read()
+        with open(filepath, encoding=encoding) as fh:
             return fh.read()
 
     bucket.get_obj_body.side_effect = get_file_content
 
+    def iter_file_content(filename: str, chunk_size: int, encoding: str = "utf-8") -> Iterator[str]:
+        filepath: str = os.path.join(root_dir, filename)
+        yield from read_chunks(filepath, chunk_size, encoding)
+
+    bucket.iter_obj_body.side_effect = iter_file_content
+
+    def copy_if_changed(filename: str, destination: str, etag: Optional[str] = None,
+                        chunk_size: int = 1048576) -> Optional[Dict]:
+        filepath: str = os.path.join(root_dir, filename)
+        with open(filepath, "rb") as fh:
+            content: bytes = fh.read()
+        current: str = '"%s"' % hashlib.md5(content).hexdigest()
+        if current == etag:
+            return None
+        with open(destination, "wb") as fh:
+            fh.write(content)
+        modified: datetime = datetime.fromtimestamp(os.path.getmtime(filepath), tz=timezone.utc)
+        return {"ETag": current, "LastModified": modified.isoformat()}
+
+    bucket.download_if_changed.side_effect = copy_if_changed
+
+    def copy_to(filename: str, fileobj: BinaryIO, chunk_size: int = 1048576) -> int:
+        filepath: str = os.path.join(root_dir, filename)
+        with open(filepath, "rb") as fh:
+            shutil.copyfileobj(fh, fileobj, chunk_size)
+        return os.path.getsize(filepath)
+
+    bucket.download_to.side_effect = copy_to
+
     def file_exists(filename: str) -> bool:
         filepath: str = os.path.join(root_dir, filename)
         return os.path.exists(filepath)
@@ -1,5 +1,10 @@
 import click
 from composer.efile.update import UpdateEfileState
+from composer.efile.xmlio import TRANSLATORS
+from composer.efile.composite import CompositeStore
+from composer.fileio.compression import COMPRESSIONS
+from composer.fileio.paths import EINPathManager
+from composer.fileio.serialize import JsonSerializer, JSON_BACKENDS
 import logging
 
 logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
@@ -13,8 +18,75 @@ def cli():
 @click.argument('data_path', type=click.Path(exists=True))
 @click.option('--temp_path', type=click.Path(exists=True), default="/tmp")
 @click.option('--no_cleanup', is_flag=True)
-def efile(data_path: str, temp_path: str, no_cleanup: bool):
+@click.option('--stream_indices', is_flag=True, help="Parse e-file indices incrementally as they download.")
+@click.option('--no_index_cache', is_flag=True, help="Always download e-file indices in full.")
+@click.option('--full_scan', is_flag=True, help="Consider every index entry, not just those added since the last run.")
+@click.option('--preload_known', is_flag=True, help="Hold the identifiers of all known e-files in memory.")
+@click.option('--dedupe_engine', type=click.Choice(["rowwise", "columnar"]), default="rowwise",
+              help="How to choose the latest filing for each EIN/period. 'columnar' requires pandas.")
+@click.option('--pipelined', is_flag=True, help="Compose each EIN as soon as its e-files are converted.")
+@click.option('--translate_workers', type=int, default=None,
+              help="Number of processes translating XML. Defaults to one per core; 0 translates in-process.")
+@click.option('--translator', type=click.Choice(TRANSLATORS), default="xmljson",
+              help="How to translate e-file XML. 'fused' skips the intermediate BadgerFish representation.")
+@click.option('--json_backend', type=click.Choice(JSON_BACKENDS), default=JSON_BACKENDS[0],
+              help="Library for reading and writing JSON. Defaults to the fastest one installed.")
+@click.option('--compact', is_flag=True, help="Write composites without indentation.")
+@click.option('--delta_log', is_flag=True, help="Append new periods to a log beside each composite instead of "
+                                                "rewriting it. Until the logs are folded in by the compact command, "
+                                                "the composite files alone are out of date.")
+@click.option('--composite_store', type=click.Choice(["files", "sqlite"]), default="files",
+              help="Keep composites as one file per EIN, or as blobs in SQLite databases under DATA_PATH/composites.")
+@click.option('--sqlite_shards', type=int, default=1, help="Number of SQLite databases to spread composites across.")
+@click.option('--compress_blobs', is_flag=True, help="Compress composites stored in SQLite.")
+@click.option('--compression', type=click.Choice(COMPRESSIONS), default="none",
+              help="Compress composite files and temporary files with this codec. Existing files are read whatever "
+                   "their codec; see the recompress command.")
+@click.option('--async_s3', is_flag=True, help="Download from S3 on an event loop, keeping many requests in flight "
+                                               "at once. Requires aiobotocore.")
+@click.option('--xml_cache_bytes', type=int, default=0,
+              help="Keep up to this many bytes of downloaded e-file XML under DATA_PATH/xml_cache, so that later runs "
+                   "need not download it again. 0 (the default) disables the cache.")
+@click.option('--translation_cache', is_flag=True,
+              help="Keep translated e-files under DATA_PATH/translation_cache, so that later runs need not translate "
+                   "them again until the translator changes.")
+@click.option('--resume', is_flag=True, help="Continue an update that failed or was interrupted, skipping the e-files "
+                                             "it had already composed, rather than starting a new one.")
+def efile(data_path: str, temp_path: str, no_cleanup: bool, stream_indices: bool, no_index_cache: bool,
+          full_scan: bool, preload_known: bool, dedupe_engine: str, pipelined: bool, translate_workers: int,
+          translator: str, json_backend: str, compact: bool, delta_log: bool, composite_store: str,
+          sqlite_shards: int, compress_blobs: bool, compression: str, async_s3: bool,
+          xml_cache_bytes: int, translation_cache: bool, resume: bool):
     """Update local efile composites, or create them if they do not exist. Results in a set of e-file composites for all
     organizations that have e-filed, along with a SQLite database of latest and duplicate filings."""
-    update: UpdateEfileState = UpdateEfileState.build(data_path, temp_path, no_cleanup)
+    update: UpdateEfileState = UpdateEfileState.build(data_path, temp_path, no_cleanup, stream_indices,
+                                                      index_cache=not no_index_cache, full_scan=full_scan,
+                                                      preload_known=preload_known, dedupe_engine=dedupe_engine,
+                                                      pipelined=pipelined, translate_workers=translate_workers,
+                                                      translator=translator, json_backend=json_backend,
+                                                      compact=compact, delta_log=delta_log,
+                                                      composite_store=composite_store, sqlite_shards=sqlite_shards,
+                                                      compress_blobs=compress_blobs, compression=compression,
+                                                      async_s3=async_s3, xml_cache_bytes=xml_cache_bytes,
+                                                      translation_cache=translation_cache, resume=resume)
     update()
+
+@cli.command(name="compact")
+@click.argument('data_path', type=click.Path(exists=True))
+@click.option('--threshold', type=int, default=0, help="Only fold delta logs of at least this many bytes.")
+@click.option('--json_backend', type=click.Choice(JSON_BACKENDS), default=JSON_BACKENDS[0],
+              help="Library for reading and writing JSON. Defaults to the fastest one installed.")
+@click.option('--compact', is_flag=True, help="Write composites without indentation.")
+def compact_composites(data_path: str, threshold: int, json_backend: str, compact: bool):
+    """Fold the delta logs written by "efile --delta_log" back into their composites. Run this before handing the
+    composite files to anything that reads them directly rather than through CompositeStore."""
+    store: CompositeStore = CompositeStore(EINPathManager(data_path), JsonSerializer(json_backend), compact)
+    store.compact_all(threshold)
+
+@cli.command()
+@click.argument('data_path', type=click.Path(exists=True))
+@click.option('--compression', type=click.Choice(COMPRESSIONS), required=True)
+def recompress(data_path: str, compression: str):
+    """Rewrite every composite file with the specified codec. Delta logs are always left uncompressed."""
+    store: CompositeStore = CompositeStore(EINPathManager(data_path))
+    store.recompress(compression)
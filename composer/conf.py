@@ -16,6 +16,62 @@ FILING_NAME = "Filings{}"
 
 DOWNLOAD_TIMEOUT = 10
 
-UPDATE_TIMEOUT = 10
+INDEX_DOWNLOAD_TIMEOUT = 900
+
+UPDATE_TIMEOUT = 60
+
+STAGE_TIMEOUT = 600
+
+STAGE_TIMEOUT_PER_TASK = 1
 
 PUBLIC_XML_NAME = "{}_public.xml"
+
+INDEX_CHUNK_SIZE = 1048576
+
+INDEX_QUEUE_SIZE = 10000
+
+SQLITE_JOURNAL_MODE = "WAL"
+
+SQLITE_SYNCHRONOUS = "NORMAL"
+
+SQLITE_CACHE_SIZE = -262144
+
+PIPELINE_QUEUE_SIZE = 64
+
+TRANSLATE_CHUNK_SIZE = 16
+
+DELTA_FILENAME = "{}.delta.jsonl"
+
+DELTA_COMPACT_BYTES = 1048576
+
+COMPOSITE_DB_NAME = "composites_{}.sqlite"
+
+SQLITE_MAX_VARIABLES = 500
+
+RANGED_GET_THRESHOLD = 8388608
+
+RANGED_GET_PART_SIZE = 8388608
+
+RANGED_GET_WORKERS = 8
+
+ASYNC_MAX_IN_FLIGHT = 256
+
+ADAPTIVE_MAX_IN_FLIGHT = 64
+
+AIMD_DECREASE = 0.5
+
+AIMD_LATENCY_TOLERANCE = 2.0
+
+RETRY_ATTEMPTS = 5
+
+RETRY_BASE_DELAY = 0.2
+
+RETRY_MAX_DELAY = 20
+
+XML_CACHE_DB_NAME = "xml_cache.sqlite"
+
+XML_CACHE_BYTES = 10737418240
+
+TRANSLATION_CACHE_DB_NAME = "translations.sqlite"
+
+JOURNAL_FLUSH_SIZE = 1000
@@ -1,53 +1,163 @@
 import logging
+import os
 from collections.abc import Callable
-from dataclasses import dataclass
-from typing import Iterator, Tuple, Dict, List, Iterable
-import json
+from dataclasses import dataclass, field
+from collections import deque
+from typing import Deque, Iterator, Tuple, Dict, List, Iterable, Optional
 
 from concurrent.futures import Future, as_completed, ThreadPoolExecutor
 
 from composer.aws.efile.filings import RetrieveEfiles
+from composer.aws.efile.xmlcache import XmlCache
 from composer.aws.s3 import Bucket
+from composer.efile.composite import CompositeBackend, CompositeStore, SqliteCompositeStore
+from composer.efile.structures.journal import COMPOSED, RunJournal
 from composer.efile.structures.metadata import FilingMetadata
+from composer.efile.translate_pool import TranslationPool
+from composer.efile.translations import TranslationCache
+from composer.fileio.compression import open_path
 from composer.fileio.paths import EINPathManager
-from composer.conf import MAX_WORKERS, JSON_FILENAME, UPDATE_TIMEOUT
+from composer.fileio.serialize import JsonSerializer
+from composer.pipeline import Stage, run_pipeline
+from composer.scheduler import Deadlines, TaskScheduler
+from composer.conf import MAX_WORKERS, UPDATE_TIMEOUT, PIPELINE_QUEUE_SIZE, DELTA_COMPACT_BYTES
 
 
 @dataclass
 class ComposeEfiles(Callable):
     retrieve: RetrieveEfiles
     path_mgr: EINPathManager
+    pipelined: bool = False
+    serializer: JsonSerializer = field(default_factory=JsonSerializer)
+    compact: bool = False
+    delta_log: bool = False
+    store: Optional[CompositeBackend] = None
+    journal: Optional[RunJournal] = None
 
     @classmethod
-    def build(cls, basepath: str, bucket: Bucket, temp_path: str, no_cleanup: bool) -> "ComposeEfiles":
-        retrieve: RetrieveEfiles = RetrieveEfiles(bucket, temp_path, no_cleanup)
-        path_mgr: EINPathManager = EINPathManager(basepath)
-        return cls(retrieve, path_mgr)
+    def build(cls, basepath: str, bucket: Bucket, temp_path: str, no_cleanup: bool, pipelined: bool = False,
+              translate_workers: Optional[int] = None, translator: str = "xmljson",
+              serializer: Optional[JsonSerializer] = None, compact: bool = False, delta_log: bool = False,
+              composite_store: str = "files", sqlite_shards: int = 1, compress_blobs: bool = False,
+              compression: Optional[str] = None, xml_cache_bytes: int = 0,
+              translation_cache: bool = False) -> "ComposeEfiles":
+        serializer = serializer or JsonSerializer()
+
+        # Zero workers means translating in the calling threads; None means one worker per core
+        translate_pool: Optional[TranslationPool] = None
+        if translate_workers != 0:
+            translate_pool = TranslationPool(translate_workers, engine=translator, json_backend=serializer.backend)
+
+        xml_cache: Optional[XmlCache] = None
+        if xml_cache_bytes > 0:
+            xml_cache = XmlCache(os.path.join(basepath, "xml_cache"), xml_cache_bytes, compression)
+        translations: Optional[TranslationCache] = None
+        if translation_cache:
+            translations = TranslationCache(os.path.join(basepath, "translation_cache"), serializer)
+
+        # Intermediate files are only worth writing if they are to be kept for debugging
+        retrieve: RetrieveEfiles = RetrieveEfiles(bucket, temp_path, no_cleanup, in_memory=not no_cleanup,
+                                                  translate_pool=translate_pool, translator=translator,
+                                                  serializer=serializer, compression=compression,
+                                                  xml_cache=xml_cache, translation_cache=translations)
+        path_mgr: EINPathManager = EINPathManager(basepath, compression)
+        store: Optional[CompositeBackend] = None
+        if composite_store == "sqlite":
+            store = SqliteCompositeStore(os.path.join(basepath, "composites"), sqlite_shards, compress_blobs, serializer)
+        return cls(retrieve, path_mgr, pipelined, serializer, compact, delta_log, store)
+
+    def _updater(self) -> "ComposeEfilesUpdater":
+        return ComposeEfilesUpdater(self.path_mgr, self.serializer, self.compact, self.delta_log, store=self.store,
+                                    journal=self.journal)
+
+    def close(self):
+        self.retrieve.close()
+        if self.store is not None:
+            self.store.close()
 
     def process_all(self, json_changes: Iterable[Tuple[str, Dict[str, str]]]):
-        updater = ComposeEfilesUpdater(self.path_mgr)
+        updater = self._updater()
         
         # NOTE: consider using max_workers setting, set it in conf file. 
         # I don't consider the following block as a cpu-bound, 
         # it contains file i/o operations; even if you process a huge file, 
         # and file translation take a lot of time, file i/o take much
         # biggere time. Consider using ThreadPoolExecutor instead.
+        # Each composite has its own deadline; the stage's grows with the number of composites
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            submit = lambda change: executor.submit(updater.create_or_update, change)
+            for _ in TaskScheduler.fixed(MAX_WORKERS).run(submit, json_changes, Deadlines(task=UPDATE_TIMEOUT)):
+                pass
+
+    def process_pipelined(self, changes: Iterator[Tuple[str, Dict[str, FilingMetadata]]]):
+        """Downloads, converts and composes each EIN's new e-files in a pipeline, so that each composite is written as
+        soon as its own filings are converted rather than after every filing has been. Bounded queues between the
+        stages limit how many EINs' temporary files exist at once."""
+        updater = self._updater()
+
+        def compose_one(change: Tuple[str, Dict[str, FilingMetadata]]):
+            updater.create_or_update(self.retrieve.json_paths_for(change))
+            self.retrieve.discard_one(change)
+
+        stages: List[Stage]
+        if self.retrieve.in_memory:
+            stages = [
+                Stage("download", self.retrieve.fetch_one, MAX_WORKERS),
+                Stage("convert", self.retrieve.translate_one, MAX_WORKERS),
+                Stage("compose", updater.apply, MAX_WORKERS)
+            ]
+        else:
+            stages = [
+                Stage("download", self.retrieve.download_one, MAX_WORKERS),
+                Stage("convert", self.retrieve.convert_one, MAX_WORKERS),
+                Stage("compose", compose_one, MAX_WORKERS)
+            ]
+        run_pipeline(changes, stages, PIPELINE_QUEUE_SIZE)
+
+    def process_in_memory(self, changes: Iterator[Tuple[str, Dict[str, FilingMetadata]]]):
+        """Downloads, translates and composes each EIN's new e-files without writing any intermediate files."""
+        updater = self._updater()
+
+        def process_fetched(fetched: Tuple[str, Dict[str, FilingMetadata], Dict[str, bytes]]):
+            updater.apply(self.retrieve.translate_one(fetched))
+
+        # Downloads are scheduled by the retriever, so the threads only translate and compose. Fetching waits on them
+        # whenever more than two EINs per thread are queued, so as to bound memory.
         exceptions = []
         with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            futures = [executor.submit(updater.create_or_update, change) for change in json_changes]
-            for future in as_completed(futures, timeout=UPDATE_TIMEOUT):
+            window: Deque[Future] = deque()
+            for fetched in self.retrieve.fetch_all(changes):
+                window.append(executor.submit(process_fetched, fetched))
+                if len(window) > MAX_WORKERS * 2:
+                    oldest: Future = window.popleft()
+                    if oldest.exception() is not None:
+                        exceptions.append(oldest.exception())
+            futures = list(window)
+            for future in as_completed(futures):
                 if future.exception() is not None:
                     exceptions.append(future.exception())
 
         if len(exceptions) > 0:
             raise exceptions[0]
 
-    def __call__(self, changes: Iterator[Tuple[str, Dict[str, FilingMetadata]]]):
+    def __call__(self, changes: Iterator[Tuple[str, Dict[str, FilingMetadata]]], journal: Optional[RunJournal] = None):
         """Iterate over EINs flagged as having one or more new e-files since the last update. For each one, create or
         update its composite with the new data.
 
         :param changes: Iterator of (EIN, dictionary of (filing period -> Filing)).
+        :param journal: If supplied, records each filing's progress through downloading, translating and composing.
         """
+        self.journal = journal
+        self.retrieve.journal = journal
+        if self.pipelined:
+            logging.info("Retrieving e-files and updating composites.")
+            self.process_pipelined(changes)
+            return
+
+        if self.retrieve.in_memory:
+            logging.info("Retrieving e-files and updating composites.")
+            self.process_in_memory(changes)
+            return
 
         change_list: List = list(changes)
         json_changes: Iterable[Tuple[str, Dict[str, str]]] = list(self.retrieve(change_list))
@@ -58,21 +168,38 @@ class ComposeEfiles(Callable):
 
 @dataclass
 class ComposeEfilesUpdater:
+    """Adds new periods to composites. By default each composite is rewritten in full. With a delta log, only the new
+    periods are written, and the log is folded back into the composite once it reaches `compact_threshold` bytes."""
     path_mgr: EINPathManager
+    serializer: JsonSerializer = field(default_factory=JsonSerializer)
+    compact: bool = False
+    delta_log: bool = False
+    compact_threshold: int = DELTA_COMPACT_BYTES
+    store: Optional[CompositeBackend] = None
+    journal: Optional[RunJournal] = None
+
+    def __post_init__(self):
+        if self.store is None:
+            self.store = CompositeStore(self.path_mgr, self.serializer, self.compact)
 
-    def _get_existing(self, ein: str) -> Dict:
-        try:
-            with self.path_mgr.open_for_reading(ein, JSON_FILENAME) as fh:
-                return json.load(fh)
-        except FileNotFoundError:
-            return {}
+    def apply(self, change: Tuple[str, Dict[str, Dict]]):
+        """Adds or replaces periods in an EIN's composite, given a map of period -> translated content."""
+        ein, contents = change
+        if self.delta_log:
+            if self.store.append(ein, contents) >= self.compact_threshold:
+                self.store.compact_one(ein)
+        else:
+            composite: Dict = self.store.read(ein)
+            for period, content in contents.items():
+                composite[period] = content
+            self.store.write(ein, composite)
+        if self.journal is not None:
+            self.journal.mark(COMPOSED, ein, contents.keys())
 
     def create_or_update(self, change: Tuple[str, Dict[str, str]]):
         ein, updates = change
-        composite: Dict = self._get_existing(ein)
+        contents: Dict[str, Dict] = {}
         for period, json_path in updates.items():
-            with open(json_path) as fh:
-                content: Dict = json.load(fh)
-            composite[period] = content
-        with self.path_mgr.open_for_writing(ein, JSON_FILENAME) as fh:
-            json.dump(composite, fh, indent=2)
+            with open_path(json_path, "rb") as fh:
+                contents[period] = self.serializer.loads(fh.read())
+        self.apply((ein, contents))
@@ -0,0 +1,285 @@
+"""Storage for e-file composites, keyed by EIN. By default (CompositeStore), each EIN has a base composite, {ein}.json,
+and optionally a delta log, {ein}.delta.jsonl, holding periods added or replaced since the base was last written, one
+JSON object per line. The composite is the base with each line of the log applied in order, so composites should be
+read through the store: opening {ein}.json directly (with EINPathManager.open_for_reading, say) misses whatever is still
+in the log. Delta logs are never compressed, whatever the codec of the base, since a compressed log cut off part way
+through an append could not be read past the break or appended to again. Alternatively (SqliteCompositeStore),
+composites are kept as blobs in one or more SQLite databases."""
+import logging
+import os
+import zlib
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from sqlite3 import Connection, connect
+from threading import Lock
+from typing import IO, Dict, Iterator, Tuple, List, Iterable, Optional
+
+from composer.conf import JSON_FILENAME, DELTA_FILENAME, COMPOSITE_DB_NAME, SQLITE_MAX_VARIABLES
+from composer.efile.structures.sqlite import configure_connection
+from composer.fileio.compression import compression_of
+from composer.fileio.paths import EINPathManager
+from composer.fileio.serialize import DECODE_ERRORS, JsonSerializer
+
+class CompositeBackend(ABC):
+    @abstractmethod
+    def read(self, ein: str) -> Dict:
+        """The EIN's composite, or an empty dict if it has none."""
+        pass
+
+    @abstractmethod
+    def write(self, ein: str, composite: Dict):
+        pass
+
+    def read_many(self, eins: Iterable[str]) -> Dict[str, Dict]:
+        """Map of EIN -> composite for those of the EINs that have one."""
+        composites: Dict[str, Dict] = {}
+        for ein in eins:
+            composite: Dict = self.read(ein)
+            if composite:
+                composites[ein] = composite
+        return composites
+
+    def write_many(self, composites: Iterable[Tuple[str, Dict]]):
+        for ein, composite in composites:
+            self.write(ein, composite)
+
+    def append(self, ein: str, contents: Dict) -> int:
+        """Adds or replaces periods in the EIN's composite. Returns the size of any delta log left to be compacted."""
+        composite: Dict = self.read(ein)
+        composite.update(contents)
+        self.write(ein, composite)
+        return 0
+
+    def compact_one(self, ein: str):
+        pass
+
+    def compact_all(self, threshold: int = 0) -> int:
+        return 0
+
+    def close(self):
+        pass
+
+@dataclass
+class CompositeStore(CompositeBackend):
+    """Composites as files under `path_mgr`. If the manager has no codec of its own (compression=None, as opposed to
+    "none"), each base composite is rewritten in whatever codec it already has."""
+    path_mgr: EINPathManager
+    serializer: JsonSerializer = field(default_factory=JsonSerializer)
+    compact: bool = False
+    _deltas: EINPathManager = field(init=False, default=None)
+    _by_codec: Dict[str, EINPathManager] = field(init=False, default_factory=dict)
+
+    def __post_init__(self):
+        self._deltas = EINPathManager(self.path_mgr.basepath)
+
+    def _base_mgr(self, ein: str) -> EINPathManager:
+        if self.path_mgr.compression is not None:
+            return self.path_mgr
+        existing: Optional[str] = self.path_mgr.locate(ein, JSON_FILENAME)
+        if existing is None:
+            return self.path_mgr
+        compression: str = compression_of(existing)
+        if compression not in self._by_codec:
+            self._by_codec[compression] = EINPathManager(self.path_mgr.basepath, compression)
+        return self._by_codec[compression]
+
+    def _read_base(self, ein: str) -> Dict:
+        try:
+            with self.path_mgr.open_for_reading(ein, JSON_FILENAME, binary=True) as fh:
+                return self.serializer.loads(fh.read())
+        except FileNotFoundError:
+            return {}
+
+    def _read_deltas(self, ein: str) -> Iterator[Dict]:
+        try:
+            fh: IO = self.path_mgr.open_for_reading(ein, DELTA_FILENAME, binary=True)
+        except FileNotFoundError:
+            return
+        lines: List[bytes] = []
+        with fh:
+            try:
+                for line in fh:
+                    lines.append(line)
+            except EOFError:
+                # A compressed log, from an earlier version, whose last append was cut off part way through
+                logging.warning("Delta log of %s ends part way through a compressed block; ignoring the rest." % ein)
+        for line in lines:
+            # A line without a newline was cut off part way through being appended, so was never applied
+            if not line.endswith(b"\n"):
+                continue
+            try:
+                delta: Dict = self.serializer.loads(line)
+            except DECODE_ERRORS:
+                logging.warning("Skipping an unreadable line in the delta log of %s." % ein)
+                continue
+            yield delta
+
+    def read(self, ein: str) -> Dict:
+        composite: Dict = self._read_base(ein)
+        for delta in self._read_deltas(ein):
+            composite.update(delta)
+        return composite
+
+    def write(self, ein: str, composite: Dict):
+        """Replaces the base composite, then discards the delta log, whose contents the new base must include. The new
+        base only takes the old one's place once it is complete, so if interrupted, the old base and log remain."""
+        # Compact composites are about half the size, but indented ones are easier to inspect by hand
+        with self._base_mgr(ein).open_for_writing(ein, JSON_FILENAME, binary=True) as fh:
+            fh.write(self.serializer.dumps(composite, indent=not self.compact))
+        self.path_mgr.remove(ein, DELTA_FILENAME)
+
+    def append(self, ein: str, contents: Dict) -> int:
+        """Appends a map of period -> content to the EIN's delta log. Returns the size of the log afterwards."""
+        existing: Optional[str] = self.path_mgr.locate(ein, DELTA_FILENAME)
+        if existing is not None and compression_of(existing) != "none":
+            # Logs compressed by an earlier version are folded into the base rather than appended to
+            self.compact_one(ein)
+        self._drop_partial_line(ein)
+        with self._deltas.open_for_writing(ein, DELTA_FILENAME, binary=True, append=True) as fh:
+            fh.write(self.serializer.dumps(contents) + b"\n")
+        return self._deltas.size(ein, DELTA_FILENAME)
+
+    def _drop_partial_line(self, ein: str):
+        """Cuts off a line left without its newline by an append that was interrupted, which would otherwise run into
+        the next one."""
+        path: Optional[str] = self._deltas.locate(ein, DELTA_FILENAME)
+        if path is None:
+            return
+        with open(path, "r+b") as fh:
+            size: int = fh.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            fh.seek(size - 1)
+            if fh.read(1) == b"\n":
+                return
+            fh.seek(0)
+            fh.truncate(fh.read().rfind(b"\n") + 1)
+        logging.warning("Dropped an incomplete line from the end of the delta log of %s." % ein)
+
+    def compact_one(self, ein: str):
+        """Folds the EIN's delta log into its base composite. If interrupted, the log is simply applied again."""
+        self.write(ein, self.read(ein))
+
+    def recompress(self, compression: Optional[str]) -> int:
+        """Rewrites every composite with the specified codec, first folding in any delta logs compressed by an earlier
+        version. Returns the number of files rewritten."""
+        n_rewritten: int = 0
+        for ein, path in list(self.path_mgr.files(DELTA_FILENAME)):
+            if compression_of(path) != "none":
+                self.compact_one(ein)
+                n_rewritten += 1
+        n_rewritten += self.path_mgr.recompress(JSON_FILENAME, compression)
+        logging.info("Rewrote {:,} composite files.".format(n_rewritten))
+        return n_rewritten
+
+    def _delta_logs(self) -> Iterator[Tuple[str, int]]:
+        for ein, path in self.path_mgr.files(DELTA_FILENAME):
+            yield ein, os.path.getsize(path)
+
+    def compact_all(self, threshold: int = 0) -> int:
+        """Folds every delta log of at least `threshold` bytes into its base composite. Returns the number folded."""
+        n_compacted: int = 0
+        for ein, size in list(self._delta_logs()):
+            if size >= threshold:
+                self.compact_one(ein)
+                n_compacted += 1
+        logging.info("Compacted {:,} composite delta logs.".format(n_compacted))
+        return n_compacted
+
+@dataclass
+class SqliteCompositeStore(CompositeBackend):
+    """Keeps composites as JSON blobs, optionally zlib-compressed, in `shards` SQLite databases under `basepath`. Each
+    database has its own connection and lock, so writers to different shards do not wait for one another."""
+    basepath: str
+    shards: int = 1
+    compress: bool = False
+    serializer: JsonSerializer = field(default_factory=JsonSerializer)
+    _conns: List[Connection] = field(init=False, default_factory=list)
+    _locks: List[Lock] = field(init=False, default_factory=list)
+
+    def __post_init__(self):
+        os.makedirs(self.basepath, exist_ok=True)
+        for shard in range(self.shards):
+            db_path: str = os.path.join(self.basepath, COMPOSITE_DB_NAME.format(shard))
+            conn: Connection = configure_connection(connect(db_path, check_same_thread=False))
+            conn.execute("CREATE TABLE IF NOT EXISTS composites (ein TEXT PRIMARY KEY, body BLOB NOT NULL)")
+            conn.commit()
+            self._conns.append(conn)
+            self._locks.append(Lock())
+
+    def _shard(self, ein: str) -> int:
+        return zlib.crc32(ein.encode("ascii")) % self.shards
+
+    def _encode(self, composite: Dict) -> bytes:
+        encoded: bytes = self.serializer.dumps(composite)
+        return zlib.compress(encoded) if self.compress else encoded
+
+    def _decode(self, body: bytes) -> Dict:
+        # Blobs written before compression was turned on (or off) remain readable
+        if not body.startswith(b"{"):
+            body = zlib.decompress(body)
+        return self.serializer.loads(body)
+
+    def _by_shard(self, eins: Iterable[str]) -> Dict[int, List[str]]:
+        grouped: Dict[int, List[str]] = {}
+        for ein in eins:
+            grouped.setdefault(self._shard(ein), []).append(ein)
+        return grouped
+
+    def _read_unlocked(self, shard: int, ein: str) -> Dict:
+        row = self._conns[shard].execute("SELECT body FROM composites WHERE ein = ?", (ein,)).fetchone()
+        return self._decode(row[0]) if row is not None else {}
+
+    def _write_unlocked(self, shard: int, ein: str, composite: Dict):
+        with self._conns[shard]:
+            self._conns[shard].execute("INSERT OR REPLACE INTO composites VALUES (?, ?)", (ein, self._encode(composite)))
+
+    def read(self, ein: str) -> Dict:
+        shard: int = self._shard(ein)
+        with self._locks[shard]:
+            return self._read_unlocked(shard, ein)
+
+    def write(self, ein: str, composite: Dict):
+        shard: int = self._shard(ein)
+        with self._locks[shard]:
+            self._write_unlocked(shard, ein, composite)
+
+    def append(self, ein: str, contents: Dict) -> int:
+        """Read, merge and write happen under the shard's lock, so concurrent appends to one EIN cannot lose periods."""
+        shard: int = self._shard(ein)
+        with self._locks[shard]:
+            composite: Dict = self._read_unlocked(shard, ein)
+            composite.update(contents)
+            self._write_unlocked(shard, ein, composite)
+        return 0
+
+    def read_many(self, eins: Iterable[str]) -> Dict[str, Dict]:
+        composites: Dict[str, Dict] = {}
+        for shard, shard_eins in self._by_shard(eins).items():
+            for start in range(0, len(shard_eins), SQLITE_MAX_VARIABLES):
+                batch: List[str] = shard_eins[start:start + SQLITE_MAX_VARIABLES]
+                query: str = "SELECT ein, body FROM composites WHERE ein IN (%s)" % ", ".join("?" * len(batch))
+                with self._locks[shard]:
+                    rows: List[Tuple[str, bytes]] = self._conns[shard].execute(query, batch).fetchall()
+                for ein, body in rows:
+                    composites[ein] = self._decode(body)
+        return composites
+
+    def write_many(self, composites: Iterable[Tuple[str, Dict]]):
+        """Writes each shard's composites in a single transaction."""
+        encoded: Dict[int, List[Tuple[str, bytes]]] = {}
+        for ein, composite in composites:
+            encoded.setdefault(self._shard(ein), []).append((ein, self._encode(composite)))
+        for shard, rows in encoded.items():
+            with self._locks[shard], self._conns[shard]:
+                self._conns[shard].executemany("INSERT OR REPLACE INTO composites VALUES (?, ?)", rows)
+
+    def eins(self) -> Iterator[str]:
+        for shard, conn in enumerate(self._conns):
+            with self._locks[shard]:
+                shard_eins: List[str] = [row[0] for row in conn.execute("SELECT ein FROM composites")]
+            yield from shard_eins
+
+    def close(self):
+        for conn in self._conns:
+            conn.close()
@@ -2,6 +2,10 @@
 import copy
 from datetime import datetime
 
+from typing import IO, Dict, List
+
+from lxml.etree import iterparse, _Element as Element
+
 def convert(json_in: dict) -> dict:
     parent_dict, local_dict = _convert(json_in, "")
     return local_dict
@@ -40,3 +44,70 @@ def _convert(json_in: dict, parent: str) -> (dict, dict):
 
 
 
+
+def convert_element(root: Element) -> dict:
+    """Converts a (cleaned) lxml element straight to the format used by Polytropos, in a single walk of the tree. The
+    result is the same as convert(MongoFish.data(root)), without building the intermediate BadgerFish representation
+    or copying every subtree at every level."""
+    hoisted, local = _convert_element(root)
+    return _with_hoisted({root.tag: local} if local else {}, hoisted)
+
+def convert_stream(source: IO[bytes]) -> dict:
+    """Same as convert_element, but parses the (cleaned) document incrementally and discards each element once it has
+    been converted, so that only the elements on the path to the current one are held in memory at any time."""
+    # Each frame holds the converted children of an element that is still open, grouped by tag
+    stack: List[Dict[str, list]] = [{}]
+    for event, element in iterparse(source, events=("start", "end"), huge_tree=True):
+        if event == "start":
+            stack.append({})
+            continue
+        groups: Dict[str, list] = stack.pop()
+        stack[-1].setdefault(element.tag, []).append((_hoisted(element), _combine(groups)))
+
+        # Text and attributes have been read, so the element (and any earlier siblings) can go
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+    root_tag, results = next(iter(stack[0].items()))
+    hoisted, local = results[0]
+    return _with_hoisted({root_tag: local} if local else {}, hoisted)
+
+def _hoisted(element: Element) -> list:
+    """The (key, value) pairs that an element contributes to its parent: its attributes and its text."""
+    tag: str = element.tag
+    hoisted: list = [(tag + "@" + attr, value) for attr, value in element.attrib.items()]
+    text: str = element.text
+    if text and text.strip():
+        hoisted.append((tag, text))
+    return hoisted
+
+def _convert_element(element: Element) -> (list, dict):
+    """Returns the element's contribution to its parent (see _hoisted), along with the element's own contents."""
+    # Children are grouped by tag, in order of first occurrence
+    groups: Dict[str, list] = {}
+    for child in element:
+        if isinstance(child.tag, str):
+            groups.setdefault(child.tag, []).append(_convert_element(child))
+    return _hoisted(element), _combine(groups)
+
+def _combine(groups: Dict[str, list]) -> dict:
+    """Builds an element's contents from its converted children, grouped by tag. Tags that occur more than once become
+    lists."""
+    local: dict = {}
+    from_children: list = []
+    for child_tag, results in groups.items():
+        if len(results) == 1:
+            child_hoisted, child_local = results[0]
+            if child_local:
+                local[child_tag] = child_local
+            from_children.extend(child_hoisted)
+        else:
+            # As in _convert, the attributes and text of repeated elements are dropped
+            local[child_tag] = [child_local for _, child_local in results]
+    return _with_hoisted(local, from_children)
+
+def _with_hoisted(local: dict, hoisted: list) -> dict:
+    # A hoisted key replaces an existing entry in place; otherwise it goes after the elements that were kept
+    for key, value in hoisted:
+        local[key] = value
+    return local
@@ -0,0 +1,95 @@
+"""Vectorized alternative to staging e-file index entries one at a time with EfileMetadataIndex.add. Intended for
+rebuilds from the full history, where the per-row path spends most of its time in Python comparisons and SQLite probes.
+It is several times faster than that path, but no faster than the per-row path with known filings preloaded
+(--preload_known), and slower than it when rescanning a history already recorded. Requires pandas."""
+import logging
+from typing import Iterable, List, Set
+
+import numpy as np
+import pandas as pd
+
+from composer.efile.structures.mdindex import EfileMetadataIndex
+from composer.efile.structures.metadata import FilingMetadata
+
+RANKED_COLUMNS: List[str] = ["record_id", "irs_efile_id", "date_submitted", "date_uploaded"]
+
+def _ranks(values: pd.Series) -> np.ndarray:
+    """Integer codes that sort in the same order as the (string) values."""
+    codes, _ = pd.factorize(values, sort=True)
+    return codes
+
+def _is_kept(candidates: pd.DataFrame) -> np.ndarray:
+    """Flags the filing that EfileMetadataIndex.add would keep for each record ID: the latest submission, then the
+    latest upload, then (on a full tie) whichever was seen last. Existing filings have an arrival order of -1, so a new
+    filing with identical dates replaces them, as it does in add()."""
+    record_ids: np.ndarray = pd.factorize(candidates["record_id"])[0]
+    order: np.ndarray = np.lexsort((
+        candidates["arrival"].to_numpy(),
+        _ranks(candidates["date_uploaded"]),
+        _ranks(candidates["date_submitted"]),
+        record_ids
+    ))
+    grouped: np.ndarray = record_ids[order]
+    last_in_group: np.ndarray = np.append(grouped[1:] != grouped[:-1], True)
+    is_kept: np.ndarray = np.empty(len(candidates), dtype=bool)
+    is_kept[order] = last_in_group
+    return is_kept
+
+def _known_ids(md_index: EfileMetadataIndex) -> Set[str]:
+    known: Set[str] = set(md_index.latest_filings.irs_efile_ids)
+    known.update(md_index.duplicates.irs_efile_ids)
+    return known
+
+def _new_columns(filings: List[FilingMetadata]) -> pd.DataFrame:
+    return pd.DataFrame({
+        "record_id": [filing.record_id for filing in filings],
+        "irs_efile_id": [filing.irs_efile_id for filing in filings],
+        "date_submitted": [filing.date_submitted for filing in filings],
+        "date_uploaded": [filing.date_uploaded for filing in filings],
+        "arrival": np.arange(len(filings))
+    })
+
+def stage_columnar(md_index: EfileMetadataIndex, filings: Iterable[FilingMetadata]):
+    """Stages all of the filings at once, with the same outcome as calling md_index.add on each of them in turn.
+    Nothing may already be staged."""
+    assert len(md_index.staged_dupes) == 0 and not any(md_index.staged_changes.values())
+
+    filings = list(filings)
+    logging.info("Loaded {:,} e-File index entries into columns.".format(len(filings)))
+    if len(filings) == 0:
+        return
+
+    # add() leaves an entry in staged_changes for every EIN it considers, even when nothing changes
+    for ein in {filing.ein for filing in filings}:
+        md_index.staged_changes[ein]
+
+    new: pd.DataFrame = _new_columns(filings)
+    new = new.drop_duplicates("irs_efile_id", keep="first")
+    new = new[~new["irs_efile_id"].isin(_known_ids(md_index))]
+    if len(new) == 0:
+        return
+
+    # Only the columns needed to rank filings are read for the whole table, which keeps memory in check for a full
+    # history; whole rows are fetched only for the few filings displaced
+    query: str = "SELECT %s FROM %s" % (", ".join(RANKED_COLUMNS), md_index.latest_filings.table_name)
+    existing: pd.DataFrame = pd.read_sql_query(query, md_index.latest_filings.conn)
+    existing = existing[existing["record_id"].isin(new["record_id"])].assign(arrival=-1)
+
+    candidates: pd.DataFrame = pd.concat([existing[new.columns], new], ignore_index=True)
+    is_kept: np.ndarray = _is_kept(candidates)
+    arrival: np.ndarray = candidates["arrival"].to_numpy()
+
+    # Filings from the index are staged as the very objects that were passed in; only displaced existing filings
+    # need to be fetched again, whole
+    losers: pd.Series = candidates["irs_efile_id"][~is_kept]
+    for irs_efile_id in existing["irs_efile_id"][existing["irs_efile_id"].isin(losers)].tolist():
+        for displaced in md_index.latest_filings.filings_by_irs_efile_id(irs_efile_id):
+            md_index.staged_dupes[displaced.irs_efile_id] = displaced
+
+    for i in arrival[~is_kept & (arrival >= 0)].tolist():
+        filing: FilingMetadata = filings[i]
+        md_index.staged_dupes[filing.irs_efile_id] = filing
+
+    for i in arrival[is_kept & (arrival >= 0)].tolist():
+        filing = filings[i]
+        md_index.staged_changes[filing.ein][filing.period] = filing
@@ -0,0 +1,161 @@
+import logging
+from dataclasses import dataclass, field
+from sqlite3 import Connection, Cursor
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+from composer.efile.structures.mdindex import EfileMetadataIndex
+from composer.efile.structures.metadata import FilingMetadata
+from composer.efile.structures.watermark import Watermark
+from composer.conf import JOURNAL_FLUSH_SIZE
+
+PLANNED, DOWNLOADED, TRANSLATED, COMPOSED = 0, 1, 2, 3
+
+STAGE_NAMES: Dict[int, str] = {PLANNED: "planned", DOWNLOADED: "downloaded", TRANSLATED: "translated",
+                               COMPOSED: "composed"}
+
+def init_journal_tables(conn: Connection):
+    """Creates the journal tables if they are not already present, so that older state databases gain them in place."""
+    cursor: Cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS journal_filings (
+            record_id text NOT NULL,
+            irs_efile_id text PRIMARY KEY,
+            irs_dln text NOT NULL,
+            ein text NOT NULL,
+            period text NOT NULL,
+            name_org text NOT NULL,
+            form_type text NOT NULL,
+            date_submitted text NOT NULL,
+            date_uploaded text NOT NULL,
+            date_downloaded text NOT NULL,
+            url text NOT NULL,
+            duplicate integer NOT NULL,
+            stage integer NOT NULL
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_journal_filings_ein_period ON journal_filings(ein, period);")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS journal_watermarks (
+            year integer PRIMARY KEY,
+            entry_count integer NOT NULL,
+            last_irs_efile_id text NOT NULL
+        );
+    """)
+    conn.commit()
+
+@dataclass
+class RunJournal:
+    """Records, in the state database, what the current update is to commit and how far each of its new filings has
+    got (downloaded, translated, composed). If the update dies before committing, the next one can be resumed from the
+    journal: the same changes are staged again without scanning the indices, and filings already composed are skipped.
+
+    Progress is recorded from many threads at once, so marks are buffered and written `flush_size` at a time; those
+    lost in a crash only mean a little work is done twice. Composing is idempotent, and a composite is never left part
+    written (files are only moved into place once complete), so that is always safe."""
+    conn: Connection
+    flush_size: int = JOURNAL_FLUSH_SIZE
+    composed: Set[Tuple[str, str]] = field(init=False, default_factory=set)
+    _marks: List[Tuple[int, str, str]] = field(init=False, default_factory=list)
+    _lock: Lock = field(init=False, default_factory=Lock)
+
+    def __post_init__(self):
+        init_journal_tables(self.conn)
+
+    @property
+    def in_progress(self) -> bool:
+        """True if an earlier update began but never finished."""
+        cursor: Cursor = self.conn.cursor()
+        for table in ["journal_filings", "journal_watermarks"]:
+            if cursor.execute("SELECT 1 FROM %s LIMIT 1" % table).fetchone() is not None:
+                return True
+        return False
+
+    def _clear(self):
+        self.conn.execute("DELETE FROM journal_filings")
+        self.conn.execute("DELETE FROM journal_watermarks")
+
+    def begin(self, md_index: EfileMetadataIndex):
+        """Records the changes staged in the index as the plan for this update, replacing any earlier one."""
+        query: str = "INSERT INTO journal_filings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        with self._lock, self.conn:
+            self._clear()
+            dupes: Iterator[FilingMetadata] = iter(md_index.staged_dupes.values())
+            changes: Iterator[FilingMetadata] = (filing for updates in md_index.staged_changes.values()
+                                                 for filing in updates.values())
+            self.conn.executemany(query, (filing.as_tuple() + (1, PLANNED) for filing in dupes))
+            self.conn.executemany(query, (filing.as_tuple() + (0, PLANNED) for filing in changes))
+            self.conn.executemany("INSERT INTO journal_watermarks VALUES (?, ?, ?)",
+                                  ((w.year, w.entry_count, w.last_irs_efile_id)
+                                   for w in md_index.staged_watermarks.values()))
+        self.composed.clear()
+
+    def restore(self, md_index: EfileMetadataIndex):
+        """Stages the plan of an unfinished update in the index, as if its indices had just been scanned again."""
+        cursor: Cursor = self.conn.cursor()
+        for row in cursor.execute("SELECT * FROM journal_filings"):
+            filing: FilingMetadata = FilingMetadata(*row[:11])
+            if row[11]:
+                md_index.staged_dupes[filing.irs_efile_id] = filing
+                continue
+            md_index.staged_changes[filing.ein][filing.period] = filing
+            if row[12] >= COMPOSED:
+                self.composed.add((filing.ein, filing.period))
+        for row in cursor.execute("SELECT year, entry_count, last_irs_efile_id FROM journal_watermarks"):
+            md_index.staged_watermarks[row[0]] = Watermark(*row)
+
+    def progress(self) -> Dict[str, int]:
+        """Number of new filings that have reached each stage (and no further)."""
+        self.flush()
+        counts: Dict[str, int] = {name: 0 for name in STAGE_NAMES.values()}
+        query: str = "SELECT stage, COUNT(*) FROM journal_filings WHERE duplicate = 0 GROUP BY stage"
+        for stage, count in self.conn.execute(query):
+            counts[STAGE_NAMES[stage]] = count
+        return counts
+
+    def pending(self, changes: Iterable[Tuple[str, Dict[str, FilingMetadata]]]) \
+            -> Iterator[Tuple[str, Dict[str, FilingMetadata]]]:
+        """Leaves out of the changes any filings already composed by an earlier attempt at this update."""
+        if not self.composed:
+            yield from changes
+            return
+        for ein, updates in changes:
+            remaining: Dict[str, FilingMetadata] = {period: filing for period, filing in updates.items()
+                                                    if (ein, period) not in self.composed}
+            if remaining:
+                yield ein, remaining
+
+    def mark(self, stage: int, ein: str, periods: Iterable[str]):
+        """Records that an EIN's filings for the given periods have reached a stage."""
+        with self._lock:
+            self._marks.extend((stage, ein, period) for period in periods)
+            if len(self._marks) < self.flush_size:
+                return
+            self._flush_unlocked()
+
+    def _flush_unlocked(self):
+        if not self._marks:
+            return
+        with self.conn:
+            self.conn.executemany("UPDATE journal_filings SET stage = MAX(stage, ?) "
+                                  "WHERE ein = ? AND period = ? AND duplicate = 0", self._marks)
+        self._marks.clear()
+
+    def flush(self):
+        with self._lock:
+            self._flush_unlocked()
+
+    def finish(self):
+        """Clears the journal once the update has been committed."""
+        with self._lock, self.conn:
+            self._marks.clear()
+            self._clear()
+        self.composed.clear()
+
+    def close(self):
+        """Writes any outstanding marks, so that an update that fails keeps the progress it made."""
+        try:
+            self.flush()
+        except Exception as e:
+            logging.warning("Could not record update progress: %s" % e)
+        self.conn.close()
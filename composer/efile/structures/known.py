@@ -0,0 +1,50 @@
+import logging
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Set, Tuple, Union
+
+from composer.efile.structures.metadata import FilingMetadata
+from composer.efile.structures.sqlite import EfileIndexTable
+
+CompactId = Union[int, str]
+
+def _compact_id(irs_efile_id: str) -> CompactId:
+    """IRS ObjectIds are 18-digit numbers, which take far less room as ints than as strings."""
+    if irs_efile_id.isdigit() and irs_efile_id[0] != "0":
+        return int(irs_efile_id)
+    return irs_efile_id
+
+@dataclass
+class KnownFilings:
+    """In-memory snapshot of which e-files the state database already knows about, and of the submission and upload
+    dates of the latest filing for each EIN/period. Answers the questions asked of the database for every index entry
+    without touching SQLite."""
+    irs_efile_ids: Set[CompactId] = field(default_factory=set)
+    latest_dates: Dict[str, Tuple[str, str]] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, latest_filings: EfileIndexTable, duplicates: EfileIndexTable) -> "KnownFilings":
+        logging.info("Preloading known e-files from state database.")
+        known: "KnownFilings" = cls()
+        for irs_efile_id in latest_filings.irs_efile_ids:
+            known.irs_efile_ids.add(_compact_id(irs_efile_id))
+        for irs_efile_id in duplicates.irs_efile_ids:
+            known.irs_efile_ids.add(_compact_id(irs_efile_id))
+        for record_id, date_submitted, date_uploaded in latest_filings.latest_dates:
+            known.latest_dates[record_id] = (sys.intern(date_submitted), sys.intern(date_uploaded))
+        logging.info("Preloaded {:,} known e-files.".format(len(known.irs_efile_ids)))
+        return known
+
+    def contains(self, irs_efile_id: str) -> bool:
+        return _compact_id(irs_efile_id) in self.irs_efile_ids
+
+    def latest_dates_for(self, record_id: str) -> Optional[Tuple[str, str]]:
+        """Submission and upload dates of the latest known filing for an EIN/period, if there is one."""
+        return self.latest_dates.get(record_id)
+
+    def record_latest(self, filing: FilingMetadata):
+        self.irs_efile_ids.add(_compact_id(filing.irs_efile_id))
+        self.latest_dates[filing.record_id] = (sys.intern(filing.date_submitted), sys.intern(filing.date_uploaded))
+
+    def record_duplicate(self, filing: FilingMetadata):
+        self.irs_efile_ids.add(_compact_id(filing.irs_efile_id))
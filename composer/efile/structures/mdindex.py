@@ -2,31 +2,61 @@ import logging
 import sqlite3
 from collections import defaultdict, deque
 from dataclasses import field, dataclass
-from typing import Iterator, Dict, Tuple, List, Deque
+from typing import Iterator, Dict, Tuple, List, Deque, Optional
 
+from composer.efile.structures.known import KnownFilings
 from composer.efile.structures.metadata import FilingMetadata
 from composer.efile.structures.sqlite import EfileIndexTable
+from composer.efile.structures.watermark import Watermark, WatermarkTable, init_watermark_table
+
+def _superseded(filing: FilingMetadata, date_submitted: str, date_uploaded: str) -> bool:
+    """True if a filing with the given submission and upload dates should be kept in preference to `filing`."""
+    if date_submitted > filing.date_submitted:
+        return True
+    return date_submitted == filing.date_submitted and date_uploaded > filing.date_uploaded
 
 @dataclass
 class EfileMetadataIndex:
     """SQLite-backed index of:
         (1) latest e-files for each EIN/period combination.
         (2) known duplicates of any EIN/period combinations.
+        (3) how far into each year's e-file index the last committed update got.
 
         Stages change information and commits on demand.
     """
 
     duplicates: EfileIndexTable
     latest_filings: EfileIndexTable
+    watermarks: Optional[WatermarkTable] = None
+    known_filings: Optional[KnownFilings] = None
     staged_changes: Dict[str, Dict[str, FilingMetadata]] = field(default_factory=lambda: defaultdict(dict), init=False)
     staged_dupes: Dict[str, FilingMetadata] = field(default_factory=dict, init=False)
+    staged_watermarks: Dict[int, Watermark] = field(default_factory=dict, init=False)
 
     @classmethod
-    def build(cls, conn: sqlite3.Connection) -> "EfileMetadataIndex":
+    def build(cls, conn: sqlite3.Connection, preload: bool = False) -> "EfileMetadataIndex":
+        """
+        :param conn: Connection to the state database.
+        :param preload: If true, reads the identifiers and dates of all known filings into memory up front, rather than
+        querying the database for each filing that is added.
+        """
         logging.info("Initializing online metadata index.")
         duplicates: EfileIndexTable = EfileIndexTable(conn, "duplicates")
         latest_filings: EfileIndexTable = EfileIndexTable(conn, "latest_filings")
-        return cls(duplicates, latest_filings)
+        init_watermark_table(conn)
+        watermarks: WatermarkTable = WatermarkTable(conn)
+        known_filings: Optional[KnownFilings] = KnownFilings.load(latest_filings, duplicates) if preload else None
+        return cls(duplicates, latest_filings, watermarks, known_filings)
+
+    def committed_watermarks(self) -> Dict[int, Watermark]:
+        """Per-year watermarks as of the last commit."""
+        if self.watermarks is None:
+            return {}
+        return self.watermarks.get_all()
+
+    def stage_watermarks(self, watermarks: Dict[int, Watermark]):
+        """Stages the watermarks reached by the current scan of the indices, to be recorded on the next commit."""
+        self.staged_watermarks.update(watermarks)
 
     @property
     def eins(self) -> Iterator[str]:
@@ -37,7 +67,9 @@ class EfileMetadataIndex:
     def changes(self) -> Iterator[Tuple[str, Dict[str, FilingMetadata]]]:
         """Yields all EINs that have at least one change since the last commit, along with a dictionary of period ->
         Filing for those changes."""
-        yield from self.staged_changes.items()
+        for ein, updates in self.staged_changes.items():
+            if updates:
+                yield ein, updates
 
     def filings(self, ein: str) -> Iterator[FilingMetadata]:
         """Yields dictionaries representing the e-file metadata for all filing periods associated with an EIN as of the
@@ -49,6 +81,16 @@ class EfileMetadataIndex:
         self._choose_filing_to_keep(filing, other)
 
     def _choose_between_new_and_existing(self, filing: FilingMetadata):
+        if self.known_filings is not None:
+            latest_dates: Optional[Tuple[str, str]] = self.known_filings.latest_dates_for(filing.record_id)
+            if latest_dates is None:
+                self.staged_changes[filing.ein][filing.period] = filing
+                return
+            if _superseded(filing, *latest_dates):
+                self.staged_dupes[filing.irs_efile_id] = filing
+                return
+
+        # When preloaded, the existing filing is only fetched when it is about to be staged as a duplicate
         existing: List[FilingMetadata] = list(self.latest_filings.filings_by_record_id(filing.record_id))
         assert len(existing) <= 1
         if len(existing) == 1:
@@ -58,9 +100,7 @@ class EfileMetadataIndex:
             self.staged_changes[filing.ein][filing.period] = filing
 
     def _choose_filing_to_keep(self, filing: FilingMetadata, other: FilingMetadata):
-        if other.date_submitted > filing.date_submitted:
-            self.staged_dupes[filing.irs_efile_id] = filing
-        elif other.date_submitted == filing.date_submitted and other.date_uploaded > filing.date_uploaded:
+        if _superseded(filing, other.date_submitted, other.date_uploaded):
             self.staged_dupes[filing.irs_efile_id] = filing
         else:
             self.staged_dupes[other.irs_efile_id] = other
@@ -73,6 +113,9 @@ class EfileMetadataIndex:
         if f.period in self.staged_changes[f.ein] and self.staged_changes[f.ein][f.period] == f:
             return True
 
+        if self.known_filings is not None:
+            return self.known_filings.contains(f.irs_efile_id)
+
         if len(list(self.latest_filings.filings_by_irs_efile_id(f.irs_efile_id))) > 0:
             return True
 
@@ -93,14 +136,26 @@ class EfileMetadataIndex:
             self._choose_between_new_and_existing(filing)
 
     def commit(self):
-        """Commits all changes that were staged."""
+        """Commits all changes that were staged, in a single transaction. If anything goes wrong, nothing is written
+        and the changes remain staged."""
         logging.info("Committing observed changes to persistent e-file metadata index.")
-        for filing in self.staged_dupes.values():
-            self.latest_filings.delete_if_exists(filing.irs_efile_id)
-            self.duplicates.upsert(filing)
-        self.staged_dupes.clear()
+        dupes: List[FilingMetadata] = list(self.staged_dupes.values())
+        changes: List[FilingMetadata] = [filing for change_list in self.staged_changes.values()
+                                         for filing in change_list.values()]
+
+        with self.latest_filings.conn:
+            self.latest_filings.delete_many(filing.irs_efile_id for filing in dupes)
+            self.duplicates.upsert_many(dupes)
+            self.latest_filings.upsert_many(changes)
+            if self.watermarks is not None:
+                self.watermarks.upsert(self.staged_watermarks.values())
+
+        if self.known_filings is not None:
+            for filing in dupes:
+                self.known_filings.record_duplicate(filing)
+            for filing in changes:
+                self.known_filings.record_latest(filing)
 
-        for change_list in self.staged_changes.values():
-            for filing in change_list.values():
-                self.latest_filings.upsert(filing)
+        self.staged_dupes.clear()
         self.staged_changes.clear()
+        self.staged_watermarks.clear()
@@ -1,25 +1,25 @@
-from dataclasses import dataclass
-from typing import Dict
+from dataclasses import dataclass, fields
+from operator import attrgetter
+from sys import intern
+from typing import Dict, Optional, Tuple
 from datetime import datetime
 
 from pytz import timezone
 
 tz = timezone('America/New_York')
 
-FIELD_EQUIVALENTS = {
-    "EIN": "ein",
-    "TaxPeriod": "period",
-    "DLN": "irs_dln",
-    "FormType": "form_type",
-    "URL": "url",
-    "OrganizationName": "name_org",
-    "SubmittedOn": "date_submitted",
-    "ObjectId": "irs_efile_id",
-    "LastUpdated": "date_uploaded"
-}
+def download_timestamp() -> str:
+    """The current time, in the format recorded as a filing's download date. Meant to be computed once per run and
+    shared by every filing read during it."""
+    date_downloaded: datetime = datetime.now(tz)
+    return date_downloaded.strftime("%Y-%m-%d %H:%M:%S")
 
 @dataclass
 class FilingMetadata:
+    # Millions of these can be staged at once, so no per-instance __dict__
+    __slots__ = ("record_id", "irs_efile_id", "irs_dln", "ein", "period", "name_org", "form_type", "date_submitted",
+                 "date_uploaded", "date_downloaded", "url")
+
     record_id: str
     irs_efile_id: str
     irs_dln: str
@@ -33,12 +33,33 @@ class FilingMetadata:
     url: str
 
     @classmethod
-    def from_json(cls, content: Dict) -> "FilingMetadata":
-        params: Dict = {}
-        for irs_key, anr_key in FIELD_EQUIVALENTS.items():
-            params[anr_key] = content[irs_key]
-
-        date_downloaded: datetime = datetime.now(tz)
-        params["date_downloaded"] = date_downloaded.strftime("%Y-%m-%d %H:%M:%S")
-        params["record_id"] = "%s_%s" % (params["ein"], params["period"])
-        return cls(**params)
+    def from_json(cls, content: Dict, date_downloaded: Optional[str] = None) -> "FilingMetadata":
+        """Builds filing metadata from an entry in an IRS e-file index. Values that repeat across many filings (periods,
+        form types and dates) are interned so that each distinct value is stored once.
+
+        :param content: The index entry.
+        :param date_downloaded: When the index was downloaded. Defaults to the current time.
+        """
+        if date_downloaded is None:
+            date_downloaded = download_timestamp()
+        ein: str = content["EIN"]
+        period: str = intern(content["TaxPeriod"])
+        return cls(
+            "%s_%s" % (ein, period),
+            content["ObjectId"],
+            content["DLN"],
+            ein,
+            period,
+            content["OrganizationName"],
+            intern(content["FormType"]),
+            intern(content["SubmittedOn"]),
+            intern(content["LastUpdated"]),
+            date_downloaded,
+            content["URL"]
+        )
+
+    def as_tuple(self) -> Tuple:
+        """Same as dataclasses.astuple, without the recursive copying."""
+        return _as_tuple(self)
+
+_as_tuple = attrgetter(*(f.name for f in fields(FilingMetadata)))
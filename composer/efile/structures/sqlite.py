@@ -1,11 +1,13 @@
 import dataclasses
 from collections.abc import Iterable
 from sqlite3 import Connection, Cursor, connect
-from typing import Dict, Iterator, Optional, Tuple
+from typing import Dict, Iterator, Optional, Tuple, Iterable as IterableType
 
 from attr import dataclass
 
 from composer.efile.structures.metadata import FilingMetadata
+from composer.efile.structures.watermark import init_watermark_table
+from composer.conf import SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_CACHE_SIZE
 
 @dataclass
 class EfileIndexTable(Iterable):
@@ -33,6 +35,18 @@ class EfileIndexTable(Iterable):
         cursor.execute(query, (irs_efile_id,))
         self.conn.commit()
 
+    def upsert_many(self, filings: IterableType[FilingMetadata]):
+        """Inserts or replaces rows in the table in a single statement. Does not commit."""
+        query: str = "INSERT OR REPLACE INTO %s VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)" % self.table_name
+        cursor: Cursor = self.conn.cursor()
+        cursor.executemany(query, (filing.as_tuple() for filing in filings))
+
+    def delete_many(self, irs_efile_ids: IterableType[str]):
+        """Deletes any of the records that exist from the table in a single statement. Does not commit."""
+        query: str = "DELETE FROM %s WHERE irs_efile_id = ?" % self.table_name
+        cursor: Cursor = self.conn.cursor()
+        cursor.executemany(query, ((irs_efile_id,) for irs_efile_id in irs_efile_ids))
+
     def _filings_by_key(self, key_name: str, key_value: str) -> Iterator[FilingMetadata]:
         query: str = "SELECT * FROM %s WHERE %s = ?" % (self.table_name, key_name)
         cursor: Cursor = self.conn.cursor()
@@ -46,6 +60,20 @@ class EfileIndexTable(Iterable):
         for row in cursor.execute(query):
             yield row[0]
 
+    @property
+    def irs_efile_ids(self) -> Iterator[str]:
+        query: str = "SELECT irs_efile_id FROM %s" % self.table_name
+        cursor: Cursor = self.conn.cursor()
+        for row in cursor.execute(query):
+            yield row[0]
+
+    @property
+    def latest_dates(self) -> Iterator[Tuple[str, str, str]]:
+        """Yields the record ID, submission date and upload date of every filing in the table."""
+        query: str = "SELECT record_id, date_submitted, date_uploaded FROM %s" % self.table_name
+        cursor: Cursor = self.conn.cursor()
+        yield from cursor.execute(query)
+
     def filings_for_ein(self, ein: str) -> Iterator[FilingMetadata]:
         yield from self._filings_by_key("ein", ein)
 
@@ -55,6 +83,16 @@ class EfileIndexTable(Iterable):
     def filings_by_irs_efile_id(self, irs_efile_id: str) -> Iterator[FilingMetadata]:
         yield from self._filings_by_key("irs_efile_id", irs_efile_id)
 
+def configure_connection(conn: Connection, journal_mode: str = SQLITE_JOURNAL_MODE,
+                         synchronous: str = SQLITE_SYNCHRONOUS, cache_size: int = SQLITE_CACHE_SIZE) -> Connection:
+    """Applies the pragmas used for the state database. With a write-ahead log, NORMAL synchronization only syncs at
+    checkpoints, which is still safe against corruption. A negative cache size is in KiB rather than pages."""
+    cursor: Cursor = conn.cursor()
+    cursor.execute("PRAGMA journal_mode = %s;" % journal_mode)
+    cursor.execute("PRAGMA synchronous = %s;" % synchronous)
+    cursor.execute("PRAGMA cache_size = %i;" % cache_size)
+    return conn
+
 def init_sqlite_db(connection_str: str) -> Connection:
     conn: Connection = connect(connection_str)
 
@@ -101,5 +139,7 @@ def init_sqlite_db(connection_str: str) -> Connection:
     cursor.execute("CREATE INDEX idx_duplicates_ein ON duplicates(ein);")
     conn.commit()
 
+    init_watermark_table(conn)
+
     return conn
 
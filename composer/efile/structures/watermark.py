@@ -0,0 +1,42 @@
+from dataclasses import dataclass
+from sqlite3 import Connection, Cursor
+from typing import Dict, Iterable, Optional
+
+@dataclass
+class Watermark:
+    """How far into a year's e-file index the last successful update got: the number of entries it had seen and the
+    ObjectId of the last of them. The IRS appends to its indices, so if the entry at that position is unchanged, only
+    the entries after it can be new."""
+    year: int
+    entry_count: int
+    last_irs_efile_id: str
+
+    def matches(self, entry_count: int, irs_efile_id: Optional[str]) -> bool:
+        return entry_count == self.entry_count and irs_efile_id == self.last_irs_efile_id
+
+def init_watermark_table(conn: Connection):
+    """Creates the watermark table if it is not already present, so that older state databases gain it in place."""
+    cursor: Cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS index_watermarks (
+            year integer PRIMARY KEY,
+            entry_count integer NOT NULL,
+            last_irs_efile_id text NOT NULL
+        );
+    """)
+    conn.commit()
+
+@dataclass
+class WatermarkTable:
+    conn: Connection
+
+    def get_all(self) -> Dict[int, Watermark]:
+        cursor: Cursor = self.conn.cursor()
+        query: str = "SELECT year, entry_count, last_irs_efile_id FROM index_watermarks"
+        return {row[0]: Watermark(*row) for row in cursor.execute(query)}
+
+    def upsert(self, watermarks: Iterable[Watermark]):
+        """Records the watermarks. Does not commit."""
+        query: str = "INSERT OR REPLACE INTO index_watermarks VALUES (?, ?, ?)"
+        cursor: Cursor = self.conn.cursor()
+        cursor.executemany(query, ((w.year, w.entry_count, w.last_irs_efile_id) for w in watermarks))
@@ -0,0 +1,72 @@
+"""Translates e-file XML in a pool of long-lived worker processes, so that translation (which is CPU-bound and holds the
+GIL throughout) can use every core. Each worker constructs its translator once, when it starts."""
+import os
+from multiprocessing.pool import Pool
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from composer.conf import TRANSLATE_CHUNK_SIZE
+from composer.efile.xmlio import JsonTranslator
+from composer.fileio.compression import open_path
+from composer.fileio.serialize import JsonSerializer, JSON_BACKENDS
+
+_translator: Optional[JsonTranslator] = None
+_serializer: Optional[JsonSerializer] = None
+
+class TranslationError(Exception):
+    """A worker failed to translate a document. Carries the original error's type and message, since lxml's errors
+    cannot be pickled back to the parent (which would see only a MaybeEncodingError)."""
+    pass
+
+def _init_worker(engine: str, json_backend: str):
+    global _translator, _serializer
+    _translator = JsonTranslator(engine)
+    _serializer = JsonSerializer(json_backend)
+
+def _translate_to_json(raw_xml: bytes) -> bytes:
+    try:
+        return _serializer.dumps(_translator(raw_xml))
+    except Exception as e:
+        raise TranslationError("%s: %s" % (e.__class__.__name__, e)) from None
+
+def _translate(raw_xml: bytes) -> bytes:
+    """Results are returned to the parent as compact JSON, which is far cheaper to pickle than a deeply nested dict."""
+    return _translate_to_json(raw_xml)
+
+def _translate_file(paths: Tuple[str, str]) -> None:
+    xml_path, json_path = paths
+    with open_path(xml_path, "rb") as xml_fh:
+        raw_xml: bytes = xml_fh.read()
+    with open_path(json_path, "wb") as json_fh:
+        json_fh.write(_translate_to_json(raw_xml))
+
+class TranslationPool:
+    """Process pool for translating e-file XML. The workers are started as soon as the pool is constructed, which should
+    happen before any other threads are started."""
+
+    def __init__(self, workers: Optional[int] = None, chunk_size: int = TRANSLATE_CHUNK_SIZE, engine: str = "xmljson",
+                 json_backend: str = JSON_BACKENDS[0]):
+        self.workers: int = workers or os.cpu_count() or 1
+        self.chunk_size: int = chunk_size
+        self.engine: str = engine
+        self.serializer: JsonSerializer = JsonSerializer(json_backend)
+        self._pool: Optional[Pool] = Pool(self.workers, initializer=_init_worker, initargs=(engine, json_backend))
+
+    def translate_serialized(self, raw_xml: List[bytes]) -> List[bytes]:
+        """Translates each of the supplied XML documents, returning their contents as compact JSON in the same order."""
+        return self._pool.map(_translate, raw_xml, self.chunk_size)
+
+    def translate_many(self, raw_xml: List[bytes]) -> List[Dict]:
+        """Translates each of the supplied XML documents, returning their contents in the same order."""
+        return [self.serializer.loads(content) for content in self.translate_serialized(raw_xml)]
+
+    def translate_files(self, targets: Iterable[Tuple[str, str]]):
+        """Translates each (XML path, JSON path) pair. The workers read and write the files themselves, so only the
+        paths cross process boundaries."""
+        for _ in self._pool.imap_unordered(_translate_file, targets, self.chunk_size):
+            pass
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
@@ -0,0 +1,63 @@
+import logging
+import os
+import zlib
+from dataclasses import dataclass, field
+from sqlite3 import Connection, connect
+from threading import Lock
+from typing import Dict, Optional
+
+from composer.conf import TRANSLATION_CACHE_DB_NAME
+from composer.efile.structures.sqlite import configure_connection
+from composer.efile.xmlio import translator_version
+from composer.fileio.serialize import JsonSerializer
+
+@dataclass
+class TranslationCache:
+    """Translated e-files, kept across runs so that rebuilding composites does not mean translating every filing again.
+    Each translation is keyed by irs_efile_id and the version of the translator that made it (see translator_version),
+    and stored as zlib-compressed JSON in a SQLite database under `basepath`. Translations made by any other version
+    are discarded when the cache is opened."""
+    basepath: str
+    serializer: JsonSerializer = field(default_factory=JsonSerializer)
+    version: str = field(default_factory=translator_version)
+    _conn: Connection = field(init=False, default=None)
+    _lock: Lock = field(init=False, default_factory=Lock)
+
+    def __post_init__(self):
+        os.makedirs(self.basepath, exist_ok=True)
+        self._conn = configure_connection(connect(os.path.join(self.basepath, TRANSLATION_CACHE_DB_NAME),
+                                                  check_same_thread=False))
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS translations (irs_efile_id TEXT NOT NULL, "
+                               "version TEXT NOT NULL, body BLOB NOT NULL, PRIMARY KEY (irs_efile_id, version))")
+            stale: int = self._conn.execute("DELETE FROM translations WHERE version != ?", (self.version,)).rowcount
+        if stale > 0:
+            logging.info("Discarded %i translations made by an earlier version of the translator." % stale)
+
+    def __contains__(self, irs_efile_id: str) -> bool:
+        with self._lock:
+            query: str = "SELECT 1 FROM translations WHERE irs_efile_id = ? AND version = ?"
+            return self._conn.execute(query, (irs_efile_id, self.version)).fetchone() is not None
+
+    def get_serialized(self, irs_efile_id: str) -> Optional[bytes]:
+        """The translation of an e-file as compact JSON, or None if there is none."""
+        with self._lock:
+            query: str = "SELECT body FROM translations WHERE irs_efile_id = ? AND version = ?"
+            row = self._conn.execute(query, (irs_efile_id, self.version)).fetchone()
+        return zlib.decompress(row[0]) if row is not None else None
+
+    def get(self, irs_efile_id: str) -> Optional[Dict]:
+        serialized: Optional[bytes] = self.get_serialized(irs_efile_id)
+        return self.serializer.loads(serialized) if serialized is not None else None
+
+    def put_serialized(self, irs_efile_id: str, serialized: bytes):
+        body: bytes = zlib.compress(serialized)
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO translations VALUES (?, ?, ?)",
+                               (irs_efile_id, self.version, body))
+
+    def put(self, irs_efile_id: str, content: Dict):
+        self.put_serialized(irs_efile_id, self.serializer.dumps(content))
+
+    def close(self):
+        self._conn.close()
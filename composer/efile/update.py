@@ -3,13 +3,17 @@ import os
 from collections.abc import Callable
 from dataclasses import dataclass
 from sqlite3 import Connection, connect
+from typing import Optional
 
-from composer.aws.efile.bucket import EfileBucket
+from composer.aws.efile.bucket import EfileAsyncBucket, EfileBucket
+from composer.aws.efile.indexcache import IndexCache
 from composer.aws.efile.indices import EfileIndices
 from composer.aws.s3 import Bucket
+from composer.efile.structures.journal import RunJournal
 from composer.efile.structures.mdindex import EfileMetadataIndex
 from composer.efile.compose import ComposeEfiles
-from composer.efile.structures.sqlite import init_sqlite_db
+from composer.efile.structures.sqlite import init_sqlite_db, configure_connection
+from composer.fileio.serialize import JsonSerializer
 from composer.timer import TimeLogger
 
 @dataclass
@@ -17,37 +21,97 @@ class UpdateEfileState(Callable):
     basepath: str
     indices: EfileIndices
     compose: ComposeEfiles
+    full_scan: bool = False
+    preload_known: bool = False
+    dedupe_engine: str = "rowwise"
+    resume: bool = False
 
     @classmethod
-    def build(cls, basepath: str, temp_path: str, no_cleanup: bool) -> "UpdateEfileState":
-        bucket: Bucket = EfileBucket()
-        indices: EfileIndices = EfileIndices(bucket)
-        compose: ComposeEfiles = ComposeEfiles.build(basepath, bucket, temp_path, no_cleanup)
-        return cls(basepath, indices, compose)
+    def build(cls, basepath: str, temp_path: str, no_cleanup: bool, stream_indices: bool = False,
+              index_cache: bool = True, full_scan: bool = False, preload_known: bool = False,
+              dedupe_engine: str = "rowwise", pipelined: bool = False, translate_workers: Optional[int] = None,
+              translator: str = "xmljson", json_backend: Optional[str] = None, compact: bool = False,
+              delta_log: bool = False, composite_store: str = "files", sqlite_shards: int = 1,
+              compress_blobs: bool = False, compression: Optional[str] = None,
+              async_s3: bool = False, xml_cache_bytes: int = 0,
+              translation_cache: bool = False, resume: bool = False) -> "UpdateEfileState":
+        bucket: Bucket = EfileAsyncBucket() if async_s3 else EfileBucket()
+        serializer: JsonSerializer = JsonSerializer(json_backend) if json_backend else JsonSerializer()
+        compose: ComposeEfiles = ComposeEfiles.build(basepath, bucket, temp_path, no_cleanup, pipelined,
+                                                     translate_workers, translator, serializer, compact, delta_log,
+                                                     composite_store, sqlite_shards, compress_blobs, compression,
+                                                     xml_cache_bytes, translation_cache)
+        cache: Optional[IndexCache] = IndexCache(os.path.join(basepath, "index_cache")) if index_cache else None
+        indices: EfileIndices = EfileIndices(bucket, streaming=stream_indices, cache=cache, serializer=serializer)
+        return cls(basepath, indices, compose, full_scan, preload_known, dedupe_engine, resume)
+
+    @property
+    def _sqlite_path(self) -> str:
+        return os.path.join(self.basepath, "state.sqlite")
 
     def _connect(self) -> Connection:
-        sqlite_path: str = os.path.join(self.basepath, "state.sqlite")
+        sqlite_path: str = self._sqlite_path
         if os.path.exists(sqlite_path):
             logging.info("Connecting to SQLite e-File state database.")
-            return connect(sqlite_path)
+            return configure_connection(connect(sqlite_path))
         else:
             logging.info("e-File state database does not exist; initializing.")
-            return init_sqlite_db(sqlite_path)
-
-    def _index_changes(self) -> EfileMetadataIndex:
-        conn: Connection = self._connect()
-        md_index: EfileMetadataIndex = EfileMetadataIndex.build(conn)
-        t_log: TimeLogger = TimeLogger("Considered {:,} e-File index entries")
-        for filing_md in self.indices:
-            fn: Callable = lambda: md_index.add(filing_md)
-            t_log.measure(fn)
-        t_log.finish()
+            return configure_connection(init_sqlite_db(sqlite_path))
+
+    def _index_changes(self, conn: Connection) -> EfileMetadataIndex:
+        md_index: EfileMetadataIndex = EfileMetadataIndex.build(conn, preload=self.preload_known)
+        if not self.full_scan:
+            self.indices.watermarks = md_index.committed_watermarks()
+        if self.dedupe_engine == "columnar":
+            # Optional dependency (pandas), so only imported when asked for
+            from composer.efile.structures.columnar import stage_columnar
+            stage_columnar(md_index, self.indices)
+        else:
+            t_log: TimeLogger = TimeLogger("Considered {:,} e-File index entries")
+            for filing_md in self.indices:
+                fn: Callable = lambda: md_index.add(filing_md)
+                t_log.measure(fn)
+            t_log.finish()
+        md_index.stage_watermarks(self.indices.observed)
         n_eins_changed: int = len(md_index.staged_changes.keys())
         n_amended: int = len(md_index.staged_dupes.keys())
         logging.info("{:,} EINs have new e-Files; {:,} filings were amended.".format(n_eins_changed, n_amended))
         return md_index
 
+    def _plan(self, conn: Connection, journal: RunJournal) -> EfileMetadataIndex:
+        """Stages the changes this update is to make: those of an unfinished earlier update, if resuming one, or else
+        those found by scanning the indices, which are then recorded in the journal."""
+        md_index: EfileMetadataIndex
+        if self.resume and journal.in_progress:
+            md_index = EfileMetadataIndex.build(conn)
+            journal.restore(md_index)
+            progress: str = ", ".join("{:,} {}".format(count, stage) for stage, count in journal.progress().items())
+            logging.info("Resuming unfinished update ({}).".format(progress))
+            return md_index
+        if self.resume:
+            logging.info("No unfinished update to resume; starting a new one.")
+        elif journal.in_progress:
+            logging.warning("Discarding the progress of an unfinished update. Use --resume to continue it instead.")
+        md_index = self._index_changes(conn)
+        journal.begin(md_index)
+        return md_index
+
     def __call__(self):
-        md_index: EfileMetadataIndex = self._index_changes()
-        self.compose(md_index.changes)
-        md_index.commit()
+        journal: Optional[RunJournal] = None
+        try:
+            conn: Connection = self._connect()
+            # A connection of its own, since progress is recorded from the compose threads
+            journal = RunJournal(configure_connection(connect(self._sqlite_path, check_same_thread=False)))
+            md_index: EfileMetadataIndex = self._plan(conn, journal)
+            self.compose(journal.pending(md_index.changes), journal)
+            journal.flush()
+            md_index.commit()
+
+            # If interrupted between the commit and this, resuming commits the same changes again, which is harmless
+            journal.finish()
+            md_index.latest_filings.conn.close()
+        finally:
+            if journal is not None:
+                journal.close()
+            self.compose.close()
+            self.indices.bucket.close()
@@ -1,17 +1,21 @@
+import hashlib
 from collections.abc import Callable
-from typing import Dict
+from functools import lru_cache
+from typing import Dict, Union
 
-from io import StringIO
+from io import BytesIO
 
 import re
 import lxml.etree
 from lxml import etree
-from lxml.etree import XMLParser, parse, _Element as Element
+from lxml.etree import XMLParser, _Element as Element
+import xmljson
 from xmljson import XMLData
 from collections import OrderedDict
 
 # noinspection PyProtectedMember
-from composer.efile.convert import convert
+from composer.efile import convert as convert_module
+from composer.efile.convert import convert, convert_element, convert_stream
 
 
 def _strip_namespace(raw: str) -> str:
@@ -22,18 +26,25 @@ def _strip_encoding(raw: str) -> str:
     no_encoding = re.sub("\<\?xml.+\?\>", "", raw)
     return no_encoding
 
-def _clean_xml(raw: str) -> str:
+def _to_ascii(raw: Union[str, bytes]) -> str:
+    """Drops any non-ASCII characters. For UTF-8 bytes, dropping the non-ASCII bytes has the same effect, without
+    decoding the document first."""
+    if isinstance(raw, bytes):
+        return raw.decode("ascii", "ignore")
+    return raw.encode("ascii", "ignore").decode("ascii")
+
+def _clean_xml(raw: Union[str, bytes]) -> str:
     """
     Remove interstitial whitespace (whitespace between XML tags) and
     namespaces. The former makes it difficult to detect text-free nodes,
     and the latter makes Xpaths far uglier and more unwieldy.
 
-    :param raw: string containing XML to be cleaned.
+    :param raw: string (or UTF-8 bytes) containing XML to be cleaned.
 
     :return: string containing XML with namespaces and interstitial
     whitespace removed.
     """
-    a = raw.encode("ascii", "ignore").decode("ascii")
+    a = _to_ascii(raw)
     no_encoding = _strip_encoding(a)
     no_ns = _strip_namespace(no_encoding)
     return no_ns
@@ -46,20 +57,47 @@ def _strip_prefix(almost_clean):
     return almost_clean
 
 
-def _clean_xsd(raw: str) -> str:
+def _clean_xsd(raw: Union[str, bytes]) -> str:
     almost_clean = _clean_xml(raw)
     clean = _strip_prefix(almost_clean)
     return clean
 
+_NON_ASCII: bytes = bytes(range(128, 256))
+_ENCODING_DECL = re.compile(rb"<\?xml.+\?>")
+_NAMESPACE_DECL = re.compile(rb'(xmlns|xsi)(:.*?)?=".*?"')
+# One pass in place of the four in _strip_prefix. "xsd:irs:" is listed so that a tag carrying both prefixes loses
+# both, as it would have when the passes ran one after the other. The lookahead spares the regex engine from trying
+# the alternatives at every tag.
+_TAG_PREFIX = re.compile(rb"<(?=/?(?:xsd|irs):)(/?)(?:xsd:irs:|xsd:|irs:)")
+
+def _clean_bytes(raw: Union[str, bytes]) -> bytes:
+    """
+    Same cleaning as _clean_xsd, but carried out on bytes: the document is never decoded, and there are three passes
+    over it instead of seven.
+
+    :param raw: UTF-8 bytes (or string) containing XML to be cleaned.
+
+    :return: ASCII bytes containing XML with the encoding declaration, namespaces and xsd/irs prefixes removed.
+    """
+    if isinstance(raw, str):
+        ascii_only: bytes = raw.encode("ascii", "ignore")
+    else:
+        # Every byte of a multi-byte UTF-8 sequence is non-ASCII, so this drops exactly the non-ASCII characters
+        ascii_only = raw.translate(None, _NON_ASCII)
+    no_encoding: bytes = _ENCODING_DECL.sub(b"", ascii_only)
+    no_ns: bytes = _NAMESPACE_DECL.sub(b"", no_encoding)
+    return _TAG_PREFIX.sub(rb"<\1", no_ns)
+
 # https://lxml.de/parsing.html
 # https://stackoverflow.com/questions/11850345/using-python-lxml-etree-for-huge-xml-files
-def _get_cleaned_root(raw_xml: str) -> Element:
-    cleaned = _clean_xsd(raw_xml)
+def _get_cleaned_root(raw_xml: Union[str, bytes]) -> Element:
+    cleaned: bytes = _clean_bytes(raw_xml)
     p = XMLParser(huge_tree=True)
-    tree = parse(StringIO(cleaned), parser=p)
-    root = tree.getroot()
-    # This line used to stand for the three currently above it. If they fail for some reason, try this one again
-    # root = etree.fromstring(cleaned, huge_tree=True)
+    root = etree.fromstring(cleaned, parser=p)
+    # These lines used to stand for the two currently above it, on the output of _clean_xsd. If the above fails for some
+    # reason, try them again
+    # tree = parse(StringIO(_clean_xsd(raw_xml)), parser=p)
+    # root = tree.getroot()
     return root
 
 class MongoFish(XMLData):
@@ -69,11 +107,37 @@ class MongoFish(XMLData):
         super().__init__(attr_prefix='@', text_content='_', **kwargs)
 
 
+TRANSLATORS = ["xmljson", "fused", "iterparse"]
+
 class JsonTranslator(Callable):
-    def __init__(self):
+    """Translates e-file XML to the format used by Polytropos.
+
+    :param engine: "xmljson" builds a BadgerFish representation of the document and then converts it; "fused" converts
+    the parsed document directly, in a single walk of the tree; "iterparse" converts the document as it is parsed,
+    without ever holding the whole tree, for filings too big to parse comfortably. All give the same result.
+    """
+    def __init__(self, engine: str = "xmljson"):
+        if engine not in TRANSLATORS:
+            raise ValueError('Unknown translator "%s"' % engine)
+        self.engine: str = engine
         self._fish = MongoFish(dict_type=OrderedDict, xml_fromstring=False)
 
-    def __call__(self, xml_str: str):
+    def __call__(self, xml_str: Union[str, bytes]):
+        if self.engine == "iterparse":
+            return convert_stream(BytesIO(_clean_bytes(xml_str)))
         xml = _get_cleaned_root(xml_str)
+        if self.engine == "fused":
+            return convert_element(xml)
         fish_json = self._fish.data(xml)
         return convert(fish_json)
+
+@lru_cache(maxsize=1)
+def translator_version() -> str:
+    """Identifies the code that translates e-files: a hash of this module, the conversion module and the xmljson
+    release. Any change to them changes the version, so translations made by earlier code are never mistaken for current
+    ones."""
+    digest = hashlib.sha256(xmljson.__version__.encode("ascii"))
+    for path in [__file__, convert_module.__file__]:
+        with open(path, "rb") as fh:
+            digest.update(fh.read())
+    return digest.hexdigest()[:16]
@@ -0,0 +1,64 @@
+"""Opens files compressed with any of the supported codecs as if they were not. The codec is identified by the file's
+suffix, so compressed and uncompressed files can sit side by side (for example, part way through a migration)."""
+import gzip
+import lzma
+import os
+from typing import IO, Dict, List, Optional, Callable
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SUFFIXES: Dict[str, str] = {"gzip": ".gz", "lzma": ".xz"}
+_OPENERS: Dict[str, Callable[..., IO]] = {"gzip": gzip.open, "lzma": lzma.open}
+if zstandard is not None:
+    SUFFIXES["zstd"] = ".zst"
+    _OPENERS["zstd"] = zstandard.open
+
+COMPRESSIONS: List[str] = ["none"] + list(SUFFIXES.keys())
+
+def check_compression(compression: Optional[str]):
+    if compression is not None and compression != "none" and compression not in SUFFIXES:
+        raise ValueError('Compression "%s" is not available' % compression)
+
+def compressed_path(path: str, compression: Optional[str]) -> str:
+    """The path of the file when compressed with the specified codec ("none" or None for no compression)."""
+    check_compression(compression)
+    if compression is None or compression == "none":
+        return path
+    return path + SUFFIXES[compression]
+
+def compression_of(path: str) -> str:
+    for compression, suffix in SUFFIXES.items():
+        if path.endswith(suffix):
+            return compression
+    return "none"
+
+def strip_suffix(path: str) -> str:
+    compression: str = compression_of(path)
+    return path if compression == "none" else path[:-len(SUFFIXES[compression])]
+
+def open_path(path: str, mode: str = "r") -> IO:
+    """Opens a file, decompressing or compressing it according to its suffix. Text modes are supported for every
+    codec."""
+    compression: str = compression_of(path)
+    if compression == "none":
+        return open(path, mode)
+    if "b" not in mode and "t" not in mode:
+        mode += "t"
+    return _OPENERS[compression](path, mode)
+
+def variants(path: str) -> List[str]:
+    """Every path at which the file might be stored, uncompressed first."""
+    return [path] + [path + suffix for suffix in SUFFIXES.values()]
+
+def existing_variant(path: str, preferred: Optional[str] = None) -> Optional[str]:
+    """The path at which the file is actually stored, trying the preferred codec first, or None if it is absent."""
+    candidates: List[str] = variants(path)
+    if preferred is not None:
+        candidates.insert(0, compressed_path(path, preferred))
+    for candidate in candidates:
+        if os.path.exists(candidate):
+            return candidate
+    return None
@@ -0,0 +1,97 @@
+"""Incremental parsing of JSON documents shaped like the IRS e-file indices: a single-key object whose value is a (very
+long) array of small objects. Only the array element currently being decoded is held in memory."""
+import json
+import re
+from typing import Iterable, Iterator, Any
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_NUMBER_TAIL = re.compile(r"[0-9eE.+-]*")
+_decoder: json.JSONDecoder = json.JSONDecoder()
+
+class _ChunkBuffer:
+    """Sliding window over an iterable of text chunks."""
+    def __init__(self, chunks: Iterable[str]):
+        self._chunks: Iterator[str] = iter(chunks)
+        self.text: str = ""
+        self.pos: int = 0
+        self.eof: bool = False
+
+    def fill(self) -> bool:
+        """Appends the next chunk to the window, discarding anything already consumed. Returns False at end of input."""
+        try:
+            chunk: str = next(self._chunks)
+        except StopIteration:
+            self.eof = True
+            return False
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def skip_whitespace(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text) or not self.fill():
+                return
+
+    def expect(self, token: str):
+        self.skip_whitespace()
+        if self.text[self.pos:self.pos + 1] != token:
+            raise ValueError("Expected '%s' at offset %i of JSON window" % (token, self.pos))
+        self.pos += 1
+
+    def peek(self) -> str:
+        self.skip_whitespace()
+        return self.text[self.pos:self.pos + 1]
+
+    def decode_value(self) -> Any:
+        """Decodes the next complete JSON value, pulling in more chunks until one is available."""
+        self.skip_whitespace()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+
+                # A number that runs to the end of the window may continue into the next chunk
+                truncated: bool = _NUMBER_TAIL.match(self.text, end).end() == len(self.text)
+                if not (truncated and self.fill()):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+
+def read_chunks(filepath: str, chunk_size: int, encoding: str = "utf-8") -> Iterator[str]:
+    """Yields the decoded contents of a local file in chunks of `chunk_size` characters."""
+    with open(filepath, encoding=encoding) as fh:
+        while True:
+            chunk: str = fh.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+def iter_array_items(chunks: Iterable[str], key: str) -> Iterator[Any]:
+    """Yields the elements of the array stored under `key` in a JSON object with exactly one key, one element at a time.
+
+    :param chunks: Iterable of decoded text chunks that together make up the document.
+    :param key: The only key expected in the top-level object.
+    """
+    buffer: _ChunkBuffer = _ChunkBuffer(chunks)
+    buffer.expect("{")
+
+    # The IRS currently includes a single key in its indices. Blow up if that changes.
+    actual_key: str = buffer.decode_value()
+    assert actual_key == key
+    buffer.expect(":")
+    buffer.expect("[")
+
+    if buffer.peek() == "]":
+        buffer.expect("]")
+    else:
+        while True:
+            yield buffer.decode_value()
+            if buffer.peek() == ",":
+                buffer.expect(",")
+                continue
+            buffer.expect("]")
+            break
+
+    assert buffer.peek() == "}"
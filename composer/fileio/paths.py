@@ -1,47 +1,166 @@
+import errno
 import os
+import uuid
 from dataclasses import dataclass
-from typing import IO
+from typing import IO, Iterator, List, Optional, Tuple
+
+from composer.fileio.compression import (check_compression, compressed_path, existing_variant, open_path, variants,
+                                         strip_suffix)
+
+class _StagedFile:
+    """A file written under a temporary name beside its target. Closing it syncs it to disk and moves it over the
+    target, and only then removes the `superseded` files (the target in other codecs), so that a reader finds either the
+    old file or the complete new one, never a partial one. If the with-block it is used in raises, the new file is
+    discarded instead."""
+    def __init__(self, target: str, mode: str, superseded: List[str]):
+        directory, filename = os.path.split(target)
+        self._target: str = target
+        self._superseded: List[str] = superseded
+        # The prefix leaves the codec's suffix in place
+        self._partial: str = os.path.join(directory, ".%s.%s" % (uuid.uuid4().hex, filename))
+        self._fh: IO = open_path(self._partial, mode)
+
+    def __getattr__(self, name: str):
+        return getattr(self._fh, name)
+
+    def write(self, data) -> int:
+        return self._fh.write(data)
+
+    def close(self):
+        if self._fh.closed:
+            return
+        self._fh.close()
+        fd: int = os.open(self._partial, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(self._partial, self._target)
+        for path in self._superseded:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def discard(self):
+        self._fh.close()
+        try:
+            os.remove(self._partial)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "_StagedFile":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
 
 @dataclass
 class EINPathManager:
+    """Locates files for each EIN under a two-level directory fan-out. If `compression` is set, files are written with
+    that codec. Files are read transparently whatever codec (if any) they were written with."""
     basepath: str
+    compression: Optional[str] = None
+
+    def __post_init__(self):
+        check_compression(self.compression)
 
     def directory_for(self, ein: str):
         first, second = ein[0:3], ein[3:6]
         return os.path.join(self.basepath, first, second)
 
-    def open_for_reading(self, ein: str, template: str) -> IO:
+    def open_for_reading(self, ein: str, template: str, binary: bool = False) -> IO:
         """Locates a file whose filename conforms to a specified template and corresponding to a particular EIN, then
         opens it for reading.
 
         :param ein: The EIN whose file should be opened
         :param template: A string template for the filename, where "%s" will represent the EIN
+        :param binary: If true, the file is opened in binary mode
         :return: A file object in read-only mode.
         """
 
-        filename: str = template.format(ein)
-        directory: str = self.directory_for(ein)
-        filepath: str = os.path.join(directory, filename)
-        return open(filepath)
+        filepath: str = self._path(ein, template)
+        actual: Optional[str] = existing_variant(filepath, self.compression)
+        if actual is None:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), filepath)
+        return open_path(actual, "rb" if binary else "r")
 
-    def open_for_writing(self, ein: str, template: str) -> IO:
+    def open_for_writing(self, ein: str, template: str, binary: bool = False, append: bool = False) -> IO:
         """Creates directories as needed for a file whose filename conforms to a specified template and corresponding to
         a particular EIN, then opens it for writing.
 
         :param ein: The EIN whose file should be opened
         :param template: A string template for the filename, where "%s" will represent the EIN
+        :param binary: If true, the file is opened in binary mode
+        :param append: If true, writes go to the end of any existing file instead of replacing it. Otherwise the new
+        file replaces the old (in whatever codec) only once it is closed, so is never seen part written.
         :return: A file object in write mode.
         """
 
         directory: str = self.directory_for(ein)
         os.makedirs(directory, exist_ok=True)
 
-        filename: str = template.format(ein)
-        filepath: str = os.path.join(directory, filename)
-        return open(filepath, "w")
+        filepath: str = self._path(ein, template)
+        target: str = compressed_path(filepath, self.compression)
+        if append:
+            # Keep appending to an existing file in whatever codec it was started with
+            target = existing_variant(filepath, self.compression) or target
+            return open_path(target, "ab" if binary else "a")
+        return _StagedFile(target, "wb" if binary else "w", self._others(filepath, target))
+
+    def _others(self, filepath: str, target: str) -> List[str]:
+        return [variant for variant in variants(filepath) if variant != target]
+
+    def _path(self, ein: str, template: str) -> str:
+        return os.path.join(self.directory_for(ein), template.format(ein))
+
+    def locate(self, ein: str, template: str) -> Optional[str]:
+        """The path at which the file is stored, however it is compressed, or None if it does not exist."""
+        return existing_variant(self._path(ein, template), self.compression)
 
     def exists(self, ein: str, template: str) -> bool:
-        filename: str = template.format(ein)
-        directory: str = self.directory_for(ein)
-        filepath: str = os.path.join(directory, filename)
-        return os.path.exists(filepath)
+        return existing_variant(self._path(ein, template)) is not None
+
+    def size(self, ein: str, template: str) -> int:
+        """Size on disk of the file, or 0 if it does not exist."""
+        actual: Optional[str] = existing_variant(self._path(ein, template), self.compression)
+        return os.path.getsize(actual) if actual is not None else 0
+
+    def remove(self, ein: str, template: str):
+        """Deletes the file, however it is compressed, if it exists."""
+        for path in variants(self._path(ein, template)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def files(self, template: str) -> Iterator[Tuple[str, str]]:
+        """Yields (EIN, path) for every file under the base path matching the template, however it is compressed."""
+        prefix, suffix = template.split("{}")
+        for dirpath, _, filenames in os.walk(self.basepath):
+            for filename in filenames:
+                name: str = strip_suffix(filename)
+                if not (name.startswith(prefix) and name.endswith(suffix)) or len(name) <= len(prefix + suffix):
+                    continue
+                ein: str = name[len(prefix):len(name) - len(suffix)]
+                if os.path.normpath(self.directory_for(ein)) == os.path.normpath(dirpath):
+                    yield ein, os.path.join(dirpath, filename)
+
+    def recompress(self, template: str, compression: Optional[str]) -> int:
+        """Rewrites every file matching the template with the specified codec. Returns the number of files rewritten."""
+        n_rewritten: int = 0
+        for ein, path in list(self.files(template)):
+            filepath: str = self._path(ein, template)
+            target: str = compressed_path(filepath, compression)
+            if path == target:
+                continue
+            with open_path(path, "rb") as fh:
+                content: bytes = fh.read()
+            # The original is only removed once the new file has taken its place
+            with _StagedFile(target, "wb", self._others(filepath, target)) as fh:
+                fh.write(content)
+            n_rewritten += 1
+        return n_rewritten
@@ -0,0 +1,48 @@
+"""Reads and writes JSON with the fastest library installed: orjson, then msgspec, then the standard library. All of
+them read the same documents and write equivalent ones, so the backend can be changed between runs."""
+import json
+from dataclasses import dataclass
+from typing import Any, List, Tuple, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+JSON_BACKENDS: List[str] = [name for name, module in [("orjson", orjson), ("msgspec", msgspec)] if module is not None]
+JSON_BACKENDS.append("json")
+
+# Raised by loads, whichever backend is in use, for input that is not valid JSON
+DECODE_ERRORS: Tuple[type, ...] = (ValueError,) + ((msgspec.DecodeError,) if msgspec is not None else ())
+
+@dataclass
+class JsonSerializer:
+    backend: str = JSON_BACKENDS[0]
+
+    def __post_init__(self):
+        if self.backend not in JSON_BACKENDS:
+            raise ValueError('JSON backend "%s" is not available' % self.backend)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        if self.backend == "orjson":
+            return orjson.loads(data)
+        if self.backend == "msgspec":
+            return msgspec.json.decode(data)
+        return json.loads(data)
+
+    def dumps(self, obj: Any, indent: bool = False) -> bytes:
+        """Encodes as UTF-8 JSON; compact unless `indent` is set, in which case nested values are indented by two
+        spaces."""
+        if self.backend == "orjson":
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+        if self.backend == "msgspec":
+            encoded: bytes = msgspec.json.encode(obj)
+            return msgspec.json.format(encoded, indent=2) if indent else encoded
+        if indent:
+            return json.dumps(obj, indent=2).encode("utf-8")
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,87 @@
+"""Runs work items through a sequence of stages, each with its own pool of worker threads, connected by bounded queues.
+Unlike a series of thread pools each waiting for the previous one to finish, an item moves on to the next stage as
+soon as it is done with the current one, and the number of items in flight never exceeds the queue capacity."""
+import logging
+from dataclasses import dataclass
+from queue import Queue
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Iterable, List, Optional
+
+_DONE = object()
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[Any], Any]
+    workers: int
+
+class _StageRunner:
+    def __init__(self, stage: Stage, inbox: Queue, outbox: Optional[Queue], downstream_workers: int,
+                 failed: Event, errors: List[BaseException]):
+        self.stage: Stage = stage
+        self.inbox: Queue = inbox
+        self.outbox: Optional[Queue] = outbox
+        self.downstream_workers: int = downstream_workers
+        self.failed: Event = failed
+        self.errors: List[BaseException] = errors
+        self._remaining: int = stage.workers
+        self._lock: Lock = Lock()
+
+    def _finish_worker(self):
+        with self._lock:
+            self._remaining -= 1
+            last: bool = self._remaining == 0
+        if last and self.outbox is not None:
+            for _ in range(self.downstream_workers):
+                self.outbox.put(_DONE)
+
+    def work(self):
+        while True:
+            item: Any = self.inbox.get()
+            if item is _DONE:
+                self._finish_worker()
+                return
+
+            # After a failure, keep draining so that upstream workers are never left blocked on a full queue
+            if self.failed.is_set():
+                continue
+            try:
+                result: Any = self.stage.fn(item)
+            except BaseException as e:
+                logging.exception("Pipeline stage '%s' failed." % self.stage.name)
+                self.errors.append(e)
+                self.failed.set()
+                continue
+            if self.outbox is not None:
+                self.outbox.put(result)
+
+def run_pipeline(source: Iterable, stages: List[Stage], queue_size: int):
+    """Feeds every item from the source through the stages in order, discarding the output of the last stage. Blocks
+    until all items have been processed. If any stage raises, no new items are started and the first exception is
+    re-raised once the items already in flight have drained."""
+    failed: Event = Event()
+    errors: List[BaseException] = []
+    queues: List[Queue] = [Queue(maxsize=queue_size) for _ in stages]
+    threads: List[Thread] = []
+    for i, stage in enumerate(stages):
+        outbox: Optional[Queue] = queues[i + 1] if i + 1 < len(stages) else None
+        downstream_workers: int = stages[i + 1].workers if i + 1 < len(stages) else 0
+        runner: _StageRunner = _StageRunner(stage, queues[i], outbox, downstream_workers, failed, errors)
+        for _ in range(stage.workers):
+            thread: Thread = Thread(target=runner.work, daemon=True)
+            thread.start()
+            threads.append(thread)
+
+    try:
+        for item in source:
+            if failed.is_set():
+                break
+            queues[0].put(item)
+    finally:
+        for _ in range(stages[0].workers):
+            queues[0].put(_DONE)
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
@@ -0,0 +1,289 @@
+"""Schedules many tasks (chiefly S3 requests) so as to push as hard as the bucket allows without failing the run. The
+number of tasks in flight is adjusted by additive increase / multiplicative decrease (AIMD): it grows while responses
+come back promptly, and is halved whenever S3 asks us to slow down or latency climbs well above the best seen so far.
+Tasks that fail for transient reasons are retried after a jittered, exponentially growing delay.
+
+Each task has its own deadline, after which it is abandoned (and retried, if the policy allows), so one straggler
+neither fails nor holds up the rest. The stage as a whole has a separate deadline that grows with the number of tasks."""
+import heapq
+import itertools
+import logging
+import random
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, TimeoutError as FuturesTimeoutError, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+
+from composer.conf import (MAX_WORKERS, ADAPTIVE_MAX_IN_FLIGHT, AIMD_DECREASE, AIMD_LATENCY_TOLERANCE,
+                           RETRY_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY, STAGE_TIMEOUT, STAGE_TIMEOUT_PER_TASK)
+
+THROTTLING_CODES = {"SlowDown", "503", "ServiceUnavailable", "Throttling", "ThrottlingException",
+                    "RequestLimitExceeded", "TooManyRequests", "429"}
+
+TRANSIENT_CODES = {"InternalError", "500", "RequestTimeout", "RequestTimeTooSkewed"}
+
+_EXHAUSTED = object()
+
+def _error_code(e: BaseException) -> Optional[str]:
+    if isinstance(e, ClientError):
+        return e.response.get("Error", {}).get("Code")
+    return None
+
+def is_throttling(e: BaseException) -> bool:
+    return _error_code(e) in THROTTLING_CODES
+
+def is_retryable(e: BaseException) -> bool:
+    """Throttling, server errors and dropped connections are worth retrying; anything else (a missing key, a denied
+    request) will fail again."""
+    if isinstance(e, (BotoConnectionError, HTTPClientError, ConnectionError, TimeoutError, FuturesTimeoutError,
+                      socket.timeout)):
+        return True
+    return is_throttling(e) or _error_code(e) in TRANSIENT_CODES
+
+@dataclass
+class AdaptiveLimit:
+    """AIMD limit on the number of requests in flight. Until the first sign of congestion, the limit grows by one per
+    successful request, doubling every round trip (slow start); after that, it grows by one per round trip."""
+    initial: int = MAX_WORKERS
+    maximum: int = ADAPTIVE_MAX_IN_FLIGHT
+    minimum: int = 1
+    decrease: float = AIMD_DECREASE
+    latency_tolerance: float = AIMD_LATENCY_TOLERANCE
+    limit: float = field(default=0.0, init=False)
+    slow_start: bool = field(default=True, init=False)
+    best_latency: Optional[float] = field(default=None, init=False)
+    smoothed_latency: Optional[float] = field(default=None, init=False)
+    _last_decrease: float = field(default=0.0, init=False)
+
+    def __post_init__(self):
+        self.limit = float(min(max(self.initial, self.minimum), self.maximum))
+
+    @classmethod
+    def fixed(cls, workers: int) -> "AdaptiveLimit":
+        """A limit that never changes, for tasks whose concurrency is bounded by something other than S3."""
+        return cls(initial=workers, maximum=workers, minimum=workers)
+
+    @property
+    def current(self) -> int:
+        return int(self.limit)
+
+    def on_success(self, latency: float):
+        self.smoothed_latency = latency if self.smoothed_latency is None \
+            else 0.9 * self.smoothed_latency + 0.1 * latency
+
+        # The baseline creeps up towards typical latency, so that one unusually fast response cannot hold the limit down
+        self.best_latency = latency if self.best_latency is None \
+            else min(latency, self.best_latency + 0.01 * (self.smoothed_latency - self.best_latency))
+        if self.smoothed_latency > self.best_latency * self.latency_tolerance:
+            self.on_congestion()
+            return
+        increment: float = 1.0 if self.slow_start else 1.0 / self.limit
+        self.limit = min(self.limit + increment, float(self.maximum))
+
+    def on_congestion(self):
+        """Backs off, at most once per round trip, since every request in flight at the time will report the same
+        congestion."""
+        now: float = time.monotonic()
+        if now - self._last_decrease < (self.smoothed_latency or 0.0):
+            return
+        self._last_decrease = now
+        self.slow_start = False
+        self.limit = max(self.limit * self.decrease, float(self.minimum))
+
+@dataclass
+class RetryPolicy:
+    attempts: int = RETRY_ATTEMPTS
+    base_delay: float = RETRY_BASE_DELAY
+    max_delay: float = RETRY_MAX_DELAY
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait before the given retry (counting from 1), with "full jitter": uniformly random up to an
+        exponentially growing cap, so that requests throttled together do not all come back together."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+@dataclass
+class Deadlines:
+    """Time allowed for each attempt at a task, and for the stage as a whole. The stage's allowance grows by
+    `stage_per_task` with each task drawn, so that a large batch is not held to the same deadline as a small one. None
+    means no limit."""
+    task: Optional[float] = None
+    stage: Optional[float] = STAGE_TIMEOUT
+    stage_per_task: float = STAGE_TIMEOUT_PER_TASK
+
+    def stage_deadline(self, started: float, drawn: int) -> Optional[float]:
+        if self.stage is None:
+            return None
+        return started + self.stage + self.stage_per_task * drawn
+
+@dataclass
+class TaskMetrics:
+    completed: int = 0
+    failed: int = 0
+    retries: int = 0
+    throttled: int = 0
+    timed_out: int = 0
+    bytes: int = 0
+    peak_in_flight: int = 0
+    started: Optional[float] = None
+    finished: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def requests_per_second(self) -> float:
+        return self.completed / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return ("{:,} tasks in {:.1f}s ({:.1f}/s, {:.2f} MB/s); {:,} retries, {:,} throttled, {:,} timed out, "
+                "{:,} failed; peak of {:,} in flight").format(self.completed, self.elapsed, self.requests_per_second,
+                                                              self.bytes_per_second / 1048576, self.retries,
+                                                              self.throttled, self.timed_out, self.failed,
+                                                              self.peak_in_flight)
+
+def _size_of(result: Any) -> int:
+    if isinstance(result, (bytes, bytearray)):
+        return len(result)
+    if isinstance(result, int) and not isinstance(result, bool):
+        return result
+    return 0
+
+class TaskScheduler:
+    """Runs tasks with as many in flight as the adaptive limit allows, retrying those that fail transiently or take too
+    long. Each call to run() accumulates into the same metrics, so they describe everything the scheduler has done."""
+    def __init__(self, limit: Optional[AdaptiveLimit] = None, retry: Optional[RetryPolicy] = None):
+        self.limit: AdaptiveLimit = limit or AdaptiveLimit()
+        self.retry: RetryPolicy = retry or RetryPolicy()
+        self.metrics: TaskMetrics = TaskMetrics()
+        self._sequence: Iterator[int] = itertools.count()
+
+    @classmethod
+    def fixed(cls, workers: int) -> "TaskScheduler":
+        """Scheduler for local work (translation, composition): a constant number of workers, and no retries."""
+        return cls(AdaptiveLimit.fixed(workers), RetryPolicy(attempts=1))
+
+    def _fail(self, item: Any, attempt: int, e: BaseException, retry_at: List[Tuple[float, int, Any, int]]) -> bool:
+        """Records a failure, queuing the item for another attempt if it is worth one. Returns False if it is not."""
+        if is_throttling(e):
+            self.metrics.throttled += 1
+            self.limit.on_congestion()
+        if not is_retryable(e) or attempt >= self.retry.attempts:
+            self.metrics.failed += 1
+            return False
+        self.metrics.retries += 1
+        delay: float = self.retry.delay(attempt)
+        logging.info("Retrying %s in %.2fs after %s" % (item, delay, e.__class__.__name__))
+        heapq.heappush(retry_at, (time.monotonic() + delay, next(self._sequence), item, attempt + 1))
+        return True
+
+    def _expire(self, pending: Dict[Future, Tuple[Any, int, float]], task_timeout: float, now: float,
+                retry_at: List[Tuple[float, int, Any, int]], exceptions: List[BaseException]):
+        """Abandons tasks that have outlived their deadline. Coroutines are cancelled outright; a task already running
+        on a thread cannot be, so it is left to finish in the background and its result ignored."""
+        for future, (item, attempt, submitted) in list(pending.items()):
+            # One that finished while the consumer had control is collected next time round
+            if future.done() or now - submitted < task_timeout:
+                continue
+            del pending[future]
+            future.cancel()
+            self.metrics.timed_out += 1
+            self.limit.on_congestion()
+            e: FuturesTimeoutError = FuturesTimeoutError("%s unfinished after %.0fs" % (item, now - submitted))
+            if not self._fail(item, attempt, e, retry_at):
+                exceptions.append(e)
+
+    def run(self, submit: Callable[[Any], Future], items: Iterable[Any],
+            deadlines: Optional[Deadlines] = None) -> Iterator[Tuple[Any, Any]]:
+        """Yields (item, result) for each item, in order of completion. Items are drawn from the iterable only as the
+        limit allows. If any item ultimately fails, the last such failure is raised once every other item is done.
+        Time the consumer spends on each result counts against neither the tasks' latency nor the stage's deadline.
+
+        :param submit: Starts the task for an item, returning a future for its result.
+        :param deadlines: Time allowed per task and for the whole run. If the run overruns, the tasks still
+        outstanding are cancelled and concurrent.futures.TimeoutError is raised, as by as_completed.
+        """
+        deadlines = deadlines or Deadlines()
+        started: float = time.monotonic()
+        if self.metrics.started is None:
+            self.metrics.started = started
+        remaining: Iterator[Any] = iter(items)
+        exhausted: bool = False
+        drawn: int = 0
+        pending: Dict[Future, Tuple[Any, int, float]] = {}
+        retry_at: List[Tuple[float, int, Any, int]] = []
+        exceptions: List[BaseException] = []
+        finished_at: Dict[Future, float] = {}
+        paused: float = 0.0
+
+        def stamp(future: Future):
+            finished_at[future] = time.monotonic()
+
+        try:
+            while True:
+                now: float = time.monotonic()
+                while len(pending) < self.limit.current:
+                    if retry_at and retry_at[0][0] <= now:
+                        _, _, item, attempt = heapq.heappop(retry_at)
+                    elif not exhausted:
+                        item, attempt = next(remaining, _EXHAUSTED), 1
+                        if item is _EXHAUSTED:
+                            exhausted = True
+                            continue
+                        drawn += 1
+                    else:
+                        break
+                    future: Future = submit(item)
+                    pending[future] = (item, attempt, time.monotonic())
+                    future.add_done_callback(stamp)
+                self.metrics.peak_in_flight = max(self.metrics.peak_in_flight, len(pending))
+                if not pending and not retry_at and exhausted:
+                    break
+
+                stage_deadline: Optional[float] = deadlines.stage_deadline(started + paused, drawn)
+                if stage_deadline is not None and now >= stage_deadline:
+                    raise FuturesTimeoutError("Stage unfinished after %.0fs, with %i of %i tasks outstanding"
+                                              % (now - started - paused, len(pending) + len(retry_at), drawn))
+
+                # Wake for whichever comes first: a completion, a retry falling due, or a deadline
+                wakes: List[float] = [retry_at[0][0]] if retry_at else []
+                if stage_deadline is not None:
+                    wakes.append(stage_deadline)
+                if deadlines.task is not None and pending:
+                    wakes.append(min(submitted for _, _, submitted in pending.values()) + deadlines.task)
+                wait_for: Optional[float] = max(min(wakes) - now, 0) if wakes else None
+                if not pending:
+                    time.sleep(wait_for)
+                    continue
+                done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item, attempt, submitted = pending.pop(future)
+                    # Stamped when it finished, which may have been while the consumer had control
+                    finished: float = finished_at.pop(future, time.monotonic())
+                    e: Optional[BaseException] = future.exception()
+                    if e is None:
+                        self.limit.on_success(finished - submitted)
+                        self.metrics.completed += 1
+                        self.metrics.bytes += _size_of(future.result())
+                        yielded: float = time.monotonic()
+                        yield item, future.result()
+                        paused += time.monotonic() - yielded
+                    elif not self._fail(item, attempt, e, retry_at):
+                        exceptions.append(e)
+                if deadlines.task is not None:
+                    self._expire(pending, deadlines.task, time.monotonic(), retry_at, exceptions)
+        finally:
+            for future in pending:
+                future.cancel()
+            self.metrics.finished = time.monotonic()
+        if exceptions:
+            raise exceptions.pop()
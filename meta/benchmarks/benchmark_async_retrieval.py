@@ -0,0 +1,39 @@
+"""Times fetching many small objects with MAX_WORKERS threads against fetching them on an AsyncBucket's event loop,
+from a local S3 stand-in that adds a fixed latency to every request.
+
+Usage: python meta/benchmarks/benchmark_async_retrieval.py [number of objects] [latency in ms]"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from composer.aws.aio import AsyncBucket
+from composer.aws.local import AsyncLocalS3, LocalS3
+from composer.aws.s3 import Bucket
+from composer.conf import MAX_WORKERS
+
+n_objects: int = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+latency: float = (int(sys.argv[2]) if len(sys.argv) > 2 else 50) / 1000
+
+with tempfile.TemporaryDirectory() as root_dir:
+    keys: List[str] = ["%09i_public.xml" % i for i in range(n_objects)]
+    for key in keys:
+        with open(os.path.join(root_dir, key), "wb") as fh:
+            fh.write(os.urandom(65536))
+    print("{:,} objects, {:.0f} ms per request".format(n_objects, latency * 1000))
+
+    bucket: Bucket = Bucket(LocalS3(root_dir, latency=latency), "local")
+    start: float = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        bodies: List[bytes] = list(executor.map(lambda key: bucket.get_obj_body(key, encoding=None), keys))
+    assert len(bodies) == n_objects
+    print("{:>14}: {:.2f} s".format("%i threads" % MAX_WORKERS, time.perf_counter() - start))
+
+    async_bucket: AsyncBucket = AsyncBucket(AsyncLocalS3(root_dir, latency=latency), "local")
+    start = time.perf_counter()
+    fetched: Dict[str, bytes] = dict(async_bucket.fetch_many((key, key) for key in keys))
+    assert len(fetched) == n_objects
+    print("{:>14}: {:.2f} s".format("event loop", time.perf_counter() - start))
+    async_bucket.close()
@@ -0,0 +1,29 @@
+"""Times Bucket.get_obj_body on a large object with and without parallel ranged requests, against a local S3 stand-in
+whose streams are each throttled to a fixed bandwidth.
+
+Usage: python meta/benchmarks/benchmark_ranged_get.py [size in MB] [per-stream bandwidth in MB/s]"""
+import os
+import sys
+import tempfile
+import time
+
+from composer.aws.local import LocalS3
+from composer.aws.s3 import Bucket
+
+size: int = int(sys.argv[1]) * 1048576 if len(sys.argv) > 1 else 64 * 1048576
+bandwidth: int = int(sys.argv[2]) * 1048576 if len(sys.argv) > 2 else 32 * 1048576
+
+with tempfile.TemporaryDirectory() as root_dir:
+    with open(os.path.join(root_dir, "index_2019.json"), "wb") as fh:
+        fh.write(os.urandom(size))
+    s3: LocalS3 = LocalS3(root_dir, bandwidth)
+
+    print("{:,} MB object, {:,} MB/s per stream".format(size // 1048576, bandwidth // 1048576))
+    for label, bucket in [("single stream", Bucket(s3, "local", ranged_threshold=size + 1)),
+                          ("ranged", Bucket(s3, "local"))]:
+        s3.requests.clear()
+        start: float = time.perf_counter()
+        body: bytes = bucket.get_obj_body("index_2019.json", encoding=None)
+        elapsed: float = time.perf_counter() - start
+        assert len(body) == size
+        print("{:>14}: {:.2f} s ({:,} requests)".format(label, elapsed, len(s3.requests)))
@@ -0,0 +1,33 @@
+"""Times each JsonTranslator engine over the e-file XML fixtures, after checking that they all agree.
+
+Usage: python meta/benchmarks/benchmark_translators.py [repetitions]"""
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+from composer.efile.xmlio import JsonTranslator, TRANSLATORS
+
+BASEPATH: str = os.path.dirname(os.path.abspath(__file__))
+filings_path: str = os.path.join(BASEPATH, "..", "..", "fixtures", "efile_xml")
+repetitions: int = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+raw_xml: List[bytes] = []
+for filename in sorted(os.listdir(filings_path)):
+    with open(os.path.join(filings_path, filename), "rb") as fh:
+        raw_xml.append(fh.read())
+
+translators: Dict[str, JsonTranslator] = {engine: JsonTranslator(engine) for engine in TRANSLATORS}
+for raw in raw_xml:
+    results: List[str] = [json.dumps(translate(raw)) for translate in translators.values()]
+    assert all(result == results[0] for result in results)
+
+print("{:,} filings, {:,} repetitions".format(len(raw_xml), repetitions))
+for engine, translate in translators.items():
+    start: float = time.perf_counter()
+    for _ in range(repetitions):
+        for raw in raw_xml:
+            translate(raw)
+    elapsed: float = (time.perf_counter() - start) / (repetitions * len(raw_xml))
+    print("{:>10}: {:.2f} ms per filing".format(engine, elapsed * 1000))
@@ -17,6 +17,11 @@ setuptools.setup(
         'lxml',
         'xmljson'
     ],
+    extras_require={
+        'columnar': ['pandas'],
+        'zstd': ['zstandard'],
+        'async': ['aiobotocore']
+    },
     classifiers=[
         'Programming Language :: Python :: 3.7',
     ],
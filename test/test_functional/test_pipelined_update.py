@@ -0,0 +1,234 @@
+import json
+import os
+import shutil
+from typing import Dict, List, Optional
+
+import pytest
+
+from composer.aws.aio import AsyncBucket
+from composer.aws.efile.filings import RetrieveEfiles
+from composer.aws.efile.indices import EfileIndices
+from composer.aws.efile.xmlcache import XmlCache
+from composer.aws.local import AsyncLocalS3, LocalS3
+from composer.aws.s3 import Bucket, file_backed_bucket
+from composer.efile.compose import ComposeEfiles
+from composer.efile.composite import CompositeBackend, CompositeStore, SqliteCompositeStore
+from composer.efile.translate_pool import TranslationPool
+from composer.efile.translations import TranslationCache
+from composer.efile.update import UpdateEfileState
+from composer.efile.xmlio import JsonTranslator
+from composer.fileio.paths import EINPathManager
+
+BASEPATH: str = os.path.dirname(os.path.abspath(__file__))
+fixture_path: str = os.path.join(BASEPATH, "..", "..", "fixtures")
+
+def _update(timepoint: str, tp_path: str, temp_path: str, pipelined: bool = True, in_memory: bool = False,
+            translate_pool: Optional[TranslationPool] = None, delta_log: bool = False,
+            store: Optional[CompositeBackend] = None, compression: Optional[str] = None,
+            async_s3: bool = False, xml_cache: Optional[XmlCache] = None,
+            translation_cache: Optional[TranslationCache] = None) -> RetrieveEfiles:
+    index_path: str = os.path.join(fixture_path, "efile_indices", "%s_timepoint" % timepoint)
+    xml_path: str = os.path.join(fixture_path, "efile_xml")
+    if async_s3:
+        index_bucket: Bucket = AsyncBucket(AsyncLocalS3(index_path), "local")
+        xml_bucket: Bucket = AsyncBucket(AsyncLocalS3(xml_path), "local", max_in_flight=3)
+    elif xml_cache is not None or translation_cache is not None:
+        index_bucket, xml_bucket = file_backed_bucket(index_path), Bucket(LocalS3(xml_path), "local")
+    else:
+        index_bucket, xml_bucket = file_backed_bucket(index_path), file_backed_bucket(xml_path)
+    indices: EfileIndices = EfileIndices(index_bucket, streaming=True)
+    retrieve: RetrieveEfiles = RetrieveEfiles(xml_bucket, temp_path,
+                                              in_memory=in_memory, translate_pool=translate_pool,
+                                              compression=compression, xml_cache=xml_cache,
+                                              translation_cache=translation_cache)
+    compose: ComposeEfiles = ComposeEfiles(retrieve, EINPathManager(tp_path, compression), pipelined=pipelined,
+                                           delta_log=delta_log, store=store)
+    UpdateEfileState(tp_path, indices, compose)()
+    return retrieve
+
+def _assert_composites(timepoint: str, tp_path: str, eins: List[str], store: Optional[CompositeBackend] = None):
+    store = store or CompositeStore(EINPathManager(tp_path))
+    for ein in eins:
+        expected_fp: str = os.path.join(fixture_path, "efile_composites", "%s_timepoint" % timepoint, ein[0:3],
+                                        ein[3:6], "%s.json" % ein)
+        with open(expected_fp) as e_fh:
+            expected: Dict = json.load(e_fh)
+        assert store.read(ein) == expected
+
+def test_pipelined_update(tmp_path):
+    tp1_path: str = str(tmp_path / "first_timepoint")
+    tp2_path: str = str(tmp_path / "second_timepoint")
+    temp_path: str = str(tmp_path / "temp")
+    os.makedirs(tp1_path)
+    os.makedirs(temp_path)
+
+    _update("first", tp1_path, temp_path)
+    _assert_composites("first", tp1_path, ["208419458", "260687839", "364201074", "943041314"])
+
+    shutil.copytree(tp1_path, tp2_path)
+    retrieve: RetrieveEfiles = _update("second", tp2_path, temp_path)
+    _assert_composites("second", tp2_path, ["208419458", "260687839", "364201074", "581347976", "943041314"])
+
+    # Temporary files are discarded EIN by EIN as each composite is written, not when the retriever goes away
+    assert os.path.exists(retrieve.xml_cache_dir)
+    leftovers: List[str] = [name for _, _, names in os.walk(temp_path) for name in names]
+    assert leftovers == []
+
+@pytest.mark.parametrize("pipelined", [False, True])
+def test_in_memory_update(tmp_path, pipelined):
+    tp1_path: str = str(tmp_path / "first_timepoint")
+    tp2_path: str = str(tmp_path / "second_timepoint")
+    temp_path: str = str(tmp_path / "temp")
+    os.makedirs(tp1_path)
+    os.makedirs(temp_path)
+
+    _update("first", tp1_path, temp_path, pipelined=pipelined, in_memory=True)
+    _assert_composites("first", tp1_path, ["208419458", "260687839", "364201074", "943041314"])
+
+    shutil.copytree(tp1_path, tp2_path)
+    retrieve: RetrieveEfiles = _update("second", tp2_path, temp_path, pipelined=pipelined, in_memory=True)
+    _assert_composites("second", tp2_path, ["208419458", "260687839", "364201074", "581347976", "943041314"])
+
+    # Nothing is ever written to the temporary directory
+    assert retrieve.xml_cache_dir is None
+    assert os.listdir(temp_path) == []
+
+@pytest.mark.parametrize("pipelined, in_memory", [(False, False), (True, False), (True, True)])
+def test_update_with_translation_pool(tmp_path, pipelined, in_memory):
+    tp1_path: str = str(tmp_path / "first_timepoint")
+    tp2_path: str = str(tmp_path / "second_timepoint")
+    temp_path: str = str(tmp_path / "temp")
+    os.makedirs(tp1_path)
+    os.makedirs(temp_path)
+
+    # The update shuts down its retriever's translation pool when it is done
+    _update("first", tp1_path, temp_path, pipelined, in_memory, TranslationPool(2))
+    _assert_composites("first", tp1_path, ["208419458", "260687839", "364201074", "943041314"])
+
+    shutil.copytree(tp1_path, tp2_path)
+    retrieve: RetrieveEfiles = _update("second", tp2_path, temp_path, pipelined, in_memory, TranslationPool(2))
+    _assert_composites("second", tp2_path, ["208419458", "260687839", "364201074", "581347976", "943041314"])
+    assert retrieve.translate_pool._pool is None
+
+def test_delta_log_update(tmp_path):
+    tp1_path: str = str(tmp_path / "first_timepoint")
+    tp2_path: str = str(tmp_path / "second_timepoint")
+    temp_path: str = str(tmp_path / "temp")
+    os.makedirs(tp1_path)
+    os.makedirs(temp_path)
+
+    _update("first", tp1_path, temp_path, in_memory=True, delta_log=True)
+    _assert_composites("first", tp1_path, ["208419458", "260687839", "364201074", "943041314"])
+
+    shutil.copytree(tp1_path, tp2_path)
+    _update("second", tp2_path, temp_path, in_memory=True, delta_log=True)
+    _assert_composites("second", tp2_path, ["208419458", "260687839", "364201074", "581347976", "943041314"])
+
+    # Folding the logs leaves the same composites, now held entirely in the base files
+    assert CompositeStore(EINPathManager(tp2_path)).compact_all() > 0
+    _assert_composites("second", tp2_path, ["208419458", "260687839", "364201074", "581347976", "943041314"])
+    logs: List[str] = [name for _, _, names in os.walk(tp2_path) for name in names if name.endswith(".jsonl")]
+    assert logs == []
+
+@pytest.mark.parametrize("pipelined", [False, True])
+def test_sqlite_store_update(tmp_path, pipelined):
+    tp_path: str = str(tmp_path / "timepoint")
+    temp_path: str = str(tmp_path / "temp")
+    store_path: str = os.path.join(tp_path, "composites")
+    os.makedirs(tp_path)
+    os.makedirs(temp_path)
+
+    # The update closes the store when it is done, so each run (and each check) opens its own
+    _update("first", tp_path, temp_path, pipelined, in_memory=True,
+            store=SqliteCompositeStore(store_path, shards=2, compress=True))
+    _assert_composites("first", tp_path, ["208419458", "260687839", "364201074", "943041314"],
+                       SqliteCompositeStore(store_path, shards=2))
+
+    _update("second", tp_path, temp_path, pipelined, in_memory=True,
+            store=SqliteCompositeStore(store_path, shards=2, compress=True))
+    _assert_composites("second", tp_path, ["208419458", "260687839", "364201074", "581347976", "943041314"],
+                       SqliteCompositeStore(store_path, shards=2))
+
+    # No per-EIN directories are created
+    assert sorted(os.listdir(tp_path)) == ["composites", "state.sqlite"]
+
+@pytest.mark.parametrize("in_memory", [False, True])
+def test_compressed_update(tmp_path, in_memory):
+    tp1_path: str = str(tmp_path / "first_timepoint")
+    tp2_path: str = str(tmp_path / "second_timepoint")
+    temp_path: str = str(tmp_path / "temp")
+    os.makedirs(tp1_path)
+    os.makedirs(temp_path)
+
+    _update("first", tp1_path, temp_path, in_memory=in_memory, compression="gzip")
+    _assert_composites("first", tp1_path, ["208419458", "260687839", "364201074", "943041314"])
+
+    # Uncompressed composites left from an earlier run are read, and replaced once rewritten
+    shutil.copytree(tp1_path, tp2_path)
+    CompositeStore(EINPathManager(tp2_path)).recompress("none")
+    _update("second", tp2_path, temp_path, in_memory=in_memory, compression="gzip")
+    _assert_composites("second", tp2_path, ["208419458", "260687839", "364201074", "581347976", "943041314"])
+    composites: List[str] = [name for _, _, names in os.walk(tp2_path) for name in names if ".json" in name]
+    assert "943041314.json.gz" in composites
+    assert "943041314.json" not in composites
+
+@pytest.mark.parametrize("pipelined, in_memory", [(False, False), (False, True), (True, True)])
+def test_async_update(tmp_path, pipelined, in_memory):
+    tp1_path: str = str(tmp_path / "first_timepoint")
+    tp2_path: str = str(tmp_path / "second_timepoint")
+    temp_path: str = str(tmp_path / "temp")
+    os.makedirs(tp1_path)
+    os.makedirs(temp_path)
+
+    retrieve: RetrieveEfiles = _update("first", tp1_path, temp_path, pipelined, in_memory, async_s3=True)
+    retrieve.bucket.close()
+    _assert_composites("first", tp1_path, ["208419458", "260687839", "364201074", "943041314"])
+
+    shutil.copytree(tp1_path, tp2_path)
+    retrieve = _update("second", tp2_path, temp_path, pipelined, in_memory, async_s3=True)
+    retrieve.bucket.close()
+    _assert_composites("second", tp2_path, ["208419458", "260687839", "364201074", "581347976", "943041314"])
+
+@pytest.mark.parametrize("async_s3, pipelined, in_memory", [(False, False, False), (False, True, True),
+                                                            (True, False, False), (True, False, True)])
+def test_cached_xml_not_downloaded_again(tmp_path, async_s3, pipelined, in_memory):
+    cache_path: str = str(tmp_path / "xml_cache")
+    temp_path: str = str(tmp_path / "temp")
+    os.makedirs(temp_path)
+
+    # Rebuilding from scratch (as after a translator change) reads every e-file from the cache
+    for run in ["first", "rebuilt"]:
+        tp_path: str = str(tmp_path / run)
+        os.makedirs(tp_path)
+        xml_cache: XmlCache = XmlCache(cache_path, compression="gzip")
+        retrieve: RetrieveEfiles = _update("first", tp_path, temp_path, pipelined, in_memory, async_s3=async_s3,
+                                           xml_cache=xml_cache)
+        retrieve.bucket.close()
+        _assert_composites("first", tp_path, ["208419458", "260687839", "364201074", "943041314"])
+        requests: List[Dict] = retrieve.bucket.client.requests if async_s3 else retrieve.bucket.s3.requests
+        assert (len(requests) > 0) == (run == "first")
+
+@pytest.mark.parametrize("pipelined, in_memory, pooled", [(False, False, False), (True, False, True),
+                                                          (False, True, True), (True, True, False)])
+def test_translated_efiles_not_translated_again(tmp_path, monkeypatch, pipelined, in_memory, pooled):
+    cache_path: str = str(tmp_path / "translation_cache")
+    temp_path: str = str(tmp_path / "temp")
+    os.makedirs(temp_path)
+
+    tp_path: str = str(tmp_path / "first")
+    os.makedirs(tp_path)
+    retrieve: RetrieveEfiles = _update("first", tp_path, temp_path, pipelined, in_memory,
+                                       TranslationPool(2) if pooled else None, compression="gzip",
+                                       translation_cache=TranslationCache(cache_path))
+    assert len(retrieve.bucket.s3.requests) > 0
+
+    # Rebuilding from scratch neither downloads nor translates anything
+    def translate(*args):
+        raise AssertionError("Translated again")
+    monkeypatch.setattr(JsonTranslator, "__call__", translate)
+    tp_path = str(tmp_path / "rebuilt")
+    os.makedirs(tp_path)
+    retrieve = _update("first", tp_path, temp_path, pipelined, in_memory, compression="gzip",
+                       translation_cache=TranslationCache(cache_path))
+    _assert_composites("first", tp_path, ["208419458", "260687839", "364201074", "943041314"])
+    assert retrieve.bucket.s3.requests == []
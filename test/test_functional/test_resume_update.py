@@ -0,0 +1,114 @@
+import json
+import os
+from sqlite3 import connect
+from typing import List, Set
+
+import pytest
+
+from composer.aws.efile.filings import RetrieveEfiles
+from composer.aws.efile.indices import EfileIndices
+from composer.aws.s3 import file_backed_bucket
+from composer.conf import JSON_FILENAME
+from composer.efile.compose import ComposeEfiles, ComposeEfilesUpdater
+from composer.efile.composite import CompositeStore
+from composer.efile.update import UpdateEfileState
+from composer.fileio.paths import EINPathManager
+
+BASEPATH: str = os.path.dirname(os.path.abspath(__file__))
+fixture_path: str = os.path.join(BASEPATH, "..", "..", "fixtures")
+EINS: List[str] = ["208419458", "260687839", "364201074", "943041314"]
+
+def _update(tp_path: str, temp_path: str, pipelined: bool, in_memory: bool, index_path: str, resume: bool = False):
+    indices: EfileIndices = EfileIndices(file_backed_bucket(index_path))
+    retrieve: RetrieveEfiles = RetrieveEfiles(file_backed_bucket(os.path.join(fixture_path, "efile_xml")), temp_path,
+                                              in_memory=in_memory)
+    compose: ComposeEfiles = ComposeEfiles(retrieve, EINPathManager(tp_path), pipelined=pipelined)
+    UpdateEfileState(tp_path, indices, compose, resume=resume)()
+
+def _assert_composites(timepoint: str, tp_path: str, eins: List[str]):
+    store: CompositeStore = CompositeStore(EINPathManager(tp_path))
+    for ein in eins:
+        expected_fp: str = os.path.join(fixture_path, "efile_composites", "%s_timepoint" % timepoint, ein[0:3],
+                                        ein[3:6], "%s.json" % ein)
+        with open(expected_fp) as fh:
+            assert store.read(ein) == json.load(fh)
+
+def _count(tp_path: str, table: str) -> int:
+    with connect(os.path.join(tp_path, "state.sqlite")) as conn:
+        return conn.execute("SELECT COUNT(*) FROM %s" % table).fetchone()[0]
+
+@pytest.mark.parametrize("pipelined, in_memory", [(False, False), (False, True), (True, False), (True, True)])
+def test_resume_after_failure(tmp_path, monkeypatch, pipelined, in_memory):
+    tp_path: str = str(tmp_path / "timepoint")
+    temp_path: str = str(tmp_path / "temp")
+    os.makedirs(tp_path)
+    os.makedirs(temp_path)
+    index_path: str = os.path.join(fixture_path, "efile_indices", "first_timepoint")
+
+    composed: List[str] = []
+    apply = ComposeEfilesUpdater.apply
+
+    def counting_apply(self, change):
+        composed.append(change[0])
+        apply(self, change)
+
+    def failing_apply(self, change):
+        if change[0] == "364201074":
+            raise RuntimeError("Simulated failure")
+        counting_apply(self, change)
+
+    monkeypatch.setattr(ComposeEfilesUpdater, "apply", failing_apply)
+    with pytest.raises(RuntimeError):
+        _update(tp_path, temp_path, pipelined, in_memory, index_path)
+
+    # Nothing was committed, but the plan and the progress made are in the journal
+    assert _count(tp_path, "latest_filings") == 0
+    assert _count(tp_path, "journal_filings") > 0
+    first_attempt: Set[str] = set(composed)
+    assert "364201074" not in first_attempt
+
+    # A pipeline stops at the first failure, so may not have composed anything yet; the batch modes finish the rest
+    assert pipelined or len(first_attempt) == len(EINS) - 1
+
+    # Resuming neither scans the indices again (there are none here) nor composes what was already composed
+    monkeypatch.setattr(ComposeEfilesUpdater, "apply", counting_apply)
+    composed.clear()
+    _update(tp_path, temp_path, pipelined, in_memory, str(tmp_path / "no_indices"), resume=True)
+    assert "364201074" in composed
+    assert first_attempt.isdisjoint(composed)
+
+    _assert_composites("first", tp_path, EINS)
+    assert _count(tp_path, "latest_filings") > 0
+    assert _count(tp_path, "journal_filings") == 0
+
+@pytest.mark.parametrize("pipelined", [False, True])
+def test_resume_after_interrupted_write(tmp_path, monkeypatch, pipelined):
+    tp_path: str = str(tmp_path / "timepoint")
+    temp_path: str = str(tmp_path / "temp")
+    os.makedirs(tp_path)
+    os.makedirs(temp_path)
+    _update(tp_path, temp_path, pipelined, False, os.path.join(fixture_path, "efile_indices", "first_timepoint"))
+
+    # Dies part way through replacing an existing composite, as if the process had been killed
+    write = CompositeStore.write
+
+    def torn_write(self, ein, composite):
+        if ein != "364201074":
+            return write(self, ein, composite)
+        encoded: bytes = self.serializer.dumps(composite)
+        with self.path_mgr.open_for_writing(ein, JSON_FILENAME, binary=True) as fh:
+            fh.write(encoded[:len(encoded) // 2])
+            raise RuntimeError("Simulated crash")
+
+    monkeypatch.setattr(CompositeStore, "write", torn_write)
+    with pytest.raises(RuntimeError):
+        _update(tp_path, temp_path, pipelined, False, os.path.join(fixture_path, "efile_indices", "second_timepoint"))
+
+    # The composite being written is left as it was, with nothing beside it
+    _assert_composites("first", tp_path, ["364201074"])
+    assert os.listdir(os.path.join(tp_path, "364", "201")) == ["364201074.json"]
+
+    monkeypatch.setattr(CompositeStore, "write", write)
+    _update(tp_path, temp_path, pipelined, False, str(tmp_path / "no_indices"), resume=True)
+    _assert_composites("second", tp_path, EINS + ["581347976"])
+    assert _count(tp_path, "journal_filings") == 0
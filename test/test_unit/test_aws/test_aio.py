@@ -0,0 +1,175 @@
+import asyncio
+import gzip
+import os
+import socket
+import threading
+from typing import IO, Dict, List, Set
+
+import pytest
+
+from composer.aws.aio import AsyncBucket
+from composer.aws.local import AsyncLocalS3
+from composer.fileio.compression import open_path
+from composer.scheduler import Deadlines, RetryPolicy
+
+class _CountingS3(AsyncLocalS3):
+    """Records the most requests ever in flight at once."""
+    def __init__(self, root_dir: str, latency: float):
+        super().__init__(root_dir, latency=latency)
+        self.peak: int = 0
+
+    def _admit(self, operation: str):
+        super()._admit(operation)
+        self.peak = max(self.peak, self.in_flight)
+
+class _StallingS3(AsyncLocalS3):
+    """Never answers the first request for a key."""
+    def __init__(self, root_dir: str):
+        super().__init__(root_dir)
+        self.stalled: Set[str] = set()
+
+    async def get_object(self, Bucket: str, Key: str, **kwargs) -> Dict:
+        if Key not in self.stalled:
+            self.stalled.add(Key)
+            await asyncio.sleep(3600)
+        return await super().get_object(Bucket, Key, **kwargs)
+
+async def _other_tasks() -> int:
+    await asyncio.sleep(0)
+    return len(asyncio.all_tasks() - {asyncio.current_task()})
+
+@pytest.fixture()
+def bucket_dir(tmp_path) -> str:
+    root: str = str(tmp_path / "bucket")
+    os.makedirs(root)
+    for i in range(20):
+        with open(os.path.join(root, "%i_public.xml" % i), "wb") as fh:
+            fh.write(b"<Return>%i</Return>" % i)
+    with open(os.path.join(root, "large.json"), "wb") as fh:
+        fh.write(bytes(range(256)) * 400)
+    return root
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as fh:
+        return fh.read()
+
+def test_synchronous_methods(bucket_dir):
+    bucket: AsyncBucket = AsyncBucket(AsyncLocalS3(bucket_dir), "bucket", ranged_threshold=10000, part_size=3000)
+    try:
+        assert bucket.get_obj_body("large.json", encoding=None) == _read(os.path.join(bucket_dir, "large.json"))
+        assert bucket.get_obj_body("3_public.xml") == "<Return>3</Return>"
+        assert bucket.exists("3_public.xml")
+        assert not bucket.exists("missing.xml")
+    finally:
+        bucket.close()
+
+def test_fetch_many_bounded(bucket_dir):
+    s3: _CountingS3 = _CountingS3(bucket_dir, latency=0.01)
+    bucket: AsyncBucket = AsyncBucket(s3, "bucket", max_in_flight=5)
+    try:
+        fetched: Dict[int, bytes] = dict(bucket.fetch_many((i, "%i_public.xml" % i) for i in range(20)))
+    finally:
+        bucket.close()
+    assert fetched == {i: b"<Return>%i</Return>" % i for i in range(20)}
+    assert s3.peak == 5
+
+def test_fetch_many_missing_key(bucket_dir):
+    bucket: AsyncBucket = AsyncBucket(AsyncLocalS3(bucket_dir), "bucket")
+    try:
+        with pytest.raises(FileNotFoundError):
+            list(bucket.fetch_many([(0, "0_public.xml"), (1, "missing.xml")]))
+    finally:
+        bucket.close()
+
+def test_download_many(bucket_dir, tmp_path):
+    bucket: AsyncBucket = AsyncBucket(AsyncLocalS3(bucket_dir), "bucket", max_in_flight=4)
+    targets: List = [("%i_public.xml" % i, str(tmp_path / ("%i.xml.gz" % i))) for i in range(20)]
+    try:
+        assert bucket.download_many(targets, open_path, chunk_size=4) == 20
+    finally:
+        bucket.close()
+    for i in range(20):
+        with gzip.open(str(tmp_path / ("%i.xml.gz" % i))) as fh:
+            assert fh.read() == b"<Return>%i</Return>" % i
+
+def test_download_writes_off_loop(bucket_dir, tmp_path):
+    bucket: AsyncBucket = AsyncBucket(AsyncLocalS3(bucket_dir), "bucket")
+    writers: Set[threading.Thread] = set()
+
+    class _RecordingFile:
+        def __init__(self, fh: IO):
+            self._fh: IO = fh
+
+        def write(self, data: bytes) -> int:
+            writers.add(threading.current_thread())
+            return self._fh.write(data)
+
+        def close(self):
+            writers.add(threading.current_thread())
+            self._fh.close()
+
+    try:
+        targets: List = [("%i_public.xml" % i, str(tmp_path / ("%i.xml.gz" % i))) for i in range(5)]
+        assert bucket.download_many(targets, lambda path, mode: _RecordingFile(open_path(path, mode))) == 5
+    finally:
+        bucket.close()
+    assert writers and bucket._thread not in writers
+    assert not bucket._writing
+
+def test_stalled_requests_cancelled_and_retried(bucket_dir):
+    bucket: AsyncBucket = AsyncBucket(_StallingS3(bucket_dir), "bucket")
+    bucket.scheduler.retry = RetryPolicy(base_delay=0.001)
+    try:
+        fetched: Dict[int, bytes] = dict(bucket.fetch_many(((i, "%i_public.xml" % i) for i in range(5)),
+                                                           Deadlines(task=0.05)))
+        # The stalled attempts were cancelled, not just abandoned
+        assert bucket._run(_other_tasks()) == 0
+    finally:
+        bucket.close()
+    assert fetched == {i: b"<Return>%i</Return>" % i for i in range(5)}
+    assert bucket.scheduler.metrics.timed_out == 5
+
+def test_close(bucket_dir):
+    bucket: AsyncBucket = AsyncBucket(AsyncLocalS3(bucket_dir), "bucket")
+    bucket.close()
+    bucket.close()
+    assert bucket.loop.is_closed()
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def test_aiobotocore_client(tmp_path):
+    """Runs AsyncBucket with a real aiobotocore client against moto's S3 server, if both are installed."""
+    aio_session = pytest.importorskip("aiobotocore.session")
+    moto_server = pytest.importorskip("moto.server")
+    from botocore.session import get_session
+
+    port: int = _free_port()
+    server = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=port)
+    server.start()
+    client_kwargs: Dict = dict(endpoint_url="http://127.0.0.1:%i" % port, region_name="us-east-1",
+                               aws_access_key_id="testing", aws_secret_access_key="testing")
+    try:
+        s3 = get_session().create_client("s3", **client_kwargs)
+        s3.create_bucket(Bucket="bucket")
+        for i in range(5):
+            s3.put_object(Bucket="bucket", Key="%i_public.xml" % i, Body=b"<Return>%i</Return>" % i)
+
+        bucket: AsyncBucket = AsyncBucket(aio_session.get_session().create_client("s3", **client_kwargs), "bucket")
+        try:
+            assert bucket.get_obj_body("3_public.xml") == "<Return>3</Return>"
+            fetched: Dict[int, bytes] = dict(bucket.fetch_many((i, "%i_public.xml" % i) for i in range(5)))
+            targets: List = [("%i_public.xml" % i, str(tmp_path / ("%i.xml.gz" % i))) for i in range(5)]
+            assert bucket.download_many(targets, open_path) == 5
+            with pytest.raises(FileNotFoundError):
+                list(bucket.fetch_many([(0, "missing.xml")]))
+        finally:
+            bucket.close()
+    finally:
+        server.stop()
+    assert fetched == {i: b"<Return>%i</Return>" % i for i in range(5)}
+    for i in range(5):
+        with gzip.open(str(tmp_path / ("%i.xml.gz" % i))) as fh:
+            assert fh.read() == b"<Return>%i</Return>" % i
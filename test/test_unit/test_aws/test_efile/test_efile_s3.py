@@ -1,9 +1,13 @@
+import time
+from functools import partial
 from typing import Dict
 
+from composer.aws.efile import indices as indices_module
 from composer.aws.efile.indices import EfileIndices
 from composer.aws.s3 import Bucket, List, file_backed_bucket
 import os
 from composer.efile.structures.metadata import FilingMetadata
+from composer.scheduler import Deadlines
 
 def test_read_efile_indices(fixture_path):
     index_path: str = os.path.join(fixture_path, "efile_indices", "first_timepoint")
@@ -235,3 +239,27 @@ def test_read_efile_indices(fixture_path):
     for a in actual:
         a.date_downloaded = 'the current time'
     assert expected == actual
+
+def test_streaming_matches_batch(fixture_path):
+    index_path: str = os.path.join(fixture_path, "efile_indices", "second_timepoint")
+    bucket: Bucket = file_backed_bucket(index_path)
+    batch: List = sorted(EfileIndices(bucket), key=lambda filing: filing.irs_efile_id)
+    streamed: List = sorted(EfileIndices(bucket, streaming=True), key=lambda filing: filing.irs_efile_id)
+    for a in batch + streamed:
+        a.date_downloaded = 'the current time'
+    assert len(batch) > 0
+    assert streamed == batch
+
+def test_slow_index_within_its_deadline(fixture_path, monkeypatch):
+    # Shrinks the default stage allowance well below the time allowed for a year's index
+    monkeypatch.setattr(indices_module, "Deadlines", partial(Deadlines, stage=0.05, stage_per_task=0))
+    monkeypatch.setattr(indices_module, "INDEX_DOWNLOAD_TIMEOUT", 5)
+    get_for_year = EfileIndices._get_for_year
+
+    def slow_get_for_year(self, year: int) -> List[Dict]:
+        time.sleep(0.2)
+        return get_for_year(self, year)
+
+    monkeypatch.setattr(EfileIndices, "_get_for_year", slow_get_for_year)
+    bucket: Bucket = file_backed_bucket(os.path.join(fixture_path, "efile_indices", "second_timepoint"))
+    assert len(list(EfileIndices(bucket))) > 0
@@ -0,0 +1,78 @@
+import os
+import shutil
+from typing import List
+
+import pytest
+from botocore.exceptions import ClientError
+from mock import MagicMock
+
+from composer.aws.efile.indexcache import IndexCache
+from composer.aws.efile.indices import EfileIndices
+from composer.aws.s3 import Bucket, file_backed_bucket
+
+@pytest.fixture()
+def index_dir(fixture_path, tmp_path) -> str:
+    source: str = os.path.join(fixture_path, "efile_indices", "first_timepoint")
+    target: str = str(tmp_path / "bucket")
+    shutil.copytree(source, target)
+    return target
+
+@pytest.fixture()
+def cache(tmp_path) -> IndexCache:
+    return IndexCache(str(tmp_path / "index_cache"))
+
+def test_first_refresh_downloads(index_dir, cache):
+    bucket: Bucket = file_backed_bucket(index_dir)
+    path: str = cache.refresh(bucket, "index_2011.json")
+    with open(path) as a_fh, open(os.path.join(index_dir, "index_2011.json")) as e_fh:
+        assert a_fh.read() == e_fh.read()
+    assert cache.metadata_for("index_2011.json") is not None
+
+def test_unchanged_index_not_rewritten(index_dir, cache):
+    bucket: Bucket = file_backed_bucket(index_dir)
+    path: str = cache.refresh(bucket, "index_2011.json")
+    with open(path, "a") as fh:
+        fh.write("local marker")
+    cache.refresh(bucket, "index_2011.json")
+    with open(path) as fh:
+        assert fh.read().endswith("local marker")
+
+def test_changed_index_downloaded_again(index_dir, cache):
+    bucket: Bucket = file_backed_bucket(index_dir)
+    cache.refresh(bucket, "index_2011.json")
+    shutil.copy(os.path.join(index_dir, "index_2012.json"), os.path.join(index_dir, "index_2011.json"))
+    path: str = cache.refresh(bucket, "index_2011.json")
+    with open(path) as a_fh, open(os.path.join(index_dir, "index_2012.json")) as e_fh:
+        assert a_fh.read() == e_fh.read()
+
+def test_missing_index_raises(index_dir, cache):
+    bucket: Bucket = file_backed_bucket(index_dir)
+    with pytest.raises(FileNotFoundError):
+        cache.refresh(bucket, "index_2010.json")
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_cached_indices_match_uncached(index_dir, cache, streaming):
+    bucket: Bucket = file_backed_bucket(index_dir)
+    expected: List = sorted(EfileIndices(bucket), key=lambda filing: filing.irs_efile_id)
+    for _ in range(2):
+        actual: List = sorted(EfileIndices(bucket, streaming, cache), key=lambda filing: filing.irs_efile_id)
+        for filing in expected + actual:
+            filing.date_downloaded = "the current time"
+        assert actual == expected
+
+def test_not_modified_response_returns_none(tmp_path):
+    s3: MagicMock = MagicMock()
+    s3.get_object.side_effect = ClientError({"Error": {"Code": "304"}}, "GetObject")
+    bucket: Bucket = Bucket(s3, "irs-form-990")
+    destination: str = str(tmp_path / "index_2011.json")
+    assert bucket.download_if_changed("index_2011.json", destination, '"etag"') is None
+    s3.get_object.assert_called_once_with(Bucket="irs-form-990", Key="index_2011.json", IfNoneMatch='"etag"',
+                                          Range="bytes=0-%i" % (bucket.ranged_threshold - 1))
+    assert not os.path.exists(destination)
+
+def test_no_such_key_raises_file_not_found(tmp_path):
+    s3: MagicMock = MagicMock()
+    s3.get_object.side_effect = ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+    bucket: Bucket = Bucket(s3, "irs-form-990")
+    with pytest.raises(FileNotFoundError):
+        bucket.download_if_changed("index_2010.json", str(tmp_path / "index_2010.json"))
@@ -0,0 +1,71 @@
+import json
+import os
+import shutil
+from typing import Dict, List
+
+import pytest
+
+from composer.aws.efile.indices import EfileIndices
+from composer.aws.s3 import Bucket, file_backed_bucket
+from composer.efile.structures.watermark import Watermark
+
+@pytest.fixture()
+def index_dir(fixture_path, tmp_path) -> str:
+    source: str = os.path.join(fixture_path, "efile_indices", "first_timepoint")
+    target: str = str(tmp_path / "bucket")
+    shutil.copytree(source, target)
+    return target
+
+def _ids(indices: EfileIndices) -> List[str]:
+    return sorted(filing.irs_efile_id for filing in indices)
+
+def _append_to_2014(index_dir: str, irs_efile_id: str):
+    path: str = os.path.join(index_dir, "index_2014.json")
+    with open(path) as fh:
+        content: Dict = json.load(fh)
+    extra: Dict = dict(content["Filings2014"][0])
+    extra["ObjectId"] = irs_efile_id
+    content["Filings2014"].append(extra)
+    with open(path, "w") as fh:
+        json.dump(content, fh)
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_first_scan_observes_every_year(index_dir, streaming):
+    indices: EfileIndices = EfileIndices(file_backed_bucket(index_dir), streaming)
+    list(indices)
+    assert sorted(indices.observed.keys()) == list(range(2011, 2019))
+    assert indices.observed[2011] == Watermark(2011, 4, "201120919349300412")
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_unchanged_indices_yield_nothing(index_dir, streaming):
+    bucket: Bucket = file_backed_bucket(index_dir)
+    first: EfileIndices = EfileIndices(bucket, streaming)
+    list(first)
+    second: EfileIndices = EfileIndices(bucket, streaming, watermarks=first.observed)
+    assert _ids(second) == []
+    assert second.observed == first.observed
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_appended_entries_only(index_dir, streaming):
+    bucket: Bucket = file_backed_bucket(index_dir)
+    first: EfileIndices = EfileIndices(bucket, streaming)
+    list(first)
+    _append_to_2014(index_dir, "201499999999999999")
+    second: EfileIndices = EfileIndices(bucket, streaming, watermarks=first.observed)
+    assert _ids(second) == ["201499999999999999"]
+    assert second.observed[2014].entry_count == first.observed[2014].entry_count + 1
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_mismatched_watermark_scans_full_year(index_dir, streaming):
+    bucket: Bucket = file_backed_bucket(index_dir)
+    first: EfileIndices = EfileIndices(bucket, streaming)
+    expected: List[str] = _ids(first)
+    watermarks: Dict[int, Watermark] = dict(first.observed)
+    watermarks[2014] = Watermark(2014, watermarks[2014].entry_count, "not the last ObjectId")
+    watermarks[2015] = Watermark(2015, watermarks[2015].entry_count + 5, watermarks[2015].last_irs_efile_id)
+    second: EfileIndices = EfileIndices(bucket, streaming, watermarks=watermarks)
+    actual: List[str] = _ids(second)
+    in_2014_or_2015: List[str] = [irs_efile_id for irs_efile_id in expected if irs_efile_id in actual]
+    assert actual == in_2014_or_2015
+    assert len(actual) == first.observed[2014].entry_count + first.observed[2015].entry_count
+    assert second.observed == first.observed
@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from composer.aws.efile.xmlcache import XmlCache
+
+@pytest.fixture()
+def cache(tmp_path) -> XmlCache:
+    cache: XmlCache = XmlCache(str(tmp_path / "xml_cache"), max_bytes=25)
+    yield cache
+    cache.close()
+
+def test_miss(cache):
+    assert cache.get("201900001") is None
+    assert "201900001" not in cache
+
+def test_put_and_get(cache):
+    cache.put("201900001", b"<Return>1</Return>")
+    assert "201900001" in cache
+    assert cache.get("201900001") == b"<Return>1</Return>"
+    assert cache.total_bytes == 18
+
+def test_least_recently_used_evicted(cache):
+    cache.put("201900001", b"0123456789")
+    cache.put("201900002", b"0123456789")
+    cache.get("201900001")
+    cache.put("201900003", b"0123456789")
+    assert "201900001" in cache
+    assert "201900002" not in cache
+    assert "201900003" in cache
+    assert cache.total_bytes == 20
+
+def test_replacing_entry_counts_once(cache):
+    cache.put("201900001", b"0123456789")
+    cache.put("201900001", b"01234")
+    assert cache.total_bytes == 5
+
+def test_missing_file_is_a_miss(cache):
+    cache.put("201900001", b"0123456789")
+    os.remove(os.path.join(cache.basepath, "001", "201900001_public.xml"))
+    assert cache.get("201900001") is None
+    assert "201900001" not in cache
+    assert cache.total_bytes == 0
+
+def test_copy_to_recompresses(cache, tmp_path):
+    cache.put("201900001", b"<Return>1</Return>")
+    destination: str = str(tmp_path / "201900001_public.xml.gz")
+    assert cache.copy_to("201900001", destination)
+    assert not cache.copy_to("201900002", destination)
+
+    other: XmlCache = XmlCache(str(tmp_path / "other"), compression="gzip")
+    other.put_file("201900001", destination)
+    assert other.get("201900001") == b"<Return>1</Return>"
+    other.close()
+
+def test_persists_across_runs(tmp_path):
+    basepath: str = str(tmp_path / "xml_cache")
+    first: XmlCache = XmlCache(basepath, compression="gzip")
+    first.put("201900001", b"<Return>1</Return>")
+    first.close()
+
+    second: XmlCache = XmlCache(basepath, max_bytes=1)
+    assert second.total_bytes > 0
+    assert second.get("201900001") == b"<Return>1</Return>"
+
+    # A smaller budget on reopening takes effect on the next eviction
+    second.evict()
+    assert "201900001" not in second
+    assert os.listdir(os.path.join(basepath, "001")) == []
+    second.close()
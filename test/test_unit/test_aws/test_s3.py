@@ -0,0 +1,85 @@
+import io
+import os
+from typing import Dict, List
+
+import pytest
+from botocore.exceptions import ClientError
+
+from composer.aws.local import LocalS3
+from composer.aws.s3 import Bucket, file_backed_bucket
+
+@pytest.fixture()
+def bucket_dir(tmp_path) -> str:
+    root: str = str(tmp_path / "bucket")
+    os.makedirs(root)
+    with open(os.path.join(root, "small.json"), "wb") as fh:
+        fh.write(b'{"a": "b"}')
+    with open(os.path.join(root, "large.json"), "wb") as fh:
+        fh.write(bytes(range(256)) * 400 + "é".encode("utf-8") * 100)
+    open(os.path.join(root, "empty.json"), "wb").close()
+    return root
+
+def _read(bucket_dir: str, key: str) -> bytes:
+    with open(os.path.join(bucket_dir, key), "rb") as fh:
+        return fh.read()
+
+def _ranged_bucket(s3: LocalS3) -> Bucket:
+    return Bucket(s3, "bucket", ranged_threshold=10000, part_size=3000, range_workers=3)
+
+def _ranges(s3: LocalS3) -> List[str]:
+    return [request["Range"] for request in s3.requests]
+
+def test_small_object_single_request(bucket_dir):
+    s3: LocalS3 = LocalS3(bucket_dir)
+    assert _ranged_bucket(s3).get_obj_body("small.json") == '{"a": "b"}'
+    assert _ranges(s3) == ["bytes=0-9999"]
+
+def test_large_object_in_parts(bucket_dir):
+    s3: LocalS3 = LocalS3(bucket_dir)
+    expected: bytes = _read(bucket_dir, "large.json")
+    assert _ranged_bucket(s3).get_obj_body("large.json", encoding=None) == expected
+    ranges: List[str] = _ranges(s3)
+    assert ranges[0] == "bytes=0-9999"
+    assert sorted(ranges[1:]) == sorted("bytes=%i-%i" % (start, min(start + 3000, len(expected)) - 1)
+                                        for start in range(10000, len(expected), 3000))
+
+def test_empty_object(bucket_dir):
+    assert _ranged_bucket(LocalS3(bucket_dir)).get_obj_body("empty.json") == ""
+
+def test_iter_large_object(bucket_dir):
+    expected: str = _read(bucket_dir, "large.json").decode("latin-1")
+    with open(os.path.join(bucket_dir, "large.json"), "wb") as fh:
+        fh.write(expected.encode("utf-8"))
+    chunks: List[str] = list(_ranged_bucket(LocalS3(bucket_dir)).iter_obj_body("large.json", 1000))
+    assert "".join(chunks) == expected
+
+def test_object_replaced_mid_download(bucket_dir):
+    s3: LocalS3 = LocalS3(bucket_dir)
+    bucket: Bucket = _ranged_bucket(s3)
+    _, parts = bucket._iter_body("large.json", 1000)
+    next(parts)
+    with open(os.path.join(bucket_dir, "large.json"), "ab") as fh:
+        fh.write(b"more")
+    with pytest.raises(ClientError):
+        list(parts)
+
+def test_download_if_changed_large(bucket_dir, tmp_path):
+    s3: LocalS3 = LocalS3(bucket_dir)
+    bucket: Bucket = _ranged_bucket(s3)
+    destination: str = str(tmp_path / "large.json")
+    metadata: Dict = bucket.download_if_changed("large.json", destination)
+    assert _read(str(tmp_path), "large.json") == _read(bucket_dir, "large.json")
+
+    s3.requests.clear()
+    assert bucket.download_if_changed("large.json", destination, metadata["ETag"]) is None
+    assert len(s3.requests) == 1
+
+def test_download_to_large(bucket_dir):
+    fh: io.BytesIO = io.BytesIO()
+    assert _ranged_bucket(LocalS3(bucket_dir)).download_to("large.json", fh, 1000) == len(fh.getvalue())
+    assert fh.getvalue() == _read(bucket_dir, "large.json")
+
+def test_file_backed_download_to(bucket_dir):
+    fh: io.BytesIO = io.BytesIO()
+    assert file_backed_bucket(bucket_dir).download_to("large.json", fh) == len(fh.getvalue())
+    assert fh.getvalue() == _read(bucket_dir, "large.json")
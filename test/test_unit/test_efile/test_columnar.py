@@ -0,0 +1,68 @@
+import os
+import random
+from typing import Dict, List
+
+import pytest
+
+from composer.aws.efile.indices import EfileIndices
+from composer.aws.s3 import file_backed_bucket
+from composer.efile.structures.mdindex import EfileMetadataIndex
+from composer.efile.structures.metadata import FilingMetadata
+from composer.efile.structures.sqlite import init_sqlite_db
+
+pytest.importorskip("pandas")
+from composer.efile.structures.columnar import stage_columnar
+
+def _rowwise(md_index: EfileMetadataIndex, filings: List[FilingMetadata]):
+    for filing in filings:
+        md_index.add(filing)
+
+def _assert_same_staging(filing_batches: List[List[FilingMetadata]]):
+    """Runs each batch through both engines, committing in between, and checks that they stage the same things."""
+    rowwise: EfileMetadataIndex = EfileMetadataIndex.build(init_sqlite_db(":memory:"))
+    columnar: EfileMetadataIndex = EfileMetadataIndex.build(init_sqlite_db(":memory:"))
+    for filings in filing_batches:
+        _rowwise(rowwise, filings)
+        stage_columnar(columnar, filings)
+        assert columnar.staged_dupes == rowwise.staged_dupes
+        assert columnar.staged_changes == rowwise.staged_changes
+        rowwise.commit()
+        columnar.commit()
+    assert sorted(columnar.latest_filings, key=lambda f: f.record_id) == \
+        sorted(rowwise.latest_filings, key=lambda f: f.record_id)
+    assert sorted(columnar.duplicates, key=lambda f: f.irs_efile_id) == \
+        sorted(rowwise.duplicates, key=lambda f: f.irs_efile_id)
+
+def _random_filing(rng: random.Random, irs_efile_id: str) -> FilingMetadata:
+    ein: str = rng.choice(["943041314", "208419458", "364201074"])
+    period: str = rng.choice(["201012", "201112", "201212"])
+    return FilingMetadata(
+        "%s_%s" % (ein, period), irs_efile_id, "dln", ein, period, "name", "990",
+        rng.choice(["2011-09-28", "2011-11-15", "2012-01-05"]),
+        rng.choice(["2016-03-21T17:23:53", "2016-04-29T13:40:20"]),
+        "2019-08-07 06:05:04", "https://example.com/%s" % irs_efile_id
+    )
+
+def test_fixture_indices(fixture_path):
+    batches: List[List[FilingMetadata]] = []
+    for timepoint in ["first_timepoint", "second_timepoint"]:
+        index_path: str = os.path.join(fixture_path, "efile_indices", timepoint)
+        batches.append(list(EfileIndices(file_backed_bucket(index_path))))
+    _assert_same_staging(batches)
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_collisions_and_ties(seed):
+    """Entries for the same e-file are identical wherever they appear, as they are in the IRS indices."""
+    rng: random.Random = random.Random(seed)
+    pool: Dict[str, FilingMetadata] = {str(i): _random_filing(rng, str(i)) for i in range(40)}
+    batches: List[List[FilingMetadata]] = []
+    for _ in range(3):
+        filings: List[FilingMetadata] = [pool[rng.choice(list(pool.keys()))] for _ in range(30)]
+        batches.append(filings)
+    _assert_same_staging(batches)
+
+def test_empty_input(empty_db):
+    md_index: EfileMetadataIndex = EfileMetadataIndex.build(empty_db)
+    stage_columnar(md_index, [])
+    assert list(md_index.changes) == []
+    assert md_index.staged_dupes == {}
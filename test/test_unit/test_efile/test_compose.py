@@ -0,0 +1,23 @@
+import json
+from typing import Dict
+
+import pytest
+
+from composer.conf import JSON_FILENAME
+from composer.efile.compose import ComposeEfilesUpdater
+from composer.fileio.paths import EINPathManager
+from composer.fileio.serialize import JsonSerializer, JSON_BACKENDS
+
+@pytest.mark.parametrize("backend", JSON_BACKENDS)
+@pytest.mark.parametrize("compact", [False, True])
+def test_apply_adds_and_replaces_periods(tmp_path, backend: str, compact: bool):
+    path_mgr: EINPathManager = EINPathManager(str(tmp_path))
+    updater: ComposeEfilesUpdater = ComposeEfilesUpdater(path_mgr, JsonSerializer(backend), compact)
+    updater.apply(("123456789", {"2016": {"a": "1"}, "2017": {"b": "2"}}))
+    updater.apply(("123456789", {"2017": {"b": "3"}, "2018": {"c": "4"}}))
+
+    with path_mgr.open_for_reading("123456789", JSON_FILENAME) as fh:
+        raw: str = fh.read()
+    expected: Dict = {"2016": {"a": "1"}, "2017": {"b": "3"}, "2018": {"c": "4"}}
+    assert json.loads(raw) == expected
+    assert ("\n" not in raw) == compact
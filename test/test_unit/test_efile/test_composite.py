@@ -0,0 +1,195 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import pytest
+
+from composer.conf import DELTA_FILENAME, JSON_FILENAME
+from composer.efile.compose import ComposeEfilesUpdater
+from composer.efile.composite import CompositeStore, SqliteCompositeStore
+from composer.fileio.paths import EINPathManager
+
+EIN: str = "123456789"
+
+@pytest.fixture
+def store(tmp_path) -> CompositeStore:
+    return CompositeStore(EINPathManager(str(tmp_path)))
+
+def _delta_exists(store: CompositeStore, ein: str = EIN) -> bool:
+    return store.path_mgr.exists(ein, DELTA_FILENAME)
+
+def test_read_merges_deltas_in_order(store):
+    store.write(EIN, {"2015": {"a": "1"}, "2016": {"b": "2"}})
+    store.append(EIN, {"2016": {"b": "3"}})
+    store.append(EIN, {"2016": {"b": "4"}, "2017": {"c": "5"}})
+    assert store.read(EIN) == {"2015": {"a": "1"}, "2016": {"b": "4"}, "2017": {"c": "5"}}
+
+def test_read_without_base(store):
+    store.append(EIN, {"2016": {"b": "2"}})
+    assert not store.path_mgr.exists(EIN, JSON_FILENAME)
+    assert store.read(EIN) == {"2016": {"b": "2"}}
+
+def test_read_missing(store):
+    assert store.read(EIN) == {}
+
+def test_truncated_delta_ignored(store):
+    store.append(EIN, {"2016": {"b": "2"}})
+    with store.path_mgr.open_for_writing(EIN, DELTA_FILENAME, binary=True, append=True) as fh:
+        fh.write(b'{"2017": {"c"')
+    assert store.read(EIN) == {"2016": {"b": "2"}}
+
+def test_append_after_truncated_delta(store):
+    store.append(EIN, {"2016": {"b": "2"}})
+    with store.path_mgr.open_for_writing(EIN, DELTA_FILENAME, binary=True, append=True) as fh:
+        fh.write(b'{"2017": {"c"')
+    store.append(EIN, {"2018": {"d": "4"}})
+    assert store.read(EIN) == {"2016": {"b": "2"}, "2018": {"d": "4"}}
+
+def test_unreadable_delta_skipped(store):
+    store.append(EIN, {"2016": {"b": "2"}})
+    with store.path_mgr.open_for_writing(EIN, DELTA_FILENAME, binary=True, append=True) as fh:
+        fh.write(b'{"2017": \n')
+    store.append(EIN, {"2018": {"d": "4"}})
+    assert store.read(EIN) == {"2016": {"b": "2"}, "2018": {"d": "4"}}
+
+def test_interrupted_compaction_keeps_delta(store, monkeypatch):
+    store.write(EIN, {"2015": {"a": "1"}})
+    store.append(EIN, {"2016": {"b": "2"}})
+
+    def fail(obj, indent=False):
+        raise RuntimeError("Interrupted")
+
+    monkeypatch.setattr(store.serializer, "dumps", fail)
+    with pytest.raises(RuntimeError):
+        store.compact_one(EIN)
+    monkeypatch.undo()
+    assert _delta_exists(store)
+    assert store.read(EIN) == {"2015": {"a": "1"}, "2016": {"b": "2"}}
+
+def test_delta_log_not_compressed(tmp_path):
+    store: CompositeStore = CompositeStore(EINPathManager(str(tmp_path), "gzip"))
+    store.append(EIN, {"2016": {"b": "2"}})
+    store.write("987654321", {"2016": {"b": "2"}})
+    assert store.path_mgr.locate(EIN, DELTA_FILENAME).endswith(".jsonl")
+    assert store.path_mgr.locate("987654321", JSON_FILENAME).endswith(".json.gz")
+
+def test_torn_compressed_delta_log(tmp_path):
+    # As left by an earlier version that compressed delta logs, when an append was cut off
+    legacy: EINPathManager = EINPathManager(str(tmp_path), "gzip")
+    for delta in [b'{"2016":{"b":"2"}}\n', b'{"2017":{"c":"3"}}\n']:
+        with legacy.open_for_writing(EIN, DELTA_FILENAME, binary=True, append=True) as fh:
+            fh.write(delta)
+    path: str = legacy.locate(EIN, DELTA_FILENAME)
+    with open(path, "r+b") as fh:
+        fh.truncate(os.path.getsize(path) - 10)
+
+    store: CompositeStore = CompositeStore(EINPathManager(str(tmp_path), "gzip"))
+    assert store.read(EIN) == {"2016": {"b": "2"}}
+
+    # The compressed log is folded into the base before anything more is appended
+    store.append(EIN, {"2018": {"d": "4"}})
+    assert not os.path.exists(path)
+    assert store.read(EIN) == {"2016": {"b": "2"}, "2018": {"d": "4"}}
+
+def test_compact_one(store):
+    store.write(EIN, {"2015": {"a": "1"}})
+    store.append(EIN, {"2016": {"b": "2"}})
+    store.compact_one(EIN)
+    assert not _delta_exists(store)
+    assert store._read_base(EIN) == {"2015": {"a": "1"}, "2016": {"b": "2"}}
+
+def test_write_discards_delta(store):
+    store.append(EIN, {"2016": {"b": "2"}})
+    store.write(EIN, {"2017": {"c": "3"}})
+    assert not _delta_exists(store)
+    assert store.read(EIN) == {"2017": {"c": "3"}}
+
+def test_compaction_keeps_codec(tmp_path):
+    CompositeStore(EINPathManager(str(tmp_path), "gzip")).write(EIN, {"2015": {"a": "1"}})
+
+    # As the compact command does, with no codec given
+    store: CompositeStore = CompositeStore(EINPathManager(str(tmp_path)))
+    store.append(EIN, {"2016": {"b": "2"}})
+    store.compact_all()
+    assert store.path_mgr.locate(EIN, JSON_FILENAME).endswith(".json.gz")
+    assert store.read(EIN) == {"2015": {"a": "1"}, "2016": {"b": "2"}}
+
+    # A codec of "none" is a choice, and is applied
+    CompositeStore(EINPathManager(str(tmp_path), "none")).write(EIN, {"2017": {"c": "3"}})
+    assert store.path_mgr.locate(EIN, JSON_FILENAME).endswith(".json")
+
+def test_compact_all_threshold(store):
+    store.append(EIN, {"2016": {"b": "2"}})
+    store.append("987654321", {"2016": {"b": "x" * 100}})
+    assert store.compact_all(threshold=50) == 1
+    assert _delta_exists(store)
+    assert not _delta_exists(store, "987654321")
+    assert store.compact_all() == 1
+    assert not _delta_exists(store)
+    assert store.read(EIN) == {"2016": {"b": "2"}}
+
+def test_updater_delta_log(tmp_path):
+    updater: ComposeEfilesUpdater = ComposeEfilesUpdater(EINPathManager(str(tmp_path)), delta_log=True,
+                                                         compact_threshold=60)
+    updater.apply((EIN, {"2016": {"b": "2"}}))
+    assert _delta_exists(updater.store)
+    assert not updater.store.path_mgr.exists(EIN, JSON_FILENAME)
+
+    # Passing the threshold folds the log into the composite
+    updater.apply((EIN, {"2017": {"c": "y" * 50}}))
+    assert not _delta_exists(updater.store)
+    assert updater.store.read(EIN) == {"2016": {"b": "2"}, "2017": {"c": "y" * 50}}
+
+@pytest.fixture
+def sqlite_store(tmp_path) -> SqliteCompositeStore:
+    sqlite_store: SqliteCompositeStore = SqliteCompositeStore(str(tmp_path / "composites"), shards=3)
+    yield sqlite_store
+    sqlite_store.close()
+
+def test_sqlite_read_write(sqlite_store):
+    assert sqlite_store.read(EIN) == {}
+    sqlite_store.write(EIN, {"2016": {"b": "2"}})
+    sqlite_store.write(EIN, {"2016": {"b": "3"}})
+    assert sqlite_store.read(EIN) == {"2016": {"b": "3"}}
+
+def test_sqlite_bulk(sqlite_store):
+    composites: Dict[str, Dict] = {"%09i" % i: {"2016": {"n": str(i)}} for i in range(1200)}
+    sqlite_store.write_many(composites.items())
+    assert len(os.listdir(sqlite_store.basepath)) >= 3
+    assert sorted(sqlite_store.eins()) == sorted(composites.keys())
+
+    requested: List[str] = list(composites.keys())[::2] + ["999999999"]
+    actual: Dict[str, Dict] = sqlite_store.read_many(requested)
+    assert actual == {ein: composites[ein] for ein in requested[:-1]}
+
+def test_sqlite_compression_switch(tmp_path):
+    basepath: str = str(tmp_path / "composites")
+    plain: SqliteCompositeStore = SqliteCompositeStore(basepath)
+    plain.write(EIN, {"2016": {"b": "2"}})
+    plain.close()
+
+    compressed: SqliteCompositeStore = SqliteCompositeStore(basepath, compress=True)
+    assert compressed.read(EIN) == {"2016": {"b": "2"}}
+    compressed.write("987654321", {"2017": {"c": "x" * 1000}})
+    body: bytes = compressed._conns[0].execute("SELECT body FROM composites WHERE ein = '987654321'").fetchone()[0]
+    assert len(body) < 100
+    compressed.close()
+
+    reopened: SqliteCompositeStore = SqliteCompositeStore(basepath)
+    assert reopened.read("987654321") == {"2017": {"c": "x" * 1000}}
+    reopened.close()
+
+def test_sqlite_concurrent_appends(sqlite_store):
+    def append(period: int):
+        sqlite_store.append(EIN, {str(period): {"p": str(period)}})
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(append, range(2000, 2040)))
+    assert sqlite_store.read(EIN) == {str(period): {"p": str(period)} for period in range(2000, 2040)}
+
+def test_updater_sqlite(sqlite_store, tmp_path):
+    updater: ComposeEfilesUpdater = ComposeEfilesUpdater(EINPathManager(str(tmp_path)), store=sqlite_store)
+    updater.apply((EIN, {"2016": {"b": "2"}}))
+    updater.apply((EIN, {"2017": {"c": "3"}}))
+    assert sqlite_store.read(EIN) == {"2016": {"b": "2"}, "2017": {"c": "3"}}
+    assert not os.path.exists(EINPathManager(str(tmp_path)).directory_for(EIN))
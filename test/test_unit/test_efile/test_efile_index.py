@@ -4,6 +4,7 @@ import pytest
 import sqlite3
 
 from composer.efile.structures.mdindex import EfileMetadataIndex
+from composer.efile.structures.watermark import Watermark
 
 @pytest.fixture()
 def index(empty_db: sqlite3.Connection) -> EfileMetadataIndex:
@@ -152,3 +153,69 @@ def test_commit_clears_staged_dupes(index, filing_original, filing_amended):
     index.commit()
     assert len(index.staged_dupes) == 0
 
+
+def test_commit_records_staged_watermarks(index):
+    watermark: Watermark = Watermark(2011, 3, "201121369349101317")
+    index.stage_watermarks({2011: watermark})
+    assert index.committed_watermarks() == {}
+    index.commit()
+    assert index.committed_watermarks() == {2011: watermark}
+    assert len(index.staged_watermarks) == 0
+
+def _preloaded(conn: sqlite3.Connection, latest: List = (), dupes: List = ()) -> EfileMetadataIndex:
+    setup: EfileMetadataIndex = EfileMetadataIndex.build(conn)
+    for filing in latest:
+        setup.latest_filings.upsert(filing)
+    for filing in dupes:
+        setup.duplicates.upsert(filing)
+    return EfileMetadataIndex.build(conn, preload=True)
+
+def test_preloaded_existing_latest_not_a_change(empty_db, filing_original):
+    index: EfileMetadataIndex = _preloaded(empty_db, latest=[filing_original])
+    index.add(filing_original)
+    assert len(index.staged_changes["943041314"]) == 0
+    assert len(index.staged_dupes) == 0
+
+def test_preloaded_existing_duplicate_not_a_change(empty_db, filing_original, filing_amended):
+    index: EfileMetadataIndex = _preloaded(empty_db, latest=[filing_amended], dupes=[filing_original])
+    index.add(filing_original)
+    assert len(index.staged_changes["943041314"]) == 0
+    assert len(index.staged_dupes) == 0
+
+def test_preloaded_older_filing_goes_straight_to_dupe(empty_db, filing_original, filing_amended):
+    index: EfileMetadataIndex = _preloaded(empty_db, latest=[filing_amended])
+    index.add(filing_original)
+    assert index.staged_dupes == {filing_original.irs_efile_id: filing_original}
+    assert len(index.staged_changes["943041314"]) == 0
+
+def test_preloaded_newer_filing_replaces_existing(empty_db, filing_original, filing_amended):
+    index: EfileMetadataIndex = _preloaded(empty_db, latest=[filing_original])
+    index.add(filing_amended)
+    assert index.staged_dupes == {filing_original.irs_efile_id: filing_original}
+    assert list(index.changes) == [("943041314", {"201012": filing_amended})]
+
+def test_preloaded_commit_updates_known_filings(empty_db, filing_original, filing_amended):
+    index: EfileMetadataIndex = _preloaded(empty_db)
+    index.add(filing_original)
+    index.commit()
+    index.add(filing_amended)
+    index.commit()
+    assert list(index.latest_filings) == [filing_amended]
+    assert list(index.duplicates) == [filing_original]
+    index.add(filing_original)
+    index.add(filing_amended)
+    assert len(index.staged_dupes) == 0
+    assert len(index.staged_changes["943041314"]) == 0
+
+def test_failed_commit_writes_nothing(index, filing_original, filing_amended, mocker):
+    index.add(filing_original)
+    index.commit()
+    index.add(filing_amended)
+    index.stage_watermarks({2011: Watermark(2011, 3, "201121369349101317")})
+    mocker.patch.object(index.latest_filings, "upsert_many", side_effect=sqlite3.OperationalError)
+    with pytest.raises(sqlite3.OperationalError):
+        index.commit()
+    assert list(index.duplicates) == []
+    assert list(index.latest_filings) == [filing_original]
+    assert index.committed_watermarks() == {}
+    assert index.staged_dupes == {filing_original.irs_efile_id: filing_original}
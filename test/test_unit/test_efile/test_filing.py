@@ -1,5 +1,5 @@
 import dataclasses
-from typing import Tuple
+from typing import Dict, Tuple
 
 import pytest
 
@@ -41,4 +41,25 @@ def test_as_tuple(reference: FilingMetadata, date_downloaded):
         "https://s3.amazonaws.com/irs-form-990/201120919349300412_public.xml"
     )
     actual: Tuple = dataclasses.astuple(reference)
-    assert actual == expected
\ No newline at end of file
+    assert actual == expected
+
+def test_from_json_with_download_date(reference, date_downloaded, filing_original_dict):
+    actual: FilingMetadata = FilingMetadata.from_json(filing_original_dict, date_downloaded)
+    assert actual == reference
+
+def test_no_instance_dict(reference):
+    assert not hasattr(reference, "__dict__")
+
+def _copied(filing_dict: Dict) -> Dict:
+    """Rebuilds every value so that no two dictionaries share string objects."""
+    return {key: "".join(list(value)) for key, value in filing_dict.items()}
+
+def test_repeated_values_shared(filing_original_dict, filing_amended_dict):
+    original: FilingMetadata = FilingMetadata.from_json(_copied(filing_original_dict))
+    amended: FilingMetadata = FilingMetadata.from_json(_copied(filing_amended_dict))
+    assert original.form_type is amended.form_type
+    assert original.period is amended.period
+    assert original.date_uploaded is amended.date_uploaded
+
+def test_fast_tuple_matches_astuple(reference: FilingMetadata):
+    assert reference.as_tuple() == dataclasses.astuple(reference)
@@ -0,0 +1,63 @@
+import pytest
+
+from composer.efile.structures.journal import COMPOSED, DOWNLOADED, TRANSLATED, RunJournal
+from composer.efile.structures.mdindex import EfileMetadataIndex
+from composer.efile.structures.watermark import Watermark
+
+@pytest.fixture()
+def staged(empty_db, filing_original, filing_amended) -> EfileMetadataIndex:
+    md_index: EfileMetadataIndex = EfileMetadataIndex.build(empty_db)
+    md_index.add(filing_original)
+    md_index.add(filing_amended)
+    md_index.stage_watermarks({2011: Watermark(2011, 2, "201102999349300730")})
+    return md_index
+
+def test_no_journal_not_in_progress(empty_db):
+    assert not RunJournal(empty_db).in_progress
+
+def test_restore_stages_same_changes(empty_db, staged):
+    journal: RunJournal = RunJournal(empty_db)
+    journal.begin(staged)
+    assert journal.in_progress
+
+    restored: EfileMetadataIndex = EfileMetadataIndex.build(empty_db)
+    journal.restore(restored)
+    assert list(restored.changes) == list(staged.changes)
+    assert restored.staged_dupes == staged.staged_dupes
+    assert restored.staged_watermarks == staged.staged_watermarks
+
+def test_composed_filings_not_pending(empty_db, staged, filing_amended):
+    journal: RunJournal = RunJournal(empty_db)
+    journal.begin(staged)
+    journal.mark(DOWNLOADED, "943041314", ["201012"])
+    journal.mark(COMPOSED, "943041314", ["201012"])
+    journal.mark(TRANSLATED, "943041314", ["201012"])
+    journal.flush()
+
+    # Progress only moves forward, whatever order the marks arrive in
+    resumed: RunJournal = RunJournal(empty_db)
+    restored: EfileMetadataIndex = EfileMetadataIndex.build(empty_db)
+    resumed.restore(restored)
+    assert resumed.progress()["composed"] == 1
+    assert list(resumed.pending(restored.changes)) == []
+
+    # The commit still includes the composed filing
+    assert list(restored.changes) == [("943041314", {"201012": filing_amended})]
+
+def test_marks_buffered(empty_db, staged):
+    journal: RunJournal = RunJournal(empty_db, flush_size=2)
+    journal.begin(staged)
+    journal.mark(COMPOSED, "943041314", ["201012"])
+    assert journal.progress()["composed"] == 1
+
+def test_finish_clears(empty_db, staged):
+    journal: RunJournal = RunJournal(empty_db)
+    journal.begin(staged)
+    journal.finish()
+    assert not journal.in_progress
+
+def test_begin_replaces_earlier_plan(empty_db, staged):
+    journal: RunJournal = RunJournal(empty_db)
+    journal.begin(staged)
+    journal.begin(EfileMetadataIndex.build(empty_db))
+    assert not journal.in_progress
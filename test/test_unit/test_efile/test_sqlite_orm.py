@@ -6,7 +6,7 @@ from typing import List, Set, Tuple
 import pytest
 
 from composer.efile.structures.metadata import FilingMetadata
-from composer.efile.structures.sqlite import EfileIndexTable
+from composer.efile.structures.sqlite import EfileIndexTable, configure_connection, init_sqlite_db
 
 tables: List = ["latest_filings", "duplicates"]
 
@@ -171,4 +171,26 @@ def test_iter(preloaded_orm, table, filing_original, alpha_filing_1, alpha_filin
     #orm.commit()
     expected: List = [alpha_filing_1, alpha_filing_2, filing_original]
     actual: List = sorted(orm, key=lambda f: f.record_id)
-    assert actual == expected
\ No newline at end of file
+    assert actual == expected
+
+@pytest.mark.parametrize("table", tables)
+def test_upsert_many(preloaded_orm, table, filing_original, filing_amended, alpha_filing_1, alpha_filing_2):
+    orm: EfileIndexTable = preloaded_orm(table)
+    filing_amended.record_id = "943041314_201112"
+    orm.upsert_many([filing_original, filing_amended])
+    expected: List = [alpha_filing_1, alpha_filing_2, filing_original, filing_amended]
+    actual: List = sorted(orm, key=lambda f: f.record_id)
+    assert actual == expected
+
+@pytest.mark.parametrize("table", tables)
+def test_delete_many(preloaded_orm, table):
+    orm: EfileIndexTable = preloaded_orm(table)
+    orm.delete_many(["abcdefghijklmnopqrstuvwxyz", "zyxwvutsrqponmlkjihgfedcba", "foo bar"])
+    assert list(orm) == []
+
+def test_configure_connection(tmp_path):
+    conn: Connection = configure_connection(init_sqlite_db(str(tmp_path / "state.sqlite")), "WAL", "NORMAL", -1024)
+    cursor: Cursor = conn.cursor()
+    assert cursor.execute("PRAGMA journal_mode;").fetchone() == ("wal",)
+    assert cursor.execute("PRAGMA synchronous;").fetchone() == (1,)
+    assert cursor.execute("PRAGMA cache_size;").fetchone() == (-1024,)
@@ -0,0 +1,62 @@
+import json
+import os
+from typing import Dict, List
+
+import pytest
+
+from composer.efile.translate_pool import TranslationError, TranslationPool
+from composer.efile.xmlio import JsonTranslator
+
+BASEPATH: str = os.path.dirname(os.path.abspath(__file__))
+xml_path: str = os.path.join(BASEPATH, "..", "..", "..", "fixtures", "efile_xml")
+xml_files: List[str] = sorted(os.listdir(xml_path))[:8]
+
+@pytest.fixture(scope="module")
+def pool() -> TranslationPool:
+    translate_pool: TranslationPool = TranslationPool(2, chunk_size=3)
+    yield translate_pool
+    translate_pool.close()
+
+def _read(filename: str) -> bytes:
+    with open(os.path.join(xml_path, filename), "rb") as fh:
+        return fh.read()
+
+def test_translate_many_matches_in_process(pool):
+    translate: JsonTranslator = JsonTranslator()
+    raw_xml: List[bytes] = [_read(filename) for filename in xml_files]
+    expected: List[Dict] = [translate(raw) for raw in raw_xml]
+    actual: List[Dict] = pool.translate_many(raw_xml)
+    assert actual == expected
+
+def test_translate_files(pool, tmp_path):
+    translate: JsonTranslator = JsonTranslator()
+    targets = [(os.path.join(xml_path, filename), str(tmp_path / ("%s.json" % filename))) for filename in xml_files]
+    pool.translate_files(targets)
+    for xml_fp, json_fp in targets:
+        with open(json_fp) as fh:
+            assert json.load(fh) == translate(_read(os.path.basename(xml_fp)))
+
+def test_worker_error_propagates(pool, tmp_path):
+    with pytest.raises(TranslationError, match="XMLSyntaxError"):
+        pool.translate_many([b"<not-xml"])
+
+    with open(str(tmp_path / "bad.xml"), "wb") as fh:
+        fh.write(b"<not-xml")
+    with pytest.raises(TranslationError, match="XMLSyntaxError"):
+        pool.translate_files([(str(tmp_path / "bad.xml"), str(tmp_path / "bad.json"))])
+
+def test_default_worker_count():
+    translate_pool: TranslationPool = TranslationPool()
+    try:
+        assert translate_pool.workers == os.cpu_count()
+    finally:
+        translate_pool.close()
+
+def test_workers_use_requested_engine():
+    translate: JsonTranslator = JsonTranslator()
+    raw_xml: List[bytes] = [_read(filename) for filename in xml_files]
+    translate_pool: TranslationPool = TranslationPool(2, engine="fused")
+    try:
+        assert translate_pool.translate_many(raw_xml) == [translate(raw) for raw in raw_xml]
+    finally:
+        translate_pool.close()
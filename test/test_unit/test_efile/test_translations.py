@@ -0,0 +1,46 @@
+from collections import OrderedDict
+
+import pytest
+
+from composer.efile.translations import TranslationCache
+from composer.efile.xmlio import translator_version
+
+@pytest.fixture()
+def basepath(tmp_path) -> str:
+    return str(tmp_path / "translation_cache")
+
+def test_version_is_stable():
+    assert translator_version() == translator_version()
+    assert len(translator_version()) == 16
+
+def test_put_and_get(basepath):
+    cache: TranslationCache = TranslationCache(basepath)
+    assert cache.get("201900001") is None
+    cache.put("201900001", OrderedDict([("b", 1), ("a", {"c": "x"})]))
+    assert "201900001" in cache
+    assert list(cache.get("201900001").items()) == [("b", 1), ("a", {"c": "x"})]
+    assert cache.get_serialized("201900001") == cache.serializer.dumps({"b": 1, "a": {"c": "x"}})
+    cache.close()
+
+def test_persists_across_runs(basepath):
+    first: TranslationCache = TranslationCache(basepath)
+    first.put("201900001", {"a": 1})
+    first.close()
+
+    second: TranslationCache = TranslationCache(basepath)
+    assert second.get("201900001") == {"a": 1}
+    second.close()
+
+def test_other_version_discarded(basepath):
+    old: TranslationCache = TranslationCache(basepath, version="0000000000000000")
+    old.put("201900001", {"a": 1})
+    old.close()
+
+    current: TranslationCache = TranslationCache(basepath)
+    assert "201900001" not in current
+    current.close()
+
+    # Reopening as the old version finds nothing either: the stale entry is gone, not merely hidden
+    reopened: TranslationCache = TranslationCache(basepath, version="0000000000000000")
+    assert "201900001" not in reopened
+    reopened.close()
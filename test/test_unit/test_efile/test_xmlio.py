@@ -0,0 +1,68 @@
+import json
+import os
+from typing import List
+
+import pytest
+from lxml import etree
+
+from composer.efile.xmlio import _clean_bytes, _clean_xsd, _get_cleaned_root, JsonTranslator
+
+BASEPATH: str = os.path.dirname(os.path.abspath(__file__))
+xml_path: str = os.path.join(BASEPATH, "..", "..", "..", "fixtures", "efile_xml")
+
+@pytest.mark.parametrize("filename", sorted(os.listdir(xml_path)))
+def test_clean_bytes_matches_clean_xsd(filename: str):
+    with open(os.path.join(xml_path, filename), "rb") as fh:
+        raw: bytes = fh.read()
+    expected: str = _clean_xsd(raw.decode("utf-8"))
+    assert _clean_bytes(raw).decode("ascii") == expected
+
+@pytest.mark.parametrize("raw", [
+    '﻿<?xml version="1.0" encoding="utf-8"?>\n<Return xmlns="http://www.irs.gov/efile" a="1"/>',
+    '<?xml version="1.0"?><?xml-stylesheet href="x"?>\n<a/>',
+    '<irs:Return xmlns:irs="http://www.irs.gov/efile" xsi:schemaLocation="x"><irs:Name>Café</irs:Name></irs:Return>',
+    '<xsd:schema><xsd:element name="—"/></xsd:schema>',
+    '<xsd:irs:Double/><irs:xsd:Double/></xsd:irs:Double>',
+    '<Note>xmlns="not really" and xsi:too="also"</Note>'
+])
+def test_clean_bytes_edge_cases(raw: str):
+    expected: str = _clean_xsd(raw)
+    assert _clean_bytes(raw.encode("utf-8")).decode("ascii") == expected
+    assert _clean_bytes(raw).decode("ascii") == expected
+
+def test_cleaned_root_same_for_str_and_bytes():
+    filename: str = sorted(os.listdir(xml_path))[0]
+    with open(os.path.join(xml_path, filename), "rb") as fh:
+        raw: bytes = fh.read()
+    from_bytes = _get_cleaned_root(raw)
+    from_str = _get_cleaned_root(raw.decode("utf-8"))
+    assert etree.tostring(from_bytes) == etree.tostring(from_str)
+    assert from_bytes.tag == "Return"
+
+@pytest.fixture(scope="module")
+def translators() -> List[JsonTranslator]:
+    return [JsonTranslator("xmljson"), JsonTranslator("fused"), JsonTranslator("iterparse")]
+
+@pytest.mark.parametrize("filename", sorted(os.listdir(xml_path)))
+def test_translators_agree(translators, filename: str):
+    with open(os.path.join(xml_path, filename), "rb") as fh:
+        raw: bytes = fh.read()
+    expected, *others = [json.dumps(translate(raw)) for translate in translators]
+
+    # Key order is compared too, since it carries through to the composites
+    assert others == [expected] * len(others)
+
+@pytest.mark.parametrize("raw", [
+    '<Return a="1" b="2"><Empty/><Text>x</Text><Both c="3">y</Both><Kept><Inner>z</Inner></Kept></Return>',
+    '<Return><A x="1">text<B>b</B></A><C/></Return>',
+    '<Return><R i="1">one</R><Other>o</Other><R i="2"><S>two</S></R><R/></Return>',
+    '<Return>  <!-- comment --><A>a</A>tail<?pi x?><B>  </B></Return>',
+    '<Return>root text<A>a</A></Return>'
+])
+def test_translators_agree_on_edge_cases(translators, raw: str):
+    expected, *others = [json.dumps(translate(raw)) for translate in translators]
+    assert others == [expected] * len(others)
+
+def test_unknown_translator():
+    with pytest.raises(ValueError):
+        JsonTranslator("nonesuch")
@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+from composer.fileio.compression import (COMPRESSIONS, compressed_path, compression_of, existing_variant, open_path,
+                                         strip_suffix)
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_round_trip(tmp_path, compression: str):
+    path: str = compressed_path(str(tmp_path / "a.json"), compression)
+    with open_path(path, "w") as fh:
+        fh.write('{"a": "b"}\n')
+    with open_path(path, "ab") as fh:
+        fh.write(b'{"c": "d"}\n')
+    with open_path(path, "rb") as fh:
+        assert fh.read() == b'{"a": "b"}\n{"c": "d"}\n'
+    with open_path(path) as fh:
+        assert fh.read() == '{"a": "b"}\n{"c": "d"}\n'
+    assert compression_of(path) == compression
+    assert strip_suffix(path) == str(tmp_path / "a.json")
+
+def test_compressed_is_smaller(tmp_path):
+    content: bytes = b'{"period": "2016", "value": "1"}\n' * 1000
+    for compression in COMPRESSIONS:
+        with open_path(compressed_path(str(tmp_path / "a.json"), compression), "wb") as fh:
+            fh.write(content)
+    sizes = {c: os.path.getsize(compressed_path(str(tmp_path / "a.json"), c)) for c in COMPRESSIONS}
+    assert all(sizes[c] * 10 < sizes["none"] for c in COMPRESSIONS if c != "none")
+
+def test_existing_variant(tmp_path):
+    path: str = str(tmp_path / "a.json")
+    assert existing_variant(path) is None
+    with open_path(path + ".gz", "wb") as fh:
+        fh.write(b"{}")
+    assert existing_variant(path) == path + ".gz"
+    with open(path, "wb") as fh:
+        fh.write(b"{}")
+    assert existing_variant(path) == path
+    assert existing_variant(path, "gzip") == path + ".gz"
+
+def test_unknown_compression():
+    with pytest.raises(ValueError):
+        compressed_path("a.json", "nonesuch")
@@ -0,0 +1,46 @@
+import json
+from typing import Dict, List
+
+import pytest
+
+from composer.fileio.jsonstream import iter_array_items
+
+def _chunked(text: str, size: int) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+@pytest.fixture()
+def document() -> Dict:
+    return {
+        "Filings2011": [
+            {"EIN": "364201074", "TaxPeriod": "201012", "OrganizationName": "CENTURY WALK CORPORATION"},
+            {"EIN": "208419458", "TaxPeriod": "201012", "OrganizationName": "GROSSHUTTON \"FAMILY\" FOUNDATION"},
+            {"EIN": "943041314", "TaxPeriod": "201112", "OrganizationName": "LAW ENFORCEMENT É TRUST"}
+        ]
+    }
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 64, 100000])
+def test_items_match_json_load(document, chunk_size):
+    text: str = json.dumps(document, indent=2)
+    actual: List = list(iter_array_items(_chunked(text, chunk_size), "Filings2011"))
+    assert actual == document["Filings2011"]
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 100])
+def test_scalar_elements_split_across_chunks(chunk_size):
+    text: str = '{"Filings2011": [12345, 678.5e2, true, null, "abc"]}'
+    actual: List = list(iter_array_items(_chunked(text, chunk_size), "Filings2011"))
+    assert actual == [12345, 678.5e2, True, None, "abc"]
+
+def test_empty_array():
+    assert list(iter_array_items(['{"Filings2011"', ': [ ]}'], "Filings2011")) == []
+
+def test_unexpected_key_raises():
+    with pytest.raises(AssertionError):
+        list(iter_array_items(['{"Filings2012": []}'], "Filings2011"))
+
+def test_second_key_raises():
+    with pytest.raises(AssertionError):
+        list(iter_array_items(['{"Filings2011": [], "Other": 1}'], "Filings2011"))
+
+def test_truncated_document_raises():
+    with pytest.raises(ValueError):
+        list(iter_array_items(['{"Filings2011": [{"EIN": "36420'], "Filings2011"))
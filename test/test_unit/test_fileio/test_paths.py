@@ -0,0 +1,94 @@
+import os
+from typing import List, Tuple
+
+import pytest
+
+from composer.fileio.paths import EINPathManager
+
+EIN: str = "123456789"
+
+def test_uncompressed_layout(tmp_path):
+    path_mgr: EINPathManager = EINPathManager(str(tmp_path))
+    with path_mgr.open_for_writing(EIN, "{}.json") as fh:
+        fh.write("{}")
+    assert (tmp_path / "123" / "456" / "123456789.json").exists()
+
+def test_compressed_read_transparently(tmp_path):
+    with EINPathManager(str(tmp_path), "gzip").open_for_writing(EIN, "{}.json") as fh:
+        fh.write('{"a": "b"}')
+    assert (tmp_path / "123" / "456" / "123456789.json.gz").exists()
+
+    # A manager without compression (or with another codec) still finds and decompresses the file
+    for compression in [None, "lzma"]:
+        path_mgr: EINPathManager = EINPathManager(str(tmp_path), compression)
+        assert path_mgr.exists(EIN, "{}.json")
+        with path_mgr.open_for_reading(EIN, "{}.json") as fh:
+            assert fh.read() == '{"a": "b"}'
+
+def test_rewrite_replaces_other_codec(tmp_path):
+    with EINPathManager(str(tmp_path), "gzip").open_for_writing(EIN, "{}.json") as fh:
+        fh.write("old")
+    path_mgr: EINPathManager = EINPathManager(str(tmp_path))
+    with path_mgr.open_for_writing(EIN, "{}.json") as fh:
+        fh.write("new")
+    assert not (tmp_path / "123" / "456" / "123456789.json.gz").exists()
+    with EINPathManager(str(tmp_path), "gzip").open_for_reading(EIN, "{}.json") as fh:
+        assert fh.read() == "new"
+
+def test_append_keeps_existing_codec(tmp_path):
+    with EINPathManager(str(tmp_path)).open_for_writing(EIN, "{}.log", append=True) as fh:
+        fh.write("a\n")
+    with EINPathManager(str(tmp_path), "gzip").open_for_writing(EIN, "{}.log", append=True) as fh:
+        fh.write("b\n")
+    with EINPathManager(str(tmp_path)).open_for_reading(EIN, "{}.log") as fh:
+        assert fh.read() == "a\nb\n"
+
+def test_missing(tmp_path):
+    path_mgr: EINPathManager = EINPathManager(str(tmp_path), "gzip")
+    assert not path_mgr.exists(EIN, "{}.json")
+    assert path_mgr.size(EIN, "{}.json") == 0
+    with pytest.raises(FileNotFoundError):
+        path_mgr.open_for_reading(EIN, "{}.json")
+
+def test_files_and_recompress(tmp_path):
+    path_mgr: EINPathManager = EINPathManager(str(tmp_path))
+    for ein, compression in [(EIN, None), ("987654321", "lzma"), ("111111111", "gzip")]:
+        with EINPathManager(str(tmp_path), compression).open_for_writing(ein, "{}.json") as fh:
+            fh.write(ein)
+    with open(str(tmp_path / "index_2011.json"), "w") as fh:
+        fh.write("not a composite")
+
+    found: List[Tuple[str, str]] = sorted(path_mgr.files("{}.json"))
+    assert [ein for ein, _ in found] == ["111111111", "123456789", "987654321"]
+
+    assert path_mgr.recompress("{}.json", "gzip") == 2
+    assert all(path.endswith(".json.gz") for _, path in path_mgr.files("{}.json"))
+    for ein, _ in found:
+        with path_mgr.open_for_reading(ein, "{}.json") as fh:
+            assert fh.read() == ein
+    assert (tmp_path / "index_2011.json").exists()
+
+def test_failed_rewrite_keeps_original(tmp_path):
+    with EINPathManager(str(tmp_path), "gzip").open_for_writing(EIN, "{}.json") as fh:
+        fh.write("old")
+    path_mgr: EINPathManager = EINPathManager(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        with path_mgr.open_for_writing(EIN, "{}.json") as fh:
+            fh.write("ne")
+            raise RuntimeError("Interrupted")
+
+    # Neither the original nor anything else in the directory is disturbed
+    assert os.listdir(str(tmp_path / "123" / "456")) == ["123456789.json.gz"]
+    with path_mgr.open_for_reading(EIN, "{}.json") as fh:
+        assert fh.read() == "old"
+
+def test_rewrite_not_visible_until_closed(tmp_path):
+    path_mgr: EINPathManager = EINPathManager(str(tmp_path))
+    with path_mgr.open_for_writing(EIN, "{}.json") as fh:
+        fh.write("old")
+    with path_mgr.open_for_writing(EIN, "{}.json") as fh:
+        fh.write("new")
+        with path_mgr.open_for_reading(EIN, "{}.json") as reader:
+            assert reader.read() == "old"
+    with path_mgr.open_for_reading(EIN, "{}.json") as fh:
+        assert fh.read() == "new"
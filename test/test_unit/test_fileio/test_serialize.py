@@ -0,0 +1,38 @@
+import json
+import os
+from typing import Dict
+
+import pytest
+
+from composer.fileio.serialize import JsonSerializer, JSON_BACKENDS
+
+BASEPATH: str = os.path.dirname(os.path.abspath(__file__))
+composite_path: str = os.path.join(BASEPATH, "..", "..", "..", "fixtures", "efile_composites", "second_timepoint",
+                                   "943", "041", "943041314.json")
+
+@pytest.fixture(scope="module")
+def composite() -> Dict:
+    with open(composite_path) as fh:
+        return json.load(fh)
+
+@pytest.mark.parametrize("backend", JSON_BACKENDS)
+def test_round_trip(composite, backend: str):
+    serializer: JsonSerializer = JsonSerializer(backend)
+    assert serializer.loads(serializer.dumps(composite)) == composite
+    assert serializer.loads(serializer.dumps(composite).decode("utf-8")) == composite
+
+@pytest.mark.parametrize("backend", JSON_BACKENDS)
+def test_indented_matches_stdlib(composite, backend: str):
+    actual: bytes = JsonSerializer(backend).dumps(composite, indent=True)
+    assert actual.decode("utf-8") == json.dumps(composite, indent=2)
+
+@pytest.mark.parametrize("backend", JSON_BACKENDS)
+def test_compact_is_smaller(composite, backend: str):
+    serializer: JsonSerializer = JsonSerializer(backend)
+    compact: bytes = serializer.dumps(composite)
+    assert b"\n" not in compact
+    assert len(compact) < len(serializer.dumps(composite, indent=True))
+
+def test_unavailable_backend():
+    with pytest.raises(ValueError):
+        JsonSerializer("nonesuch")
@@ -0,0 +1,55 @@
+import threading
+import time
+from typing import List
+
+import pytest
+
+from composer.pipeline import Stage, run_pipeline
+
+class MyCustomException(Exception):
+    pass
+
+def test_every_item_passes_through_every_stage():
+    results: List[int] = []
+    lock: threading.Lock = threading.Lock()
+
+    def collect(x: int):
+        with lock:
+            results.append(x)
+
+    stages: List[Stage] = [Stage("double", lambda x: x * 2, 3), Stage("increment", lambda x: x + 1, 2),
+                           Stage("collect", collect, 4)]
+    run_pipeline(range(100), stages, 5)
+    assert sorted(results) == [x * 2 + 1 for x in range(100)]
+
+def test_items_in_flight_bounded():
+    in_flight: List[int] = [0, 0]
+    lock: threading.Lock = threading.Lock()
+
+    def start(x: int) -> int:
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+        return x
+
+    def finish(x: int):
+        time.sleep(0.001)
+        with lock:
+            in_flight[0] -= 1
+
+    run_pipeline(range(200), [Stage("start", start, 2), Stage("finish", finish, 1)], 3)
+    # Queue of 3 between the stages, plus at most one item held by each worker
+    assert in_flight[1] <= 3 + 2 + 1
+
+def test_failure_raised_after_drain():
+    seen: List[int] = []
+
+    def fail_on_five(x: int) -> int:
+        if x == 5:
+            raise MyCustomException
+        return x
+
+    with pytest.raises(MyCustomException):
+        run_pipeline(range(1000), [Stage("fail", fail_on_five, 1), Stage("collect", seen.append, 1)], 2)
+    assert 5 not in seen
+    assert len(seen) < 1000
@@ -0,0 +1,158 @@
+import os
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from typing import Callable, Dict, List, Tuple
+
+import pytest
+from botocore.exceptions import ClientError
+
+from composer.aws.aio import AsyncBucket
+from composer.aws.local import AsyncLocalS3
+from composer.scheduler import AdaptiveLimit, Deadlines, TaskScheduler, RetryPolicy, is_retryable
+
+def _error(code: str) -> ClientError:
+    return ClientError({"Error": {"Code": code}}, "GetObject")
+
+def _scheduler(**kwargs) -> TaskScheduler:
+    return TaskScheduler(AdaptiveLimit(**kwargs), RetryPolicy(attempts=3, base_delay=0.001, max_delay=0.01))
+
+def _flaky(failures: Dict[int, List[BaseException]]) -> Callable[[int], int]:
+    """Raises the listed exceptions for an item, one per call, before returning the item."""
+    def fn(item: int) -> int:
+        if failures.get(item):
+            raise failures[item].pop(0)
+        return item
+    return fn
+
+def _run(scheduler: TaskScheduler, fn: Callable[[int], int], items: List[int], **kwargs) -> List[Tuple[int, int]]:
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        submit: Callable[[int], Future] = lambda item: executor.submit(fn, item)
+        return list(scheduler.run(submit, items, **kwargs))
+
+def test_slow_start_then_additive_increase():
+    limit: AdaptiveLimit = AdaptiveLimit(initial=2, maximum=100)
+    for _ in range(4):
+        limit.on_success(0.1)
+    assert limit.current == 6
+
+    limit.on_congestion()
+    assert limit.current == 3
+    for _ in range(3):
+        limit.on_success(0.1)
+    assert limit.current == 3
+    assert limit.limit > 3.9
+
+def test_backs_off_once_per_round_trip():
+    limit: AdaptiveLimit = AdaptiveLimit(initial=16, minimum=2)
+    limit.on_success(10)
+    limit.on_congestion()
+    limit.on_congestion()
+    assert limit.current == 8
+
+def test_limit_floor():
+    limit: AdaptiveLimit = AdaptiveLimit(initial=2, minimum=2)
+    limit.on_congestion()
+    assert limit.current == 2
+
+def test_rising_latency_backs_off():
+    limit: AdaptiveLimit = AdaptiveLimit(initial=8)
+    for _ in range(8):
+        limit.on_success(0.01)
+    peak: int = limit.current
+    for _ in range(20):
+        limit.on_success(1)
+    assert limit.current < peak
+
+def test_retry_delay_bounds():
+    policy: RetryPolicy = RetryPolicy(base_delay=1, max_delay=5)
+    assert all(0 <= policy.delay(1) <= 1 for _ in range(100))
+    assert all(0 <= policy.delay(10) <= 5 for _ in range(100))
+
+def test_retryable():
+    assert is_retryable(_error("SlowDown"))
+    assert is_retryable(_error("InternalError"))
+    assert not is_retryable(_error("AccessDenied"))
+    assert not is_retryable(FileNotFoundError("key"))
+
+def test_throttled_items_retried():
+    scheduler: TaskScheduler = _scheduler(initial=4)
+    fn: Callable = _flaky({1: [_error("SlowDown"), _error("SlowDown")], 2: [_error("InternalError")]})
+    assert sorted(_run(scheduler, fn, list(range(10)))) == [(i, i) for i in range(10)]
+    assert (scheduler.metrics.completed, scheduler.metrics.retries) == (10, 3)
+    assert (scheduler.metrics.throttled, scheduler.metrics.failed) == (2, 0)
+    assert not scheduler.limit.slow_start
+
+def test_exhausted_retries_raise_after_others():
+    scheduler: TaskScheduler = _scheduler()
+    fn: Callable = _flaky({3: [_error("SlowDown")] * 3})
+    results: List[Tuple[int, int]] = []
+    with pytest.raises(ClientError):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for result in scheduler.run(lambda item: executor.submit(fn, item), range(10)):
+                results.append(result)
+    assert len(results) == 9
+    assert scheduler.metrics.failed == 1
+
+def test_permanent_failure_not_retried():
+    scheduler: TaskScheduler = _scheduler()
+    with pytest.raises(FileNotFoundError):
+        _run(scheduler, _flaky({0: [FileNotFoundError("key")]}), [0, 1])
+    assert scheduler.metrics.retries == 0
+
+def test_straggler_retried():
+    scheduler: TaskScheduler = _scheduler()
+    attempts: Counter = Counter()
+
+    def fn(item: int) -> int:
+        attempts[item] += 1
+        if item == 0 and attempts[item] == 1:
+            time.sleep(0.5)
+        return item
+
+    results: List[Tuple[int, int]] = _run(scheduler, fn, list(range(6)), deadlines=Deadlines(task=0.05, stage=None))
+    assert sorted(results) == [(i, i) for i in range(6)]
+    assert (scheduler.metrics.timed_out, scheduler.metrics.retries) == (1, 1)
+    assert attempts[0] == 2
+
+def test_local_work_not_retried():
+    with pytest.raises(TimeoutError):
+        _run(TaskScheduler.fixed(2), lambda item: time.sleep(0.2), [0, 1], deadlines=Deadlines(task=0.05))
+
+def test_stage_deadline_scales_with_tasks():
+    deadlines: Deadlines = Deadlines(stage=0, stage_per_task=0.05)
+    results: List[Tuple[int, None]] = _run(TaskScheduler.fixed(4), lambda item: time.sleep(0.01), list(range(20)),
+                                           deadlines=deadlines)
+    assert len(results) == 20
+
+def test_stage_deadline():
+    with pytest.raises(TimeoutError):
+        _run(_scheduler(), lambda item: time.sleep(0.5), [0], deadlines=Deadlines(stage=0.05, stage_per_task=0))
+
+def test_slow_consumer():
+    scheduler: TaskScheduler = _scheduler(initial=2, maximum=4)
+    deadlines: Deadlines = Deadlines(task=0.1, stage=0.1, stage_per_task=0)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for _ in scheduler.run(lambda item: executor.submit(time.sleep, 0.001), range(12), deadlines):
+            time.sleep(0.02)
+
+    # The time spent consuming results is not taken for congestion, nor for an overrunning stage
+    assert scheduler.limit.slow_start
+    assert scheduler.limit.current == 4
+    assert scheduler.metrics.timed_out == 0
+
+def test_throttling_bucket_converges(tmp_path):
+    root: str = str(tmp_path)
+    for i in range(200):
+        with open(os.path.join(root, "%i.xml" % i), "wb") as fh:
+            fh.write(b"<Return/>")
+    s3: AsyncLocalS3 = AsyncLocalS3(root, latency=0.005, capacity=8)
+    bucket: AsyncBucket = AsyncBucket(s3, "bucket", max_in_flight=64)
+    bucket.scheduler.retry = RetryPolicy(attempts=20, base_delay=0.005, max_delay=0.05)
+    try:
+        fetched: Counter = Counter(tag for tag, _ in bucket.fetch_many((i, "%i.xml" % i) for i in range(200)))
+    finally:
+        bucket.close()
+    assert fetched == Counter(range(200))
+    assert bucket.scheduler.metrics.throttled > 0
+    assert bucket.scheduler.metrics.failed == 0